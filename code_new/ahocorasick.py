@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 from tokenization import Tokenizer, BrainDeadTokenizer
-from utilities import apply
+from utilities import apply, deep_sizeof
 from typing import Optional, TypeVar, Callable, Any
 
 TrieType = TypeVar('Trie', bound='Trie')
@@ -65,6 +65,22 @@ class Trie:
         """
         return "" in self._children
 
+    def stats(self) -> dict:
+        """
+        Reports the number of nodes in the trie, how many strings it contains, how deep it is, and
+        roughly how many bytes it occupies in memory. The terminal nodes that mark the ends of the
+        strings are counted as nodes.
+        """
+        nodes, strings, depth = 0, 0, 0
+        stack = [(self, 0)]
+        while stack:
+            (trie, level) = stack.pop()
+            nodes += 1
+            strings += trie.is_final()
+            depth = max(depth, level)
+            stack.extend((child, level + 1) for (c, child) in trie._children.items() if c)
+        return {"nodes": nodes + strings, "strings": strings, "depth": depth, "bytes": deep_sizeof(self)}
+
 
 class StringFinder:
     """
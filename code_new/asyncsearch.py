@@ -0,0 +1,195 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import copy
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from timeit import default_timer as timer
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+
+# The searcher and the extra arguments that a worker process evaluates queries against. Installed once
+# per worker process, so that we don't have to ship the whole index along with every query.
+_installed = None
+
+
+def _install(searcher: Any, arguments: Tuple) -> None:
+    global _installed
+    _installed = (searcher, arguments)
+
+
+def _evaluate_installed(query: str, options: dict) -> List[dict]:
+    (searcher, arguments) = _installed
+    return _evaluate(searcher, arguments, query, options)
+
+
+def _evaluate(searcher: Any, arguments: Tuple, query: str, options: dict) -> List[dict]:
+    matches = []
+    searcher.evaluate(query, options, *arguments, matches.append)
+    return matches
+
+
+class AsyncSearcher:
+    """
+    An asyncio-friendly front for a searcher that has a blocking, callback-style evaluate method, e.g.,
+    a SimpleSearchEngine or a SuffixArray. The searcher's evaluate method is invoked as
+
+        searcher.evaluate(query, options, *arguments, callback)
+
+    where the extra arguments (e.g., a ranker) are fixed when the AsyncSearcher is created.
+
+    Queries are evaluated on an executor, so that the event loop stays responsive. The executor is either
+    a pool of threads or a pool of processes. With a pool of threads, all threads share the searcher and
+    hence its caches, e.g., the result cache of a SimpleSearchEngine and the posting list cache of a
+    CachedInvertedIndex. These caches lock themselves, and the searcher must not be modified while queries
+    are being evaluated. Each thread gets its own shallow copies of the extra arguments, since rankers keep
+    state while scoring a document. Copies of a ranker have the same fingerprint, so the threads share
+    cached results. With a pool of processes, the searcher and the extra arguments are shipped to each
+    worker process once, and queries are evaluated in parallel. An existing executor can also be supplied,
+    in which case the searcher and the extra arguments are shipped along with every query if the executor
+    runs queries in other processes.
+
+    At most a given number of queries are evaluated concurrently, and the remaining queries wait their turn.
+    How long queries wait is measured, as is how long they take to evaluate once they get their turn.
+    """
+
+    def __init__(self, searcher: Any, *arguments: Any, executor: Any = "thread", workers: int = 4,
+                 max_concurrency: Optional[int] = None, timeout: Optional[float] = None):
+        assert workers > 0
+        self._searcher = searcher
+        self._arguments = arguments
+        self._owns_executor = isinstance(executor, str)
+        self._installed = executor == "process"
+        if executor == "thread":
+            self._executor = ThreadPoolExecutor(workers)
+        elif executor == "process":
+            self._executor = ProcessPoolExecutor(workers, initializer=_install, initargs=(searcher, arguments))
+        elif isinstance(executor, Executor):
+            self._executor = executor
+        else:
+            raise ValueError(f"Unknown executor: {executor!r}")
+        self._local = threading.local()
+        self._max_concurrency = max_concurrency or workers
+        self._semaphore = None
+        self._timeout = timeout
+        self._statistics = {"submitted": 0, "started": 0, "completed": 0, "cancelled": 0, "timed_out": 0, "failed": 0,
+                            "waiting": 0, "running": 0, "max_waiting": 0, "max_running": 0,
+                            "queueing_time": 0.0, "max_queueing_time": 0.0, "service_time": 0.0}
+
+    async def __aenter__(self) -> "AsyncSearcher":
+        return self
+
+    async def __aexit__(self, *exception: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Shuts down the executor, if we created it. Queries that haven't started yet are cancelled.
+        """
+        if self._owns_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _evaluate_locally(self, query: str, options: dict) -> List[dict]:
+        # Runs on one of our threads. Rankers are stateful, so each thread gets its own copies.
+        arguments = getattr(self._local, "arguments", None)
+        if arguments is None:
+            arguments = self._local.arguments = tuple(copy.copy(argument) for argument in self._arguments)
+        return _evaluate(self._searcher, arguments, query, options)
+
+    async def search(self, query: str, options: dict, timeout: Optional[float] = None) -> List[dict]:
+        """
+        Evaluates the given query, and returns the matches that the searcher would have emitted via its
+        callback. Raises asyncio.TimeoutError if the query takes longer than the given timeout, or the
+        default timeout, to complete. The timeout includes the time spent waiting for a turn.
+
+        If the calling task is cancelled or the query times out, a query that is still waiting for its turn
+        is never evaluated. A query that is already being evaluated runs to completion in the background,
+        since the searcher can't be interrupted, and its matches are discarded. It keeps its turn until then,
+        so that no more queries than allowed are ever evaluated at once, and it's still reported as running.
+        """
+        timeout = self._timeout if timeout is None else timeout
+        self._statistics["submitted"] += 1
+        try:
+            return await asyncio.wait_for(self._search(query, options), timeout)
+        except asyncio.TimeoutError:
+            self._statistics["timed_out"] += 1
+            raise
+        except asyncio.CancelledError:
+            self._statistics["cancelled"] += 1
+            raise
+        except Exception:
+            self._statistics["failed"] += 1
+            raise
+
+    async def _search(self, query: str, options: dict) -> List[dict]:
+        # The semaphore must be created within the event loop that uses it.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        statistics = self._statistics
+        start = timer()
+        statistics["waiting"] += 1
+        statistics["max_waiting"] = max(statistics["max_waiting"], statistics["waiting"])
+        try:
+            await self._semaphore.acquire()
+        finally:
+            statistics["waiting"] -= 1
+        queued = timer() - start
+        statistics["started"] += 1
+        statistics["queueing_time"] += queued
+        statistics["max_queueing_time"] = max(statistics["max_queueing_time"], queued)
+        statistics["running"] += 1
+        statistics["max_running"] = max(statistics["max_running"], statistics["running"])
+
+        # The query holds on to its turn until the executor is done with it. If we're cancelled or time out
+        # while the query is being evaluated, the evaluation carries on regardless, so we can't give up the
+        # turn until it completes.
+        loop = asyncio.get_running_loop()
+        try:
+            if self._installed:
+                future = self._executor.submit(_evaluate_installed, query, options)
+            elif self._owns_executor:
+                future = self._executor.submit(self._evaluate_locally, query, options)
+            else:
+                future = self._executor.submit(_evaluate, self._searcher, self._arguments, query, options)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release_from(loop))
+        matches = await asyncio.wrap_future(future, loop=loop)
+        statistics["completed"] += 1
+        statistics["service_time"] += timer() - start - queued
+        return matches
+
+    def _release(self) -> None:
+        # Gives up a query's turn. Runs on the event loop.
+        self._statistics["running"] -= 1
+        self._semaphore.release()
+
+    def _release_from(self, loop: asyncio.AbstractEventLoop) -> None:
+        # Gives up a query's turn once the executor is done with it, from whichever thread that happens on.
+        # If the event loop has been closed in the meantime, there are no more turns to hand out.
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            pass
+
+    async def evaluate(self, query: str, options: dict, timeout: Optional[float] = None) -> AsyncIterator[dict]:
+        """
+        Evaluates the given query, as for search, and asynchronously iterates over the matches. The query
+        is submitted when the iteration starts.
+        """
+        for match in await self.search(query, options, timeout):
+            yield match
+
+    def stats(self) -> dict:
+        """
+        Reports how many queries have been submitted and how they fared, how many queries are waiting for
+        their turn and are being evaluated right now, and the peaks of these. Reports how many seconds
+        queries have spent waiting for their turn and being evaluated, on average.
+        """
+        statistics = dict(self._statistics)
+        statistics["max_concurrency"] = self._max_concurrency
+        statistics["average_queueing_time"] = statistics["queueing_time"] / max(1, statistics["started"])
+        statistics["average_service_time"] = statistics["service_time"] / max(1, statistics["completed"])
+        return statistics
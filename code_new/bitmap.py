@@ -0,0 +1,181 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import bisect
+import itertools
+from array import array
+from utilities import deep_sizeof
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+Container = Union[array, bytes]
+
+
+# For each possible byte value, the positions of the bits that are set.
+_BIT_POSITIONS = [tuple(bit for bit in range(8) if byte & (1 << bit)) for byte in range(256)]
+
+
+class RoaringBitmap:
+    """
+    A compressed set of non-negative integers, laid out as a "roaring bitmap". The integers are
+    partitioned into chunks of 65536 according to their high bits, and each chunk is stored in a
+    container that suits its density: Sparse chunks are stored as sorted arrays of 16-bit integers,
+    and dense chunks are stored as bitsets of 8 KiB.
+
+    Set operations are done chunk by chunk. Operations between two bitsets boil down to bitwise
+    operations on (big) integers, and the cardinality of an intersection can be computed without
+    materializing the intersection.
+
+    Typically used for keeping track of the documents that contain some very common term.
+    """
+
+    # A chunk covers this many integers, and a bitset for a chunk thus occupies this many bytes.
+    _chunk_size = 1 << 16
+    _bitset_bytes = _chunk_size >> 3
+
+    # A bitset occupies as many bytes as an array of 16-bit integers having this many members.
+    _array_limit = 4096
+
+    def __init__(self, members: Iterable[int] = ()):
+        self._containers = {}
+        for (key, lows) in itertools.groupby(sorted(set(members)), key=lambda member: member >> 16):
+            self._containers[key] = self._from_array(array("H", (low & 0xFFFF for low in lows)))
+        self._count = sum(self._cardinality(c) for c in self._containers.values())
+
+    @classmethod
+    def _from_containers(cls, containers: Dict[int, Container]) -> "RoaringBitmap":
+        bitmap = cls()
+        bitmap._containers = containers
+        bitmap._count = sum(cls._cardinality(c) for c in containers.values())
+        return bitmap
+
+    def __contains__(self, member: int) -> bool:
+        container = self._containers.get(member >> 16, None)
+        if container is None:
+            return False
+        low = member & 0xFFFF
+        if isinstance(container, bytes):
+            return bool(container[low >> 3] & (1 << (low & 7)))
+        position = bisect.bisect_left(container, low)
+        return position < len(container) and container[position] == low
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[int]:
+        for key in sorted(self._containers):
+            base = key << 16
+            container = self._containers[key]
+            if isinstance(container, bytes):
+                for (byte, bits) in enumerate(container):
+                    if bits:
+                        for bit in _BIT_POSITIONS[bits]:
+                            yield base | (byte << 3) | bit
+            else:
+                for low in container:
+                    yield base | low
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __and__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        keys = self._containers.keys() & other._containers.keys()
+        return self._combine(other, keys, lambda x, y: x & y, True)
+
+    def __or__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        keys = self._containers.keys() | other._containers.keys()
+        return self._combine(other, keys, lambda x, y: x | y)
+
+    def __sub__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        keys = self._containers.keys()
+        return self._combine(other, keys, lambda x, y: x & ~y)
+
+    def intersection_count(self, other: "RoaringBitmap") -> int:
+        """
+        Returns the cardinality of the intersection of the two bitmaps, without materializing the intersection.
+        """
+        count = 0
+        for key in self._containers.keys() & other._containers.keys():
+            (container1, container2) = (self._containers[key], other._containers[key])
+            if isinstance(container1, bytes) and isinstance(container2, bytes):
+                count += (int.from_bytes(container1, "little") & int.from_bytes(container2, "little")).bit_count()
+            elif isinstance(container1, bytes):
+                count += len(self._intersect_array(container2, container1))
+            else:
+                count += len(self._intersect_array(container1, container2))
+        return count
+
+    def get_containers(self) -> Iterator[Tuple[int, Container]]:
+        """
+        Returns (key, container) pairs ordered by key, where the container holds the low 16 bits of the
+        integers having the given high bits. A container is either a sorted array of 16-bit integers or
+        a bitset of 8 KiB, where bit i of byte j represents the integer 8 * j + i. Allows for bulk
+        conversions to other representations.
+        """
+        return ((key, self._containers[key]) for key in sorted(self._containers))
+
+    def stats(self) -> dict:
+        """
+        Reports how many integers the bitmap contains, how many containers of each kind it has, and
+        roughly how many bytes it occupies in memory.
+        """
+        bitsets = sum(1 for container in self._containers.values() if isinstance(container, bytes))
+        return {"members": self._count,
+                "array_containers": len(self._containers) - bitsets,
+                "bitset_containers": bitsets,
+                "bytes": deep_sizeof(self._containers)}
+
+    def _combine(self, other: "RoaringBitmap", keys: Iterable[int], operation: Callable[[int, int], int],
+                 intersection: bool = False) -> "RoaringBitmap":
+        # Intersecting an array with anything can be done by probing the other container, and the
+        # result is then an array. In all other cases we resort to bitwise operations.
+        containers = {}
+        for key in keys:
+            (container1, container2) = (self._containers.get(key, None), other._containers.get(key, None))
+            if intersection and not isinstance(container1, bytes):
+                container = self._from_array(self._intersect_array(container1, container2))
+            elif intersection and not isinstance(container2, bytes):
+                container = self._from_array(self._intersect_array(container2, container1))
+            else:
+                container = self._from_bits(operation(self._to_bits(container1), self._to_bits(container2)))
+            if container is not None:
+                containers[key] = container
+        return self._from_containers(containers)
+
+    @staticmethod
+    def _intersect_array(container1: array, container2: Container) -> array:
+        if isinstance(container2, bytes):
+            return array("H", (low for low in container1 if container2[low >> 3] & (1 << (low & 7))))
+        return array("H", sorted(set(container1).intersection(container2)))
+
+    @staticmethod
+    def _cardinality(container: Container) -> int:
+        return int.from_bytes(container, "little").bit_count() if isinstance(container, bytes) else len(container)
+
+    @classmethod
+    def _from_array(cls, lows: array) -> Optional[Container]:
+        if not lows:
+            return None
+        return lows if len(lows) <= cls._array_limit else cls._array_to_bitset(lows)
+
+    @classmethod
+    def _to_bits(cls, container: Optional[Container]) -> int:
+        if container is None:
+            return 0
+        return int.from_bytes(container if isinstance(container, bytes) else cls._array_to_bitset(container), "little")
+
+    @classmethod
+    def _array_to_bitset(cls, lows: array) -> bytes:
+        bits = bytearray(cls._bitset_bytes)
+        for low in lows:
+            bits[low >> 3] |= 1 << (low & 7)
+        return bytes(bits)
+
+    @classmethod
+    def _from_bits(cls, bits: int) -> Optional[Container]:
+        count = bits.bit_count()
+        if count == 0:
+            return None
+        container = bits.to_bytes(cls._bitset_bytes, "little")
+        if count > cls._array_limit:
+            return container
+        return array("H", ((byte << 3) | bit for (byte, b) in enumerate(container) if b for bit in _BIT_POSITIONS[b]))
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from array import array
+from bitmap import RoaringBitmap
+from invertedindex import Posting, PostingList, PostingCursor, InvertedIndex
+from utilities import BitSet, TinyLFUCache, deep_sizeof
+from typing import Iterator, Optional, Sequence, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ranking import Ranker
+
+
+class CachedInvertedIndex(InvertedIndex):
+    """
+    A caching layer in front of an existing inverted index. If the underlying index has to do real
+    work to produce a posting list, e.g., load it from disk and decompress it, we don't want to redo
+    that work every time a popular term shows up in a query. So decoded posting lists are kept around,
+    laid out as parallel arrays, within a budget of bytes.
+
+    Which posting lists to keep is decided by how frequently their terms have been looked up recently,
+    so that a burst of queries with rare terms doesn't flush out the long posting lists of the common
+    terms. The cache is cleared whenever the underlying index changes. The cache can be shared between
+    threads, e.g., by the threads of an AsyncSearcher.
+
+    Lookups that don't concern the postings are delegated to the underlying inverted index.
+    """
+
+    def __init__(self, inverted_index: InvertedIndex, budget: int = 64 << 20, block_size: int = 64):
+        self._inverted_index = inverted_index
+        self._cache = TinyLFUCache(budget)
+        self._block_size = block_size
+        self._version = inverted_index.get_version()
+
+    def _get_posting_list(self, term: str) -> PostingList:
+        """
+        Returns the decoded posting list for the given term, from the cache if possible. Deleted
+        documents have already been left out.
+        """
+        if self._version != self._inverted_index.get_version():
+            self._cache.clear()
+            self._version = self._inverted_index.get_version()
+        posting_list = self._cache.get(term)
+        if posting_list is None:
+            (document_ids, term_frequencies) = (array("l"), array("l"))
+            for posting in self._inverted_index.get_postings_iterator(term):
+                document_ids.append(posting.document_id)
+                term_frequencies.append(posting.term_frequency)
+            posting_list = PostingList.from_arrays(document_ids, term_frequencies, self._block_size)
+            self._cache.put(term, posting_list, deep_sizeof(posting_list))
+        return posting_list
+
+    def supports(self, capability: str) -> bool:
+        return self._inverted_index.supports(capability)
+
+    def get_terms(self, buffer: str) -> Iterator[str]:
+        return self._inverted_index.get_terms(buffer)
+
+    def get_postings_iterator(self, term: str) -> Iterator[Posting]:
+        return iter(self._get_posting_list(term))
+
+    def get_postings_cursor(self, term: str, multiplicity: int = 1, ranker: Optional["Ranker"] = None) -> PostingCursor:
+        return PostingCursor(self._get_posting_list(term), BitSet(), term, multiplicity, ranker, self.get_version())
+
+    def get_document_ids(self, term: str) -> Union[RoaringBitmap, Sequence[int]]:
+        return self._get_posting_list(term).document_ids
+
+    def get_document_frequency(self, term: str) -> int:
+        return self._inverted_index.get_document_frequency(term)
+
+    def get_vocabulary(self) -> Iterator[str]:
+        return self._inverted_index.get_vocabulary()
+
+    def get_document_length(self, document_id: int, field: Optional[str] = None) -> int:
+        return self._inverted_index.get_document_length(document_id, field)
+
+    def get_average_document_length(self, field: Optional[str] = None) -> float:
+        return self._inverted_index.get_average_document_length(field)
+
+    def get_document_norm(self, document_id: int) -> float:
+        return self._inverted_index.get_document_norm(document_id)
+
+    def delete_document(self, document_id: int) -> None:
+        self._inverted_index.delete_document(document_id)
+
+    def is_deleted(self, document_id: int) -> bool:
+        return self._inverted_index.is_deleted(document_id)
+
+    def get_version(self) -> int:
+        return self._inverted_index.get_version()
+
+    def stats(self) -> dict:
+        """
+        Reports how well the cache is doing, i.e., its hit rate and how many bytes it occupies.
+        """
+        return self._cache.stats()
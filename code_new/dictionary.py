@@ -3,6 +3,7 @@
 
 from abc import abstractmethod
 import collections.abc
+from utilities import deep_sizeof
 from typing import Optional
 
 
@@ -79,3 +80,9 @@ class InMemoryDictionary(Dictionary):
 
     def get_term_id(self, term: str) -> Optional[int]:
         return self._terms.get(term, None)
+
+    def stats(self) -> dict:
+        """
+        Reports the size of the dictionary, and roughly how many bytes it occupies in memory.
+        """
+        return {"terms": self.size(), "bytes": deep_sizeof(self._terms)}
@@ -0,0 +1,114 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class DocumentTermMatrix:
+    """
+    A sparse document-term matrix, i.e., the contents of an inverted index laid out as NumPy arrays.
+    Facilitates bulk analytics and vectorized scoring over the whole document collection.
+
+    The matrix is kept in compressed sparse column (CSC) form, with one column per term: The document
+    identifiers and term frequencies of the term with identifier i are found in indices[indptr[i]:indptr[i + 1]]
+    and data[indptr[i]:indptr[i + 1]], respectively, sorted by document identifiers. This is exactly the
+    layout of the posting lists, concatenated. The compressed sparse row (CSR) form, with one row per
+    document, can be produced on demand.
+
+    The per-field document lengths are kept alongside the matrix, so that an inverted index can be fully
+    restored from it. So are the collection statistics that ranking depends on, i.e., the number of documents
+    and the document frequencies. These are those of the index the matrix was exported from, and might not
+    be what the matrix itself suggests: The index might count deleted documents that the matrix leaves out.
+    If no statistics are supplied, they are derived from the matrix. The identifiers of the deleted documents
+    are kept, too.
+    """
+
+    def __init__(self, terms: List[str], indptr: np.ndarray, indices: np.ndarray, data: np.ndarray,
+                 document_lengths: Dict[str, np.ndarray], document_count: Optional[int] = None,
+                 document_frequencies: Optional[np.ndarray] = None, deleted: Optional[np.ndarray] = None):
+        assert len(indptr) == len(terms) + 1
+        assert len(indices) == len(data) == indptr[-1]
+        self.terms = terms
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.document_lengths = document_lengths
+        self.shape = (max([len(lengths) for lengths in document_lengths.values()] +
+                          [int(indices.max()) + 1 if len(indices) else 0]), len(terms))
+        self.document_count = self.shape[0] if document_count is None else document_count
+        self.document_frequencies = np.diff(indptr) if document_frequencies is None else document_frequencies
+        assert len(self.document_frequencies) == len(terms)
+        self.deleted = np.empty(0, dtype="l") if deleted is None else deleted
+        self._term_ids = {term: term_id for (term_id, term) in enumerate(terms)}
+
+    def __repr__(self):
+        return str({"shape": self.shape, "nonzeros": len(self.data)})
+
+    def get_term_id(self, term: str) -> Optional[int]:
+        """
+        Returns the column of the matrix that the given term is associated with, or None if the term
+        is not present in the matrix.
+        """
+        return self._term_ids.get(term, None)
+
+    def get_document_frequencies(self) -> np.ndarray:
+        """
+        Returns the document frequencies of all terms, ordered by term identifiers. These are the ones used
+        for ranking, and not necessarily the number of nonzeros in each column.
+        """
+        return self.document_frequencies
+
+    def to_csr(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the (indptr, indices, data) arrays of the matrix in CSR form. The term identifiers of
+        the document with identifier j are found in indices[indptr[j]:indptr[j + 1]], sorted.
+        """
+        term_ids = np.repeat(np.arange(self.shape[1], dtype=self.indices.dtype), np.diff(self.indptr))
+        order = np.argsort(self.indices, kind="stable")
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(self.indices, minlength=self.shape[0]))))
+        return indptr, term_ids[order], self.data[order]
+
+    @classmethod
+    def from_csr(cls, terms: List[str], indptr: np.ndarray, indices: np.ndarray, data: np.ndarray,
+                 document_lengths: Dict[str, np.ndarray], document_count: Optional[int] = None,
+                 document_frequencies: Optional[np.ndarray] = None,
+                 deleted: Optional[np.ndarray] = None) -> "DocumentTermMatrix":
+        """
+        Creates a matrix from arrays in CSR form, as produced by to_csr. The collection statistics and the
+        deleted documents are as for the constructor.
+        """
+        document_ids = np.repeat(np.arange(len(indptr) - 1, dtype=indices.dtype), np.diff(indptr))
+        order = np.argsort(indices, kind="stable")
+        csc_indptr = np.concatenate(([0], np.cumsum(np.bincount(indices, minlength=len(terms)))))
+        return cls(terms, csc_indptr, document_ids[order], data[order], document_lengths,
+                   document_count, document_frequencies, deleted)
+
+    def score(self, query_terms: Iterable[Tuple[str, int]], static_scores: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Does term-at-a-time TF-IDF scoring of all documents for the given (term, multiplicity) pairs, in a
+        handful of vectorized operations. The weighting is the same as for the BetterRanker, given that the
+        collection statistics were carried over from the index, and static document scores can optionally
+        be added. Returns a dense array of scores, indexed by document
+        identifiers. Documents that contain none of the terms get a score of zero, plus any static score.
+        """
+        columns = [(self.indptr[i], self.indptr[i + 1], multiplicity, self.document_frequencies[i])
+                   for (i, multiplicity) in ((self.get_term_id(t), m) for (t, m) in query_terms) if i is not None]
+        indices = np.concatenate([self.indices[a:b] for (a, b, _, _) in columns] + [np.empty(0, dtype="l")])
+        weights = np.concatenate([np.log10(m * (1.0 + self.data[a:b])) * np.log10(self.document_count / max(1, df))
+                                  for (a, b, m, df) in columns] + [np.empty(0)])
+        scores = np.bincount(indices, weights=weights, minlength=self.shape[0])
+        return scores if static_scores is None else scores + static_scores
+
+    @staticmethod
+    def top(scores: np.ndarray, k: int) -> List[Tuple[float, int]]:
+        """
+        Selects the k highest-scoring documents from a dense array of scores, using a partial sort.
+        Returns (score, document identifier) pairs sorted by descending score. Documents that have a
+        score of zero are left out.
+        """
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(float(scores[i]), int(i)) for i in candidates]
@@ -0,0 +1,234 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import bisect
+from array import array
+from collections import Counter
+from invertedindex import InvertedIndex
+from tokenization import ShingleGenerator
+from typing import List, Tuple
+
+
+def edit_distance(string1: str, string2: str, bound: int) -> int:
+    """
+    Computes the Levenshtein distance between the two given strings, i.e., the smallest number of single-character
+    insertions, deletions and substitutions that turns one string into the other. We only care about distances up
+    to the given bound: If the distance exceeds the bound then bound + 1 is returned, and we can then stop early.
+    Only the diagonal band of the dynamic programming matrix that is within the bound is computed.
+    """
+    infinity = bound + 1
+    if abs(len(string1) - len(string2)) > bound:
+        return infinity
+    previous = [j if j <= bound else infinity for j in range(len(string2) + 1)]
+    for i in range(1, len(string1) + 1):
+        current = [infinity] * (len(string2) + 1)
+        if i <= bound:
+            current[0] = i
+        character = string1[i - 1]
+        for j in range(max(1, i - bound), min(len(string2), i + bound) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (character != string2[j - 1]))
+        if min(current) > bound:
+            return infinity
+        previous = current
+    return min(previous[-1], infinity)
+
+
+class FuzzyTermMatcher:
+    """
+    Finds the indexed terms that are similar to a given term, e.g., so that misspelled query terms can be replaced
+    by the terms the user probably meant. Two terms are similar if their edit distance is small.
+
+    Comparing a term against every term in the vocabulary is prohibitively expensive for large vocabularies, so
+    we keep an inverted index of the character n-grams ("shingles") of the vocabulary terms and only compare
+    against the terms that have enough n-grams in common with the given term. Each term is padded at both ends
+    before being shingled, so that the beginning and end of a term give rise to n-grams of their own.
+
+    Short terms have too few n-grams for this to rule anything out. For these we also keep a deletion
+    neighbourhood of the short vocabulary terms: Two terms are within edit distance k iff deleting at most k
+    characters from each can make them equal, so we index all the strings we get by deleting up to a couple
+    of characters from each short term, and look up the strings we get likewise from the given term.
+
+    The indexes are built from the vocabulary of the inverted index when the matcher is created, and are only
+    rebuilt when refresh is called. Until then, terms added to the inverted index since aren't found, and
+    terms deleted since might still be. Requires that the inverted index can enumerate its vocabulary.
+    """
+
+    # Pads terms at both ends. Assumed not to occur in any term.
+    _padding = "\0"
+
+    # How many characters we delete from the short terms, at most. The neighbourhoods grow quickly with this.
+    _max_deletions = 2
+
+    def __init__(self, inverted_index: InvertedIndex, width: int = 3):
+        assert width > 0
+        assert inverted_index.supports("get_vocabulary"), "The inverted index can't enumerate its vocabulary."
+        self._inverted_index = inverted_index
+        self._width = width
+        self._generator = ShingleGenerator(width)
+
+        # A term with at most this many characters can have as few n-grams as it takes edits to destroy them
+        # all, given the largest number of deletions. So can some longer terms, but only if they repeat a lot.
+        self._short_length = (self._max_deletions - 1) * width + 1
+        self.refresh()
+
+    def refresh(self) -> None:
+        """
+        Rebuilds the indexes from the current vocabulary of the inverted index, e.g., after adding documents
+        to it. Takes time linear in the size of the vocabulary, so call this after a batch of changes rather
+        than after every change.
+        """
+        self._version = self._inverted_index.get_version()
+        self._build_ngram_index()
+        self._build_deletion_index()
+
+    def _build_ngram_index(self) -> None:
+        """
+        Builds the inverted index of n-grams. Terms are identified by their position in the vocabulary, and the
+        vocabulary is sorted by term length. The terms that have a given range of lengths thus have identifiers
+        in a contiguous range, and so do the matching postings in each of the sorted n-gram posting lists.
+        """
+        self._terms = sorted(self._inverted_index.get_vocabulary(), key=lambda t: (len(t), t))
+        self._offsets = array("l", [0])
+        self._ngram_counts = array("l")
+        self._posting_lists = {}
+        for (term_id, term) in enumerate(self._terms):
+            while len(self._offsets) <= len(term):
+                self._offsets.append(term_id)
+            ngrams = self._get_ngrams(term)
+            self._ngram_counts.append(len(ngrams))
+            for ngram in ngrams:
+                posting_list = self._posting_lists.get(ngram, None)
+                if posting_list is None:
+                    posting_list = self._posting_lists[ngram] = array("l")
+                posting_list.append(term_id)
+        self._offsets.append(len(self._terms))
+
+    def _build_deletion_index(self) -> None:
+        """
+        Builds the inverted index of the deletion neighbourhoods of the vocabulary terms that are short enough to
+        be within the largest number of edits of a short term. Like the n-gram posting lists, these are sorted.
+        """
+        self._deletions = {}
+        (first, last) = self._get_term_ids(0, self._short_length + self._max_deletions)
+        for term_id in range(first, last):
+            for variant in self._get_deletions(self._terms[term_id], self._max_deletions):
+                posting_list = self._deletions.get(variant, None)
+                if posting_list is None:
+                    posting_list = self._deletions[variant] = array("l")
+                posting_list.append(term_id)
+
+    @staticmethod
+    def _get_deletions(term: str, deletions: int) -> set:
+        """
+        Returns the strings that we get by deleting up to the given number of characters from the given term.
+        """
+        variants = frontier = {term}
+        for _ in range(deletions):
+            frontier = {variant[:i] + variant[i + 1:] for variant in frontier for i in range(len(variant))}
+            variants = variants | frontier
+        return variants
+
+    def _get_ngrams(self, term: str) -> set:
+        padding = self._padding * (self._width - 1)
+        return set(self._generator.strings(padding + term + padding))
+
+    def _get_term_ids(self, shortest: int, longest: int) -> Tuple[int, int]:
+        """
+        Returns the half-open range of identifiers of the terms whose lengths are within the given bounds.
+        """
+        clamp = lambda length: self._offsets[max(0, min(length, len(self._offsets) - 1))]
+        return clamp(shortest), clamp(longest + 1)
+
+    def stats(self) -> dict:
+        """
+        Reports how many terms and distinct n-grams there are in the n-gram index, and how many postings. Also
+        reports the same for the deletion neighbourhoods, and whether the inverted index has changed since the
+        indexes were built.
+        """
+        return {"terms": len(self._terms),
+                "ngrams": len(self._posting_lists),
+                "postings": sum(len(p) for p in self._posting_lists.values()),
+                "variants": len(self._deletions),
+                "variant_postings": sum(len(p) for p in self._deletions.values()),
+                "stale": self._version != self._inverted_index.get_version()}
+
+    def candidates(self, term: str, max_distance: int = 2) -> List[Tuple[str, int]]:
+        """
+        Returns the indexed terms that are within the given edit distance from the given term, as (term, distance)
+        pairs. The most similar terms come first, and terms at the same distance are ordered by descending
+        document frequency. If the given term is indexed, it is included at distance zero.
+        """
+        assert max_distance >= 0
+        ngrams = self._get_ngrams(term)
+        (first, last) = self._get_term_ids(len(term) - max_distance, len(term) + max_distance)
+
+        # An edit touches at most width n-grams, so a term within the edit distance shares all but at most that
+        # many n-grams per edit with the given term, in either direction. Short terms might have too few n-grams
+        # for this to rule anything out, and then we turn to the deletion neighbourhoods instead. If the term or
+        # the edit distance is too large for these, we fall back to checking all terms of a compatible length.
+        threshold = len(ngrams) - max_distance * self._width
+        if threshold <= 0 and max_distance <= self._max_deletions and len(term) <= self._short_length:
+            term_ids = set()
+            for variant in self._get_deletions(term, max_distance):
+                posting_list = self._deletions.get(variant, array("l"))
+                term_ids.update(posting_list[bisect.bisect_left(posting_list, first):
+                                             bisect.bisect_left(posting_list, last)])
+        elif threshold <= 0:
+            term_ids = range(first, last)
+        else:
+            term_ids = self._filter(ngrams, threshold, first, last)
+            term_ids = [i for i in term_ids if term_ids[i] >= self._ngram_counts[i] - max_distance * self._width]
+
+        # Verify the candidates.
+        matches = []
+        for term_id in term_ids:
+            distance = edit_distance(term, self._terms[term_id], max_distance)
+            if distance <= max_distance:
+                matches.append((self._terms[term_id], distance))
+        get_document_frequency = self._inverted_index.get_document_frequency
+        matches.sort(key=lambda match: (match[1], -get_document_frequency(match[0]), match[0]))
+        return matches
+
+    def _filter(self, ngrams: set, threshold: int, first: int, last: int) -> Counter:
+        """
+        Finds the terms with identifiers in the given range that occur in at least threshold of the posting lists
+        of the given n-grams, and counts how many they occur in. Common n-grams have very long posting lists, and
+        we avoid scanning these: A term that occurs in at least threshold of M lists must occur in at least one
+        of the M - threshold + 1 shortest lists. We count the occurrences in the shortest lists, and look the
+        surviving candidates up in the longest lists using binary search.
+        """
+        posting_lists = sorted((self._posting_lists.get(ngram, array("l")) for ngram in ngrams), key=len)
+        shortest = len(posting_lists) - threshold + 1
+        counts = Counter()
+        for posting_list in posting_lists[:shortest]:
+            counts.update(posting_list[bisect.bisect_left(posting_list, first):bisect.bisect_left(posting_list, last)])
+        for (i, posting_list) in enumerate(posting_lists[shortest:]):
+            remaining = len(posting_lists) - shortest - i
+            for term_id in list(counts):
+                if counts[term_id] + remaining < threshold:
+                    del counts[term_id]
+                    continue
+                position = bisect.bisect_left(posting_list, term_id)
+                if position < len(posting_list) and posting_list[position] == term_id:
+                    counts[term_id] += 1
+        return Counter({term_id: count for (term_id, count) in counts.items() if count >= threshold})
+
+    def expand(self, query: str, expansions: int = 3, max_distance: int = 2) -> str:
+        """
+        Rewrites the given query so that each query term that isn't indexed is replaced by up to the given number
+        of the most similar indexed terms. Terms that don't have any similar indexed terms are kept as is. The
+        rewritten query can be passed to a search engine, assuming that processing an indexed term as a query
+        yields the term itself.
+
+        Short terms are allowed fewer edits, since almost all short terms are within a couple of edits of each
+        other: Terms shorter than three characters aren't expanded, and terms shorter than six characters are
+        allowed one edit.
+        """
+        terms = []
+        for term in self._inverted_index.get_terms(query):
+            if term in self._inverted_index:
+                terms.append(term)
+                continue
+            matches = self.candidates(term, min(max_distance, len(term) // 3))[:expansions]
+            terms.extend([match for (match, _) in matches] or [term])
+        return " ".join(terms)
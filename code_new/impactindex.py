@@ -0,0 +1,110 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from array import array
+from invertedindex import Posting, InvertedIndex
+from ranking import Ranker
+from typing import Iterator, List, Optional, Tuple
+
+
+class ImpactOrderedInvertedIndex(InvertedIndex):
+    """
+    An alternative layout of an existing inverted index, suitable for score-at-a-time query
+    evaluation. Each term's postings are grouped into impact bands, where the impact of a posting
+    is its precomputed score contribution according to some ranker, quantized to a small integer.
+    The bands are kept sorted so that the highest impacts come first, and within each band the
+    document identifiers are kept sorted in ascending order.
+
+    Since the impacts are precomputed, any query-independent part of the ranker's scores (e.g., a
+    static quality score) is left out. The impacts are precomputed for terms that occur once in the
+    query. Contributions needn't grow linearly with a term's multiplicity in the query, so the impacts
+    for terms that occur multiple times are computed and quantized on demand, using the same ranker.
+
+    Lookups that don't concern the impacts are delegated to the underlying inverted index.
+    """
+
+    def __init__(self, inverted_index: InvertedIndex, ranker: Ranker, bits: int = 8):
+        assert 0 < bits <= 16
+        assert inverted_index.supports("get_vocabulary"), "The inverted index can't enumerate its vocabulary."
+        self._inverted_index = inverted_index
+        self._ranker = ranker
+        self._levels = (1 << bits) - 1
+        self._bands = {}
+        self._build_bands(ranker)
+
+    def _build_bands(self, ranker: Ranker) -> None:
+        """
+        Computes all score contributions, and quantizes these uniformly across the whole vocabulary
+        so that impacts are comparable across terms.
+        """
+        contributions = {term: [(ranker.contribution(term, 1, p), p.document_id) for p in self._inverted_index[term]]
+                         for term in self._inverted_index.get_vocabulary()}
+        largest = max((c for pairs in contributions.values() for (c, _) in pairs), default=0.0)
+        self._scale = (largest / self._levels) if largest > 0.0 else 1.0
+        self._bands = {term: self._group(pairs) for (term, pairs) in contributions.items()}
+
+    def _group(self, pairs: List[Tuple[float, int]]) -> List[Tuple[int, array]]:
+        """
+        Quantizes the given (contribution, document identifier) pairs, and groups these into impact bands.
+        """
+        bands = {}
+        for (contribution, document_id) in pairs:
+            bands.setdefault(self.quantize(contribution), array("l")).append(document_id)
+        return sorted(bands.items(), key=lambda band: band[0], reverse=True)
+
+    def quantize(self, contribution: float) -> int:
+        """
+        Maps a score contribution to an integer impact. Contributions of terms that occur multiple times
+        in the query can map to impacts beyond the number of levels that the impact bands were built with.
+        """
+        return max(0, round(contribution / self._scale))
+
+    def dequantize(self, impact: int) -> float:
+        """
+        Maps an integer impact, or a sum of these, back to the scale of the ranker's scores.
+        """
+        return impact * self._scale
+
+    def get_impact_bands(self, term: str, multiplicity: int = 1) -> List[Tuple[int, array]]:
+        """
+        Returns the term's impact bands, as (impact, document identifiers) pairs ordered by
+        descending impact, given how many times the term occurs in the query. For out-of-vocabulary
+        terms we associate no impact bands.
+        """
+        if multiplicity == 1 or term not in self._bands:
+            return self._bands.get(term, [])
+        return self._group([(self._ranker.contribution(term, multiplicity, p), p.document_id)
+                            for p in self._inverted_index[term]])
+
+    def supports(self, capability: str) -> bool:
+        # The impacts are precomputed, so documents can't be deleted through this layout.
+        if capability == "delete_document":
+            return False
+        return capability == "get_vocabulary" or self._inverted_index.supports(capability)
+
+    def get_terms(self, buffer: str) -> Iterator[str]:
+        return self._inverted_index.get_terms(buffer)
+
+    def get_postings_iterator(self, term: str) -> Iterator[Posting]:
+        return self._inverted_index.get_postings_iterator(term)
+
+    def get_document_frequency(self, term: str) -> int:
+        return self._inverted_index.get_document_frequency(term)
+
+    def get_vocabulary(self) -> Iterator[str]:
+        return iter(self._bands)
+
+    def get_document_length(self, document_id: int, field: Optional[str] = None) -> int:
+        return self._inverted_index.get_document_length(document_id, field)
+
+    def get_average_document_length(self, field: Optional[str] = None) -> float:
+        return self._inverted_index.get_average_document_length(field)
+
+    def get_document_norm(self, document_id: int) -> float:
+        return self._inverted_index.get_document_norm(document_id)
+
+    def is_deleted(self, document_id: int) -> bool:
+        return self._inverted_index.is_deleted(document_id)
+
+    def get_version(self) -> int:
+        return self._inverted_index.get_version()
@@ -1,14 +1,26 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import bisect
+import copy
+import heapq
 import itertools
+import math
+import sys
+from array import array
 from abc import ABC, abstractmethod
 from dictionary import InMemoryDictionary
 from normalization import Normalizer
 from tokenization import Tokenizer
-from corpus import Corpus
+from corpus import Corpus, Document
+from utilities import BitSet, deep_sizeof
+from bitmap import RoaringBitmap
 from collections import Counter
-from typing import Iterable, Iterator
+from typing import Iterable, Iterator, Optional, Callable, Sequence, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ranking import Ranker
+    from documentterm import DocumentTermMatrix
 
 
 class Posting:
@@ -24,17 +36,290 @@ class Posting:
         return str({"document_id": self.document_id, "term_frequency": self.term_frequency})
 
 
+class PostingList:
+    """
+    A posting list, stored as parallel arrays of document identifiers and term frequencies
+    rather than as a list of Posting objects. Posting objects are produced on the fly when
+    the list is traversed.
+
+    The list is split into fixed-size blocks. For each block we keep track of the last document
+    identifier in the block and the largest term frequency in the block, so that traversal code
+    can skip whole blocks. The largest score contribution per block according to a given ranker
+    is computed on demand, and kept until the list or the index it belongs to changes. Likewise,
+    the document identifiers can be laid out as a compressed bitmap on demand.
+    """
+
+    # How many sets of per-block score maxima to keep, e.g., for different rankers or multiplicities.
+    _block_max_scores_capacity = 8
+
+    def __init__(self, block_size: int = 64):
+        assert block_size > 0
+        self.block_size = block_size
+        self.document_ids = array("l")
+        self.term_frequencies = array("l")
+        self.block_last_document_ids = array("l")
+        self.block_max_term_frequencies = array("l")
+        self._block_max_scores = {}
+        self._block_max_scores_version = None
+        self._bitmap = None
+
+    @classmethod
+    def from_arrays(cls, document_ids: array, term_frequencies: array, block_size: int = 64) -> "PostingList":
+        """
+        Creates a posting list from parallel arrays of document identifiers and term frequencies, without
+        going through Posting objects. The document identifiers must be sorted.
+        """
+        assert len(document_ids) == len(term_frequencies)
+        posting_list = cls(block_size)
+        posting_list.document_ids = document_ids
+        posting_list.term_frequencies = term_frequencies
+        for start in range(0, len(document_ids), block_size):
+            posting_list.block_last_document_ids.append(document_ids[min(len(document_ids), start + block_size) - 1])
+            posting_list.block_max_term_frequencies.append(max(term_frequencies[start:start + block_size]))
+        return posting_list
+
+    def __len__(self):
+        return len(self.document_ids)
+
+    def __iter__(self):
+        return map(Posting, self.document_ids, self.term_frequencies)
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def append(self, document_id: int, term_frequency: int) -> None:
+        """
+        Appends a posting to the list, keeping the block metadata up to date. The list must
+        be kept sorted by document identifiers.
+        """
+        assert len(self.document_ids) == 0 or self.document_ids[-1] < document_id
+        if len(self.document_ids) % self.block_size == 0:
+            self.block_last_document_ids.append(document_id)
+            self.block_max_term_frequencies.append(term_frequency)
+        else:
+            self.block_last_document_ids[-1] = document_id
+            self.block_max_term_frequencies[-1] = max(self.block_max_term_frequencies[-1], term_frequency)
+        self.document_ids.append(document_id)
+        self.term_frequencies.append(term_frequency)
+        self._block_max_scores.clear()
+        self._bitmap = None
+
+    def filtered(self, keep: Callable[[Posting], bool]) -> "PostingList":
+        """
+        Returns a copy of this list, having only the postings that satisfy the given predicate.
+        The blocks of the copy are laid out anew.
+        """
+        posting_list = PostingList(self.block_size)
+        for posting in self:
+            if keep(posting):
+                posting_list.append(posting.document_id, posting.term_frequency)
+        return posting_list
+
+    def get_block_max_scores(self, term: str, multiplicity: int, ranker: "Ranker", version: int = 0) -> array:
+        """
+        Returns, for each block, the largest score contribution that a posting in the block makes
+        according to the given ranker. Since this depends on the ranker and the query, these are
+        computed on demand and then kept for subsequent queries.
+
+        The contributions typically also depend on collection statistics, e.g., the number of documents,
+        which change whenever any document is added to or deleted from the index. The version of the
+        index that the list belongs to is therefore supplied, and the kept maxima are discarded when the
+        version changes. Only a few sets of maxima are kept, so that we don't keep every ranker alive.
+
+        Rankers that score alike share the kept maxima. Several threads may ask at once, without locking:
+        The kept maxima are only ever replaced wholesale, so at worst some maxima are computed twice.
+        """
+        key = (ranker.fingerprint(), term, multiplicity)
+        if version != self._block_max_scores_version:
+            self._block_max_scores = {}
+            self._block_max_scores_version = version
+        scores = self._block_max_scores.get(key, None)
+        if scores is None:
+            scores = array("d")
+            for start in range(0, len(self.document_ids), self.block_size):
+                postings = map(Posting, self.document_ids[start:start + self.block_size],
+                               self.term_frequencies[start:start + self.block_size])
+                scores.append(max(ranker.contribution(term, multiplicity, p) for p in postings))
+            if len(self._block_max_scores) >= self._block_max_scores_capacity:
+                self._block_max_scores = {}
+            self._block_max_scores[key] = scores
+        return scores
+
+    def get_bitmap(self) -> RoaringBitmap:
+        """
+        Returns the document identifiers as a compressed bitmap. The bitmap is built on demand, and
+        then kept until the list changes.
+        """
+        if self._bitmap is None:
+            self._bitmap = RoaringBitmap(self.document_ids)
+        return self._bitmap
+
+
+class PostingCursor(Iterator[Posting]):
+    """
+    An iterator over a posting list, that also keeps track of where in the posting list we
+    currently are. Besides advancing one posting at a time, the cursor can skip ahead to a given
+    document identifier. The block metadata of the block that the cursor is in is exposed, so
+    that traversal code can decide to skip whole blocks.
+
+    Postings of deleted documents, as marked by the supplied tombstones, are skipped over. If a
+    ranker is supplied, upper bounds on the score contributions are available, too. These are
+    computed as of the supplied version of the index.
+    """
+
+    def __init__(self, posting_list: PostingList, tombstones: BitSet, term: str = "",
+                 multiplicity: int = 1, ranker: Optional["Ranker"] = None, version: int = 0):
+        self._posting_list = posting_list
+        self._version = version
+        self._tombstones = tombstones
+        self._term = term
+        self._multiplicity = multiplicity
+        self._ranker = ranker
+        self._position = -1
+        self._current = None
+
+    def __next__(self) -> Posting:
+        if self._settle(self._position + 1) is None:
+            raise StopIteration
+        return self._current
+
+    def _settle(self, position: int) -> Optional[Posting]:
+        """
+        Moves the cursor to the given position, or to the first posting after that which isn't deleted.
+        """
+        document_ids = self._posting_list.document_ids
+        while self._tombstones and position < len(document_ids) and document_ids[position] in self._tombstones:
+            position += 1
+        self._position = min(position, len(document_ids))
+        if self._position == len(document_ids):
+            self._current = None
+        else:
+            self._current = Posting(document_ids[position], self._posting_list.term_frequencies[position])
+        return self._current
+
+    def _block(self) -> int:
+        return max(0, self._position) // self._posting_list.block_size
+
+    def _in_block(self) -> bool:
+        # False once the cursor is exhausted, and for empty posting lists, which have no blocks at all.
+        return self._block() < len(self._posting_list.block_last_document_ids)
+
+    @property
+    def current(self) -> Optional[Posting]:
+        """
+        The posting that the cursor currently points to, i.e., the one most recently returned. This is None
+        if the cursor hasn't been advanced yet, or if it has moved past the end of the posting list.
+        """
+        return self._current
+
+    def is_exhausted(self) -> bool:
+        """
+        Returns True iff the cursor has moved past the end of the posting list.
+        """
+        return self._position >= len(self._posting_list)
+
+    def skip_to(self, document_id: int) -> Optional[Posting]:
+        """
+        Advances the cursor to the first posting having a document identifier that is at least as large as the
+        given one, and returns that posting. The cursor never moves backwards. Whole blocks are skipped over
+        using the block metadata, and the remaining search happens within a single block. Returns None if we
+        move past the end of the posting list.
+        """
+        if self._current is not None and self._current.document_id >= document_id:
+            return self._current
+        if self.is_exhausted():
+            return None
+        block = bisect.bisect_left(self._posting_list.block_last_document_ids, document_id, self._block())
+        block_size = self._posting_list.block_size
+        start = max(self._position + 1, block * block_size)
+        end = min(len(self._posting_list), (block + 1) * block_size)
+        return self._settle(bisect.bisect_left(self._posting_list.document_ids, document_id, start, max(start, end)))
+
+    def skip_block(self) -> Optional[Posting]:
+        """
+        Advances the cursor to the first posting in the next block, and returns that posting. Returns None if we
+        move past the end of the posting list.
+        """
+        if self.is_exhausted():
+            return None
+        return self._settle((self._block() + 1) * self._posting_list.block_size)
+
+    def block_last_document_id(self) -> int:
+        """
+        Returns the last document identifier in the block that the cursor is in. Once the cursor is
+        exhausted, this is larger than any document identifier.
+        """
+        if not self._in_block():
+            return sys.maxsize
+        return self._posting_list.block_last_document_ids[self._block()]
+
+    def block_max_term_frequency(self) -> int:
+        """
+        Returns the largest term frequency in the block that the cursor is in, or 0 once the cursor
+        is exhausted.
+        """
+        if not self._in_block():
+            return 0
+        return self._posting_list.block_max_term_frequencies[self._block()]
+
+    def block_max_score(self) -> float:
+        """
+        Returns the largest score contribution in the block that the cursor is in, according to the
+        ranker that was supplied when the cursor was created, or 0.0 once the cursor is exhausted.
+        """
+        assert self._ranker is not None, "No ranker was supplied."
+        if not self._in_block():
+            return 0.0
+        block_max_scores = self._posting_list.get_block_max_scores(self._term, self._multiplicity, self._ranker,
+                                                                   self._version)
+        return block_max_scores[self._block()]
+
+    def max_term_frequency(self) -> int:
+        """
+        Returns the largest term frequency in the whole posting list.
+        """
+        return max(self._posting_list.block_max_term_frequencies, default=0)
+
+    def max_score(self) -> float:
+        """
+        Returns the largest score contribution in the whole posting list, according to the ranker that
+        was supplied when the cursor was created.
+        """
+        assert self._ranker is not None, "No ranker was supplied."
+        block_max_scores = self._posting_list.get_block_max_scores(self._term, self._multiplicity, self._ranker,
+                                                                   self._version)
+        return max(block_max_scores, default=0.0)
+
+
 class InvertedIndex(ABC):
     """
     Abstract base class for a simple inverted index.
+
+    Besides the abstract methods, an index can offer some optional lookups and operations, e.g., document
+    lengths or deletions, that not every index can support. Clients ask the index what it supports using
+    supports, rather than invoking these and seeing if they fail. Lookups that can be derived from the
+    postings, e.g., posting cursors, have default implementations.
     """
 
+    # The optional lookups and operations, by method name.
+    _capabilities = ("get_vocabulary", "get_document_length", "get_average_document_length",
+                     "get_document_norm", "delete_document")
+
     def __getitem__(self, term: str) -> Iterator[Posting]:
         return self.get_postings_iterator(term)
 
     def __contains__(self, term: str) -> bool:
         return self.get_document_frequency(term) > 0
 
+    def supports(self, capability: str) -> bool:
+        """
+        Returns True iff the index offers the given optional lookup or operation, named by its method, e.g.,
+        "get_document_length". By default, the index offers the optional methods that its class implements.
+        Indexes that delegate to other indexes report what the other indexes offer.
+        """
+        assert capability in self._capabilities, f"Unknown capability {capability}."
+        return getattr(type(self), capability) is not getattr(InvertedIndex, capability)
+
     @abstractmethod
     def get_terms(self, buffer: str) -> Iterator[str]:
         """
@@ -59,6 +344,76 @@ class InvertedIndex(ABC):
         """
         pass
 
+    def get_postings_cursor(self, term: str, multiplicity: int = 1, ranker: Optional["Ranker"] = None) -> PostingCursor:
+        """
+        Returns a cursor over the term's associated posting list, for traversals that skip ahead. If a ranker
+        is supplied, the cursor offers upper bounds on the score contributions of the given query term, too.
+
+        The default implementation decodes the whole posting list into blocks up front, so indexes that
+        already lay out their posting lists in blocks should override this.
+        """
+        posting_list = PostingList()
+        for posting in self.get_postings_iterator(term):
+            posting_list.append(posting.document_id, posting.term_frequency)
+        return PostingCursor(posting_list, BitSet(), term, multiplicity, ranker, self.get_version())
+
+    def get_document_ids(self, term: str) -> Union[RoaringBitmap, Sequence[int]]:
+        """
+        Returns the identifiers of the documents that contain the given term, without their term
+        frequencies, for doing fast set operations on posting lists. Depending on how common the
+        term is, this is either a compressed bitmap or a sorted sequence. The default implementation
+        collects the identifiers from the posting list.
+        """
+        return array("l", (posting.document_id for posting in self.get_postings_iterator(term)))
+
+    def get_vocabulary(self) -> Iterator[str]:
+        """
+        Returns an iterator over all the indexed terms, in no particular order. Optional.
+        """
+        raise NotImplementedError
+
+    def get_document_length(self, document_id: int, field: Optional[str] = None) -> int:
+        """
+        Returns the number of tokens the given document had in the named field when it was indexed.
+        If no field is named, the token count across all the indexed fields is returned. Optional.
+        """
+        raise NotImplementedError
+
+    def get_average_document_length(self, field: Optional[str] = None) -> float:
+        """
+        Returns the average document length across the indexed corpus, as for get_document_length.
+        Optional.
+        """
+        raise NotImplementedError
+
+    def get_document_norm(self, document_id: int) -> float:
+        """
+        Returns the Euclidean length of the given document's TF-IDF vector, as computed when the
+        document was indexed. Useful for cosine normalization. Optional.
+        """
+        raise NotImplementedError
+
+    def delete_document(self, document_id: int) -> None:
+        """
+        Marks the given document as deleted, so that it no longer shows up when traversing
+        posting lists. Raises a ValueError if the document was never indexed. Optional.
+        """
+        raise NotImplementedError
+
+    def is_deleted(self, document_id: int) -> bool:
+        """
+        Returns True iff the given document has been marked as deleted.
+        """
+        return False
+
+    def get_version(self) -> int:
+        """
+        Returns a number that changes whenever the contents of the index change, e.g., when documents
+        are added or deleted. Allows clients to detect that anything they have derived from the index
+        is stale. Indexes that never change can return a constant.
+        """
+        return 0
+
 
 class InMemoryInvertedIndex(InvertedIndex):
     """
@@ -66,48 +421,264 @@ class InMemoryInvertedIndex(InvertedIndex):
 
     In a serious application we'd have configuration to allow for field-specific NLP,
     scale beyond current memory constraints, have a positional index, and so on.
+
+    Document lengths are recorded per field as the index is built, so that length-aware rankers
+    don't have to revisit the corpus. Vector space norms are optionally precomputed, too.
+
+    Documents can be deleted without rebuilding the index. A deletion merely marks the document
+    in a bitset of "tombstones" that is consulted when traversing the posting lists, and the
+    deleted postings are physically purged later when the index is compacted.
+
+    The document identifiers of terms that occur in a large fraction of the documents can be
+    handed out as compressed bitmaps, which makes boolean operations on them much faster. The
+    posting lists remain the primary representation, since traversal needs the term frequencies
+    and random access to the document identifiers. A dense list's bitmap is derived from it when
+    first asked for, and costs at most 2 bytes per posting on top of the 16 bytes of the arrays.
     """
 
-    def __init__(self, corpus: Corpus, fields: Iterable[str], normalizer: Normalizer, tokenizer: Tokenizer):
+    # Posting lists with at least 1/16 as many entries as there are documents are considered dense.
+    # At that density, a bitmap container costs as much as an array container of 16-bit integers.
+    _bitmap_density = 16
+
+    def __init__(self, corpus: Corpus, fields: Iterable[str], normalizer: Normalizer, tokenizer: Tokenizer,
+                 compute_norms: bool = False, block_size: int = 64):
+        self._initialize(corpus, fields, normalizer, tokenizer, compute_norms, block_size)
+        self._build_index()
+
+    def _initialize(self, corpus: Corpus, fields: Iterable[str], normalizer: Normalizer, tokenizer: Tokenizer,
+                    compute_norms: bool, block_size: int) -> None:
         self._corpus = corpus
+        self._block_size = block_size
+        self._fields = list(fields)
         self._normalizer = normalizer
         self._tokenizer = tokenizer
         self._posting_lists = []
         self._dictionary = InMemoryDictionary()
-        self._build_index(fields)
+        self._indexed = BitSet()
+        self._deleted = BitSet()
+        self._deleted_bitmap = None
+        self._document_lengths = {f: array("l") for f in self._fields}
+        self._total_lengths = {f: 0 for f in self._fields}
+        self._document_count = 0
+        self._document_norms = array("d") if compute_norms else None
+        self._document_frequencies = None
+        self._version = 0
 
     def __repr__(self):
-        return str({term: self._posting_lists[term_id] for (term, term_id) in self._dictionary})
+        return str({term: list(self.get_postings_iterator(term)) for (term, _) in self._dictionary})
 
-    def _build_index(self, fields: Iterable[str]) -> None:
+    def _build_index(self) -> None:
         for document in self._corpus:
+            self._index_document(document)
+        self._compute_norms()
+
+    def _index_document(self, document: Document) -> Counter:
+
+        # Record how many tokens the document has in each field. Keep the lengths in dense
+        # arrays indexed by document identifiers, padding for gaps in the identifiers.
+        field_terms = [list(self.get_terms(document.get_field(f, ""))) for f in self._fields]
+        for (field, terms) in zip(self._fields, field_terms):
+            lengths = self._document_lengths[field]
+            lengths.extend(itertools.repeat(0, document.document_id + 1 - len(lengths)))
+            lengths[document.document_id] = len(terms)
+            self._total_lengths[field] += len(terms)
+        self._indexed.add(document.document_id)
+        self._document_count += 1
+        self._version += 1
+
+        # Compute TF values for all unique terms in the document. Note that we
+        # currently don't keep track of which field each term occurs in.
+        # If we were to allow fields searches (e.g., "find documents that
+        # contain 'foo' in the 'title' field") then we would have to keep
+        # track of that, either as a synthetic term in the dictionary
+        # (e.g., 'title.foo') or as extra data in the posting.
+        term_frequencies = Counter(itertools.chain.from_iterable(field_terms))
+
+        for (term, term_frequency) in term_frequencies.items():
+
+            # Assign the term an identifier, if needed. First come, first serve. Keep any document
+            # frequencies that we've been given up to date.
+            term_id = self._dictionary.add_if_absent(term)
+            if self._document_frequencies is not None:
+                self._document_frequencies.extend(itertools.repeat(0, term_id + 1 - len(self._document_frequencies)))
+                self._document_frequencies[term_id] += 1
+
+            # Locate the posting list for this term.
+            if term_id >= len(self._posting_lists):
+                self._posting_lists.extend((PostingList(self._block_size)
+                                            for _ in range(len(self._posting_lists) - term_id + 1)))
+            posting_list = self._posting_lists[term_id]
+
+            # Append the posting to the posting list. The posting lists
+            # must be kept sorted so that we can efficiently traverse and
+            # merge them when querying the inverted index. The posting list
+            # is paranoid and verifies that iterating over documents in the
+            # corpus happens in ascending order by document identifiers.
+            posting_list.append(document.document_id, term_frequency)
+
+        return term_frequencies
+
+    def _get_weight(self, term_frequency: int, document_frequency: int) -> float:
+        """
+        The TF-IDF weight of a term in a document, as used for computing vector space norms.
+        """
+        return math.log10(1 + term_frequency) * math.log10(self._corpus.size() / float(document_frequency))
+
+    def _compute_norms(self) -> None:
+        """
+        Precomputes the vector space norms of all indexed documents, if we're asked to keep track
+        of these. We need the document frequencies, so this requires a pass over the posting lists.
+        """
+        if self._document_norms is None:
+            return
+        squares = array("d", itertools.repeat(0.0, max(map(len, self._document_lengths.values()), default=0)))
+        for posting_list in self._posting_lists:
+            for (document_id, term_frequency) in zip(posting_list.document_ids, posting_list.term_frequencies):
+                squares[document_id] += self._get_weight(term_frequency, len(posting_list)) ** 2
+        self._document_norms = array("d", map(math.sqrt, squares))
+
+    def add_document(self, document: Document) -> None:
+        """
+        Adds a new document to the index. Since the posting lists are kept sorted, the document
+        identifier must be larger than those of all previously indexed documents.
+
+        If we keep track of vector space norms, the norm of the new document is computed using
+        the current document frequencies. The norms of the other documents are left as they are
+        until the index is compacted.
+        """
+        term_frequencies = self._index_document(document)
+        if self._document_norms is not None:
+            weights = (self._get_weight(tf, self.get_document_frequency(t)) for (t, tf) in term_frequencies.items())
+            self._document_norms.extend(itertools.repeat(0.0, document.document_id + 1 - len(self._document_norms)))
+            self._document_norms[document.document_id] = math.sqrt(sum(w ** 2 for w in weights))
+
+    def update_document(self, document_id: int, document: Document) -> None:
+        """
+        Replaces an indexed document with a new version of it. The new version must have been
+        assigned a fresh document identifier, as for add_document.
+        """
+        self.delete_document(document_id)
+        self.add_document(document)
+
+    def delete_document(self, document_id: int) -> None:
+        # Don't touch the posting lists. That would be expensive, so defer that until compaction.
+        # Deleted documents no longer count towards the average document lengths, though.
+        if document_id < 0 or document_id not in self._indexed:
+            raise ValueError(f"Document {document_id} isn't indexed.")
+        if document_id in self._deleted:
+            return
+        self._deleted.add(document_id)
+        self._deleted_bitmap = None
+        self._document_count -= 1
+        self._version += 1
+        for (field, lengths) in self._document_lengths.items():
+            self._total_lengths[field] -= lengths[document_id] if document_id < len(lengths) else 0
 
-            # Compute TF values for all unique terms in the document. Note that we
-            # currently don't keep track of which field each term occurs in.
-            # If we were to allow fields searches (e.g., "find documents that
-            # contain 'foo' in the 'title' field") then we would have to keep
-            # track of that, either as a synthetic term in the dictionary
-            # (e.g., 'title.foo') or as extra data in the posting.
-            all_terms = itertools.chain.from_iterable(self.get_terms(document.get_field(f, "")) for f in fields)
-            term_frequencies = Counter(all_terms)
-
-            for (term, term_frequency) in term_frequencies.items():
-
-                # Assign the term an identifier, if needed. First come, first serve.
-                term_id = self._dictionary.add_if_absent(term)
-
-                # Locate the posting list for this term.
-                if term_id >= len(self._posting_lists):
-                    self._posting_lists.extend(([] for _ in range(len(self._posting_lists) - term_id + 1)))
-                posting_list = self._posting_lists[term_id]
-
-                # Append the posting to the posting list. The posting lists
-                # must be kept sorted so that we can efficiently traverse and
-                # merge them when querying the inverted index. Be paranoid and
-                # verify that iterating over documents in the corpus happens
-                # in ascending order by document identifiers.
-                assert len(posting_list) == 0 or posting_list[-1].document_id < document.document_id
-                posting_list.append(Posting(document.document_id, term_frequency))
+    def is_deleted(self, document_id: int) -> bool:
+        return document_id in self._deleted
+
+    def get_version(self) -> int:
+        return self._version
+
+    def compact(self) -> None:
+        """
+        Physically purges the postings of all deleted documents from the posting lists. The
+        deleted documents remain marked as deleted. Vector space norms are recomputed.
+        """
+        if self._deleted:
+            self._posting_lists = [posting_list.filtered(lambda p: p.document_id not in self._deleted)
+                                   for posting_list in self._posting_lists]
+            self._compute_norms()
+            self._version += 1
+
+    def pruned(self, keep: Callable[[str, Posting], bool]) -> "InMemoryInvertedIndex":
+        """
+        Returns a copy of the index having only the postings that satisfy the given predicate, e.g.,
+        for doing static index pruning. The copy is meant for searching, and not for further updates.
+
+        The copy reports the document frequencies, document lengths and norms of this index, so that
+        the postings that remain in the copy get ranked exactly as they would in this index.
+        """
+        index = copy.copy(self)
+        index._dictionary = copy.deepcopy(self._dictionary)
+        index._indexed = BitSet(self._indexed)
+        index._deleted = BitSet(self._deleted)
+        index._deleted_bitmap = None
+        index._document_lengths = copy.deepcopy(self._document_lengths)
+        index._total_lengths = dict(self._total_lengths)
+        index._document_norms = copy.copy(self._document_norms)
+        index._document_frequencies = array("l", (self.get_document_frequency(t) for (t, _) in
+                                                  sorted(self._dictionary, key=lambda pair: pair[1])))
+        terms = {term_id: term for (term, term_id) in self._dictionary}
+        index._posting_lists = [posting_list.filtered(lambda p: keep(terms[term_id], p))
+                                for (term_id, posting_list) in enumerate(self._posting_lists)]
+        return index
+
+    def to_document_term_matrix(self) -> "DocumentTermMatrix":
+        """
+        Exports the index as a sparse document-term matrix of NumPy arrays. The posting lists are
+        copied wholesale, without going through Posting objects. Postings of deleted documents are
+        left out, but the matrix carries the collection statistics of the index and the deleted
+        documents, so that the matrix scores documents the way rankers that use the index do, and so
+        that the index can be restored with the same statistics. Requires NumPy.
+        """
+        import numpy as np
+        from documentterm import DocumentTermMatrix
+        terms = [term for (term, _) in sorted(self._dictionary, key=lambda pair: pair[1])]
+        lists = self._posting_lists[:len(terms)]
+        indices = np.concatenate([np.frombuffer(p.document_ids, dtype="l") for p in lists] + [np.empty(0, "l")])
+        data = np.concatenate([np.frombuffer(p.term_frequencies, dtype="l") for p in lists] + [np.empty(0, "l")])
+        frequencies = np.array([len(p) for p in lists], dtype="l")
+        document_frequencies = np.array([self.get_document_frequency(t) for t in terms], dtype="l")
+        if self._deleted:
+            keep = ~np.isin(indices, np.fromiter(self._deleted, dtype="l"))
+            frequencies = np.bincount(np.repeat(np.arange(len(lists)), frequencies)[keep], minlength=len(lists))
+            (indices, data) = (indices[keep], data[keep])
+        indptr = np.concatenate(([0], np.cumsum(frequencies)))
+        document_lengths = {field: np.frombuffer(lengths, dtype="l").copy()
+                            for (field, lengths) in self._document_lengths.items()}
+        return DocumentTermMatrix(terms, indptr, indices, data, document_lengths,
+                                  self._corpus.size(), document_frequencies, np.fromiter(self._deleted, dtype="l"))
+
+    @classmethod
+    def from_document_term_matrix(cls, matrix: "DocumentTermMatrix", corpus: Corpus, fields: Iterable[str],
+                                  normalizer: Normalizer, tokenizer: Tokenizer, compute_norms: bool = False,
+                                  block_size: int = 64) -> "InMemoryInvertedIndex":
+        """
+        Imports an index from a sparse document-term matrix, as produced by to_document_term_matrix. The
+        corpus isn't reindexed, but the supplied fields, normalizer and tokenizer must match the ones used
+        when the exported index was built. The deleted documents and the collection statistics are restored
+        from the matrix. If the exported index counted postings of deleted documents that the matrix leaves
+        out, the restored index keeps counting these, even if it's compacted.
+        """
+        import numpy as np
+        index = cls.__new__(cls)
+        index._initialize(corpus, fields, normalizer, tokenizer, compute_norms, block_size)
+        for (term_id, term) in enumerate(matrix.terms):
+            (start, end) = (matrix.indptr[term_id], matrix.indptr[term_id + 1])
+            document_ids = array("l")
+            document_ids.frombytes(matrix.indices[start:end].astype("l").tobytes())
+            term_frequencies = array("l")
+            term_frequencies.frombytes(matrix.data[start:end].astype("l").tobytes())
+            index._dictionary.add_if_absent(term)
+            index._posting_lists.append(PostingList.from_arrays(document_ids, term_frequencies, block_size))
+        index._indexed = BitSet(document.document_id for document in corpus)
+        index._deleted = BitSet(int(document_id) for document_id in matrix.deleted)
+        index._document_count = len(index._indexed) - len(index._deleted)
+        for field in index._fields:
+            lengths = matrix.document_lengths[field]
+            index._document_lengths[field].frombytes(lengths.astype("l").tobytes())
+            index._total_lengths[field] = int(lengths.sum() - lengths[matrix.deleted].sum())
+        if not np.array_equal(matrix.document_frequencies, np.diff(matrix.indptr)):
+            index._document_frequencies = array("l", (int(df) for df in matrix.document_frequencies))
+        index._compute_norms()
+        return index
+
+    def supports(self, capability: str) -> bool:
+        # Norms are only available if we were asked to compute them.
+        if capability == "get_document_norm":
+            return self._document_norms is not None
+        return super().supports(capability)
 
     def get_terms(self, buffer: str) -> Iterator[str]:
         return (self._normalizer.normalize(t) for t in self._tokenizer.strings(self._normalizer.canonicalize(buffer)))
@@ -117,11 +688,93 @@ class InMemoryInvertedIndex(InvertedIndex):
         # storing compressed integers, and the iterator would facilitate loading this buffer
         # from somewhere and decompressing the integers.
         term_id = self._dictionary.get_term_id(term)
-        return iter([]) if term_id is None else iter(self._posting_lists[term_id])
+        if term_id is None:
+            return iter([])
+        elif not self._deleted:
+            return iter(self._posting_lists[term_id])
+        else:
+            return PostingCursor(self._posting_lists[term_id], self._deleted)
+
+    def get_postings_cursor(self, term: str, multiplicity: int = 1, ranker: Optional["Ranker"] = None) -> PostingCursor:
+        term_id = self._dictionary.get_term_id(term)
+        posting_list = PostingList(self._block_size) if term_id is None else self._posting_lists[term_id]
+        return PostingCursor(posting_list, self._deleted, term, multiplicity, ranker, self._version)
+
+    def get_document_ids(self, term: str) -> Union[RoaringBitmap, Sequence[int]]:
+        term_id = self._dictionary.get_term_id(term)
+        if term_id is None:
+            return array("l")
+        posting_list = self._posting_lists[term_id]
+        if len(posting_list) * self._bitmap_density >= max(1, self._document_count + len(self._deleted)):
+            bitmap = posting_list.get_bitmap()
+            return bitmap - self._get_deleted_bitmap() if self._deleted else bitmap
+        elif not self._deleted:
+            return posting_list.document_ids
+        else:
+            return array("l", (d for d in posting_list.document_ids if d not in self._deleted))
+
+    def _get_deleted_bitmap(self) -> RoaringBitmap:
+        """
+        Returns the tombstones laid out as a compressed bitmap, for subtracting them from other bitmaps. The
+        bitmap is built on demand, and then kept until another document is deleted.
+        """
+        deleted_bitmap = self._deleted_bitmap
+        if deleted_bitmap is None:
+            deleted_bitmap = self._deleted_bitmap = RoaringBitmap(self._deleted)
+        return deleted_bitmap
 
     def get_document_frequency(self, term: str) -> int:
         # In a serious application we'd store this number explicitly, e.g., as part of the dictionary.
         # That way, we can look up the document frequency without having to access the posting lists
-        # themselves. Imagine if the posting lists don't even reside in memory!
+        # themselves. Imagine if the posting lists don't even reside in memory! Note that deleted
+        # documents are counted until they are purged by compaction. Pruned and imported indexes keep the
+        # document frequencies of the index they were pruned from or exported from.
         term_id = self._dictionary.get_term_id(term)
-        return 0 if term_id is None else len(self._posting_lists[term_id])
+        if term_id is None:
+            return 0
+        elif self._document_frequencies is None:
+            return len(self._posting_lists[term_id])
+        else:
+            return self._document_frequencies[term_id]
+
+    def get_vocabulary(self) -> Iterator[str]:
+        return (term for (term, _) in self._dictionary)
+
+    def get_document_length(self, document_id: int, field: Optional[str] = None) -> int:
+        fields = self._fields if field is None else [field]
+        return sum(self._document_lengths[f][document_id] for f in fields)
+
+    def get_average_document_length(self, field: Optional[str] = None) -> float:
+        fields = self._fields if field is None else [field]
+        return sum(self._total_lengths[f] for f in fields) / max(1, self._document_count)
+
+    def get_document_norm(self, document_id: int) -> float:
+        assert self._document_norms is not None, "Norms were not computed when the index was built."
+        return self._document_norms[document_id]
+
+    def stats(self, longest: int = 10) -> dict:
+        """
+        Reports the number of terms and postings in the index, the average posting list length,
+        the longest posting lists, and roughly how many bytes each of the index structures occupy
+        in memory. The block metadata is counted as part of the posting lists, while the bitmaps
+        derived from the dense posting lists and the tombstones are counted separately.
+        """
+        postings = sum(len(posting_list) for posting_list in self._posting_lists)
+        terms = self._dictionary.size()
+        posting_arrays = [(p.document_ids, p.term_frequencies, p.block_last_document_ids, p.block_max_term_frequencies)
+                          for p in self._posting_lists]
+        return {"terms": terms,
+                "postings": postings,
+                "documents": self._document_count,
+                "deleted": len(self._deleted),
+                "average_posting_list_length": postings / max(1, terms),
+                "longest_posting_lists": heapq.nlargest(longest, ((t, len(self._posting_lists[i]))
+                                                                  for (t, i) in self._dictionary),
+                                                        key=lambda pair: pair[1]),
+                "bytes": {"dictionary": self._dictionary.stats()["bytes"],
+                          "posting_lists": deep_sizeof(posting_arrays),
+                          "bitmaps": deep_sizeof([p._bitmap for p in self._posting_lists] + [self._deleted_bitmap]),
+                          "document_lengths": deep_sizeof(self._document_lengths),
+                          "document_norms": deep_sizeof(self._document_norms),
+                          "document_ids": deep_sizeof(self._indexed),
+                          "tombstones": deep_sizeof(self._deleted)}}
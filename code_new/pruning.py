@@ -0,0 +1,72 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import heapq
+from corpus import Corpus
+from invertedindex import InMemoryInvertedIndex
+from ranking import Ranker
+from searchengine import SimpleSearchEngine
+from typing import Iterable
+
+
+class StaticIndexPruner:
+    """
+    Does static index pruning, i.e., removes postings from an inverted index offline if they are
+    unlikely to ever contribute to a top-ranked result. This produces a smaller index, at the cost
+    of possibly different query results.
+
+    A posting is kept if its score contribution according to the supplied ranker is at least as
+    large as a global threshold, and at least as large as a per-term threshold. The per-term
+    threshold is a fraction of the K-th largest score contribution in the term's posting list, so
+    that the postings that would rank a document among the top K for a single-term query are
+    always kept.
+    """
+
+    def __init__(self, ranker: Ranker):
+        self._ranker = ranker
+
+    def prune(self, inverted_index: InMemoryInvertedIndex, global_threshold: float = 0.0,
+              term_fraction: float = 0.0, top: int = 10) -> InMemoryInvertedIndex:
+        """
+        Returns a pruned copy of the given index. The supplied ranker is assumed to rank documents
+        according to the statistics of the given index.
+        """
+        assert 0.0 <= term_fraction <= 1.0
+        assert top > 0
+        thresholds = {}
+        for term in inverted_index.get_vocabulary():
+            contributions = (self._ranker.contribution(term, 1, p) for p in inverted_index[term])
+            kth = heapq.nlargest(top, contributions)
+            thresholds[term] = max(global_threshold, term_fraction * kth[-1]) if kth else global_threshold
+        return inverted_index.pruned(lambda t, p: self._ranker.contribution(t, 1, p) >= thresholds[t])
+
+    def report(self, corpus: Corpus, unpruned: InMemoryInvertedIndex, pruned: InMemoryInvertedIndex,
+               queries: Iterable[str], options: dict) -> dict:
+        """
+        Reports how much smaller the pruned index is, and how well the top results for the sampled
+        queries agree between the pruned and unpruned indexes. The overlap for a query is the fraction
+        of the top documents from the unpruned index that are also among the top documents from the
+        pruned index. Queries without any results from the unpruned index are left out.
+
+        The pruned index reports the statistics of the index it was pruned from, so the supplied ranker
+        is used for evaluating queries against both indexes.
+        """
+        unpruned_stats = unpruned.stats()
+        pruned_stats = pruned.stats()
+        overlaps = []
+        for query in queries:
+            results = []
+            for inverted_index in (unpruned, pruned):
+                matches = set()
+                SimpleSearchEngine(corpus, inverted_index).evaluate(query, options, self._ranker,
+                                                                    lambda m: matches.add(m["document"].document_id))
+                results.append(matches)
+            if results[0]:
+                overlaps.append(len(results[0] & results[1]) / len(results[0]))
+        return {"postings": {"unpruned": unpruned_stats["postings"], "pruned": pruned_stats["postings"]},
+                "bytes": {"unpruned": unpruned_stats["bytes"]["posting_lists"],
+                          "pruned": pruned_stats["bytes"]["posting_lists"]},
+                "reduction": 1.0 - pruned_stats["postings"] / max(1, unpruned_stats["postings"]),
+                "queries": len(overlaps),
+                "average_overlap": sum(overlaps) / len(overlaps) if overlaps else 1.0,
+                "minimum_overlap": min(overlaps, default=1.0)}
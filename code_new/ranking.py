@@ -4,14 +4,38 @@
 from abc import ABC, abstractmethod
 from corpus import Corpus
 from invertedindex import Posting, InvertedIndex
+from typing import Hashable
 import math
 
 
 class Ranker(ABC):
     """
     Abstract base class for rankers used together with document-at-a-time traversal.
+
+    Besides the abstract methods, a ranker can offer some optional upper bounds on its scores, which
+    allow traversals to skip documents. Clients ask the ranker what it offers using supports.
     """
 
+    # The optional bounds, by method name.
+    _capabilities = ("upper_bound", "static_upper_bound")
+
+    def supports(self, capability: str) -> bool:
+        """
+        Returns True iff the ranker offers the given optional bound, named by its method, e.g., "upper_bound".
+        By default, the ranker offers the optional methods that its class implements.
+        """
+        assert capability in self._capabilities, f"Unknown capability {capability}."
+        return getattr(type(self), capability) is not getattr(Ranker, capability)
+
+    def fingerprint(self) -> Hashable:
+        """
+        Returns a hashable value that identifies how the ranker scores documents, so that scores computed by
+        one ranker can be reused for another ranker having the same fingerprint, e.g., a copy of the ranker
+        made for another thread. The per-document state doesn't enter into it. By default, a ranker is only
+        known to score like itself.
+        """
+        return self
+
     @abstractmethod
     def reset(self, document_id: int) -> None:
         """
@@ -38,6 +62,36 @@ class Ranker(ABC):
         """
         pass
 
+    def contribution(self, term: str, multiplicity: int, posting: Posting) -> float:
+        """
+        Returns how much a single query term and its associated posting contribute to the
+        document's relevancy score, leaving out any query-independent part of the score. Useful
+        for precomputing score contributions offline.
+
+        The default implementation assumes that the contributions are additive, and derives the
+        contribution by evaluating the document with and without the posting. This resets the
+        ranker, so don't invoke this in the middle of evaluating a document.
+        """
+        self.reset(posting.document_id)
+        baseline = self.evaluate()
+        self.update(term, multiplicity, posting)
+        return self.evaluate() - baseline
+
+    def upper_bound(self, term: str, multiplicity: int, max_term_frequency: int) -> float:
+        """
+        Returns an upper bound on how much a single query term can contribute to any document's relevancy
+        score, as for contribution, given the largest term frequency in the term's posting list. Useful for
+        skipping documents that can't make it into the top results. Optional, for rankers that can bound
+        their score contributions this cheaply.
+        """
+        raise NotImplementedError
+
+    def static_upper_bound(self) -> float:
+        """
+        Returns an upper bound on the query-independent part of any document's relevancy score. Optional.
+        """
+        raise NotImplementedError
+
 
 class BrainDeadRanker(Ranker):
     """
@@ -47,6 +101,9 @@ class BrainDeadRanker(Ranker):
     def __init__(self):
         self._score = 0.0
 
+    def fingerprint(self) -> Hashable:
+        return (type(self),)
+
     def reset(self, document_id: int) -> None:
         self._score = 0.0
 
@@ -56,6 +113,15 @@ class BrainDeadRanker(Ranker):
     def evaluate(self) -> float:
         return self._score
 
+    def contribution(self, term: str, multiplicity: int, posting: Posting) -> float:
+        return multiplicity * posting.term_frequency
+
+    def upper_bound(self, term: str, multiplicity: int, max_term_frequency: int) -> float:
+        return multiplicity * max_term_frequency
+
+    def static_upper_bound(self) -> float:
+        return 0.0
+
 
 class BetterRanker(Ranker):
     """
@@ -75,6 +141,11 @@ class BetterRanker(Ranker):
         self._dynamic_score_weight = 1.0  # TODO: Make this configurable.
         self._static_score_weight = 1.0  # TODO: Make this configurable.
         self._static_score_field_name = "static_quality_score"  # TODO: Make this configurable.
+        self._static_upper_bound = (None, None)
+
+    def fingerprint(self) -> Hashable:
+        return (type(self), self._corpus, self._inverted_index, self._dynamic_score_weight,
+                self._static_score_weight, self._static_score_field_name)
 
     def reset(self, document_id: int) -> None:
         self._score = 0.0
@@ -85,7 +156,75 @@ class BetterRanker(Ranker):
         idf_score = math.log10(self._corpus.size() / float(self._inverted_index.get_document_frequency(term)))
         self._score += tf_score * idf_score
 
+    def contribution(self, term: str, multiplicity: int, posting: Posting) -> float:
+        tf_score = math.log10(multiplicity * (1 + posting.term_frequency))
+        idf_score = math.log10(self._corpus.size() / float(self._inverted_index.get_document_frequency(term)))
+        return self._dynamic_score_weight * tf_score * idf_score
+
+    def upper_bound(self, term: str, multiplicity: int, max_term_frequency: int) -> float:
+        # The TF-IDF weight grows with the term frequency, so the largest term frequency gives the largest weight.
+        return self.contribution(term, multiplicity, Posting(-1, max_term_frequency))
+
+    def static_upper_bound(self) -> float:
+        # This requires a pass over the corpus, so we only redo it if documents have been added since.
+        key = (self._inverted_index.get_version(), self._corpus.size())
+        (cached_key, static_upper_bound) = self._static_upper_bound
+        if cached_key != key:
+            static_quality_scores = (float(d[self._static_score_field_name] or 0.0) for d in self._corpus)
+            static_upper_bound = self._static_score_weight * max(static_quality_scores, default=0.0)
+            self._static_upper_bound = (key, static_upper_bound)
+        return static_upper_bound
+
     def evaluate(self) -> float:
         document = self._corpus[self._document_id]
         static_quality_score = float(document[self._static_score_field_name] or 0.0)
         return (self._dynamic_score_weight * self._score) + (self._static_score_weight * static_quality_score)
+
+
+class BM25Ranker(Ranker):
+    """
+    A ranker that does Okapi BM25 ranking. Document lengths are looked up in the inverted
+    index, so that we can normalize for document length without revisiting the corpus.
+
+    The parameter k1 controls term frequency saturation, and the parameter b controls how
+    strongly we normalize for document length.
+    """
+
+    def __init__(self, corpus: Corpus, inverted_index: InvertedIndex, k1: float = 1.2, b: float = 0.75):
+        self._score = 0.0
+        self._document_id = None
+        self._corpus = corpus
+        self._inverted_index = inverted_index
+        self._k1 = k1
+        self._b = b
+        assert inverted_index.supports("get_document_length"), "The inverted index doesn't keep document lengths."
+
+    def fingerprint(self) -> Hashable:
+        return (type(self), self._corpus, self._inverted_index, self._k1, self._b)
+
+    def reset(self, document_id: int) -> None:
+        self._score = 0.0
+        self._document_id = document_id
+
+    def update(self, term: str, multiplicity: int, posting: Posting) -> None:
+        document_frequency = self._inverted_index.get_document_frequency(term)
+        idf_score = math.log(1.0 + (self._corpus.size() - document_frequency + 0.5) / (document_frequency + 0.5))
+        length_ratio = self._inverted_index.get_document_length(posting.document_id) / \
+            max(1.0, self._inverted_index.get_average_document_length())
+        tf_score = (posting.term_frequency * (self._k1 + 1.0)) / \
+            (posting.term_frequency + self._k1 * (1.0 - self._b + self._b * length_ratio))
+        self._score += multiplicity * tf_score * idf_score
+
+    def evaluate(self) -> float:
+        return self._score
+
+    def upper_bound(self, term: str, multiplicity: int, max_term_frequency: int) -> float:
+        # The BM25 weight grows with the term frequency and shrinks with the document length, so the largest
+        # term frequency in a document of length zero gives an upper bound.
+        document_frequency = self._inverted_index.get_document_frequency(term)
+        idf_score = math.log(1.0 + (self._corpus.size() - document_frequency + 0.5) / (document_frequency + 0.5))
+        tf_score = (max_term_frequency * (self._k1 + 1.0)) / (max_term_frequency + self._k1 * (1.0 - self._b))
+        return multiplicity * tf_score * idf_score
+
+    def static_upper_bound(self) -> float:
+        return 0.0
@@ -1,24 +1,62 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import bisect
+import heapq
+from array import array
 from collections import Counter
-from utilities import Sieve
+from timeit import default_timer as timer
+from utilities import Sieve, PageSieve, LRUCache, Budget
 from ranking import Ranker
 from corpus import Corpus
-from invertedindex import InvertedIndex
-from typing import Callable, Any
+from invertedindex import Posting, PostingCursor, InvertedIndex
+from impactindex import ImpactOrderedInvertedIndex
+from traversal import PostingsMerger, BooleanQueryParser, QueryPlanner
+from typing import Callable, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 class SimpleSearchEngine:
     """
     A simple implementation of a search engine based on an inverted index, suitable for small corpora.
+
+    Queries are evaluated using document-at-a-time traversal of the posting lists, unless the client asks
+    for term-at-a-time traversal, or asks us to choose based on how long the posting lists are. Term-at-a-time
+    traversal uses NumPy, if available.
+    Document-at-a-time traversal can optionally skip documents that can't make it into the top results,
+    using the WAND or MaxScore algorithms.
+
+    Query results can optionally be cached, so that repeated queries don't have to traverse any posting
+    lists at all. The cache is keyed on the normalized query terms, so queries that only differ in,
+    e.g., casing share cache entries. The cache is cleared whenever the inverted index changes.
     """
 
-    def __init__(self, corpus: Corpus, inverted_index: InvertedIndex):
+    # Slack added to score upper bounds, so that rounding errors never cause us to skip a document.
+    _upper_bound_slack = 1e-9
+
+    # Use term-at-a-time traversal if the query's posting lists have at least this many postings in total.
+    _term_at_a_time_threshold = 1000
+
+    # The values of the "traversal" option.
+    _traversals = ("daat", "taat", "wand", "maxscore", "auto")
+
+    def __init__(self, corpus: Corpus, inverted_index: InvertedIndex, result_cache_size: int = 0):
         self._corpus = corpus
         self._inverted_index = inverted_index
+        self._result_cache = LRUCache(result_cache_size) if result_cache_size > 0 else None
+        self._result_cache_version = inverted_index.get_version()
 
-    def evaluate(self, query: str, options: dict, ranker: Ranker, callback: Callable[[dict], Any]) -> None:
+    def stats(self) -> dict:
+        """
+        Reports statistics about the search engine's caches, e.g., their hit rates.
+        """
+        return {"result_cache": self._result_cache.stats() if self._result_cache is not None else None}
+
+    def evaluate(self, query: str, options: dict, ranker: Ranker, callback: Callable[[dict], Any]) -> dict:
         """
         Evaluates the given query, doing N-out-of-M ranked retrieval. I.e., for a supplied query having M terms,
         a document is considered to be a match if it contains at least N <= M of those terms.
@@ -28,75 +66,718 @@ class SimpleSearchEngine:
 
         The client can supply a dictionary of options that controls this query evaluation process: The value of
         N is inferred from the query via the "match_threshold" (float) option, and the maximum number of documents
-        to return to the client is controlled via the "hit_count" (int) option.
+        to return to the client is controlled via the "hit_count" (int) option. How to traverse the posting lists
+        is controlled via the "traversal" (str) option, which is one of "daat" (the default), "taat", "wand",
+        "maxscore" or "auto". The "taat" traversal sums the score contributions of the postings, so it produces
+        the same results as "daat" does, up to rounding, only for rankers whose scores are sums of contributions.
+        The "auto" traversal chooses "taat" for queries with long posting lists, but only for rankers that
+        provide their own contributions, and otherwise "daat". The "wand" and "maxscore" traversals produce the
+        same results as "daat" does, and fall back to "daat" for rankers that can't bound the static part of their
+        scores. They skip the most for indexes that lay out their posting lists in blocks, and rankers that offer
+        cheap upper bounds. The "maxscore" traversal is a good fit for long queries with a low "match_threshold".
+        Any other traversal raises a ValueError.
+
+        The client can also restrict which documents are considered at all: Only documents that pass the "filter"
+        option are considered, where the filter is either a set of document identifiers (e.g., a BitSet) or a
+        predicate over document identifiers. Documents that contain any of the terms in the "exclude" (str) option
+        are not considered. These restrictions are applied to the posting lists as they are traversed, so excluded
+        documents are never ranked.
+
+        The client can put a budget on how much work the evaluation may take, via the "timeout" (float) option
+        in seconds and the "max_postings" (int) option. Once the budget is exhausted, traversal stops and the
+        best matches found so far are returned. Such results are partial: Some documents might not have been
+        considered, and for term-at-a-time traversal some scores might be incomplete.
+
+        The client can page through the ranked documents using the "search_after" (str) option. If the option is
+        present, the ranking is made a total order by ranking documents that have the same score by ascending
+        document identifiers, and the "hit_count" option is the page size. The first page is requested by setting
+        the option to None. A cursor for requesting the next page is returned along with the statistics, and
+        the next page then holds the documents that rank strictly after the last document on this page. If
+        this page isn't full, there are no more pages, and the returned cursor is None.
 
         The callback function supplied by the client will receive a dictionary having the keys "score" (float) and
         "document" (Document).
+
+        Returns a dictionary of statistics about the evaluation: Which traversal was used, how many documents and
+        postings were scored, how many seconds the evaluation took, whether the results are partial, and the
+        cursor for the next page, if paging. If the search engine has a result cache, the results of queries
+        without restrictions are cached, and cache hits are reported as the "cache" traversal. Partial results
+        are never cached.
         """
 
         # Print verbose debug information?
         debug = options.get("debug", False)
+        start = timer()
+        statistics = Counter()
+        traversal = options.get("traversal", "daat")
+        if traversal not in self._traversals:
+            raise ValueError(f"Unknown traversal: {traversal!r}")
+
+        # How much work are we allowed to do? Most queries have no budget, and then we don't check.
+        budget = None
+        if options.get("timeout", None) is not None or options.get("max_postings", None) is not None:
+            budget = Budget(options.get("max_postings", None), options.get("timeout", None))
 
         # Produce the query terms. We must use the same string processing here as we used when
         # building up the inverted index. Some terms might be duplicated (e.g., as in the query
         # "to be or not to be").
-        query_terms = self._inverted_index.get_terms(query)
+        query_terms = list(self._inverted_index.get_terms(query))
         unique_query_terms = [(term, count) for (term, count) in Counter(query_terms).items()]
+        match_threshold = max(0.0, min(1.0, options.get("match_threshold", 0.5)))
+        hit_count = max(1, min(100, options.get("hit_count", 10)))
+        paging = "search_after" in options
 
-        # Get the posting lists for the unique query terms.
-        posting_lists = [self._inverted_index[term] for (term, _) in unique_query_terms]
+        # Maybe we've seen this query before? The same query might be ranked differently by different rankers,
+        # and we can't easily tell if two restrictions are the same. Rankers that score alike, e.g., copies of
+        # the same ranker, share their entries. Different traversals might round scores or break ties between
+        # documents differently, so they don't share entries.
+        cache_key = None
+        if self._result_cache is not None and not debug and "filter" not in options and not options.get("exclude"):
+            if self._result_cache_version != self._inverted_index.get_version():
+                self._result_cache.clear()
+                self._result_cache_version = self._inverted_index.get_version()
+            cache_key = (tuple(query_terms), ranker.fingerprint(), traversal, hit_count, match_threshold, paging,
+                         options.get("search_after"))
+            winners = self._result_cache.get(cache_key)
+            if winners is not None:
+                for (score, document_id) in winners:
+                    callback({"score": score, "document": self._corpus[document_id]})
+                return {"traversal": "cache", "documents_scored": 0, "postings_scored": 0,
+                        "elapsed": timer() - start, "partial": False,
+                        "cursor": self._get_cursor(winners, hit_count) if paging else None}
+
+        # Which documents does the client want us to consider? The excluded documents are collected once, rather
+        # than traversing the excluded posting lists once per query term.
+        restriction = self._get_restriction(options)
 
         # We require that at least N of the M query terms are present in the document,
         # for the document to be considered part of the result set. What should the minimum
         # value of N be?
         # TODO: Take multiplicity into account, and not just uniqueness.
-        match_threshold = max(0.0, min(1.0, options.get("match_threshold", 0.5)))
         required_minimum = max(1, min(len(unique_query_terms), int(match_threshold * len(unique_query_terms))))
 
+        # We're doing ranked retrieval. Keep track of the K highest-scoring documents, possibly on a given page.
+        sieve = PageSieve(hit_count, options["search_after"]) if paging else Sieve(hit_count)
+
+        # Document-at-a-time traversal is a good fit for short posting lists, while term-at-a-time traversal
+        # avoids the per-document overhead of juggling many cursors when the posting lists are long. The
+        # document frequencies tell us how long the posting lists are, without us having to traverse them.
+        # Term-at-a-time traversal sums contributions, and the default contributions merely assume that the
+        # ranker is additive. So we only choose it for rankers that vouch for their contributions.
+        if traversal == "auto":
+            postings = sum(self._inverted_index.get_document_frequency(term) for (term, _) in unique_query_terms)
+            additive = type(ranker).contribution is not Ranker.contribution
+            traversal = "taat" if additive and postings >= self._term_at_a_time_threshold else "daat"
+        if traversal in ("wand", "maxscore"):
+            evaluator = self._evaluate_wand if traversal == "wand" else self._evaluate_maxscore
+            if not evaluator(unique_query_terms, required_minimum, restriction, ranker, sieve, debug, statistics,
+                             budget):
+                traversal = "daat"
+        if traversal in ("taat", "daat"):
+            # Get the posting lists for the unique query terms, restricted to the documents to consider.
+            posting_lists = [self._inverted_index[term] for (term, _) in unique_query_terms]
+            if restriction is not None:
+                posting_lists = [PostingsMerger.filter(p, restriction) for p in posting_lists]
+        if traversal == "taat":
+            self._evaluate_term_at_a_time(unique_query_terms, posting_lists, required_minimum,
+                                          ranker, sieve, debug, statistics, budget)
+        elif traversal == "daat":
+            self._evaluate_document_at_a_time(unique_query_terms, posting_lists, required_minimum,
+                                              ranker, sieve, debug, statistics, budget)
+        partial = budget is not None and budget.exhausted
+
+        # Alert the client about the best-matching documents, using the supplied callback function.
+        # Emit documents sorted accoring to their relevancy scores.
+        winners = list(sieve.winners())
+        if cache_key is not None and not partial:
+            self._result_cache.put(cache_key, winners)
+        for (score, document_id) in winners:
+            callback({"score": score, "document": self._corpus[document_id]})
+        return {"traversal": traversal,
+                "documents_scored": statistics["documents"],
+                "postings_scored": statistics["postings"],
+                "elapsed": timer() - start,
+                "partial": partial,
+                "cursor": self._get_cursor(winners, hit_count) if paging else None}
+
+    @staticmethod
+    def _get_cursor(winners: List[Tuple[float, int]], hit_count: int) -> Optional[str]:
+        """
+        Returns the cursor for requesting the page after the given page of winners, or None if the given
+        page is the last one.
+        """
+        return PageSieve.encode(*winners[-1]) if len(winners) == hit_count else None
+
+    def evaluate_many(self, queries: Iterable[str], options: dict, ranker: Ranker) -> List[List[dict]]:
+        """
+        Evaluates a batch of queries, e.g., when replaying a query log. The queries are evaluated as for
+        term-at-a-time traversal with the same options, and for each query we return the list of matches
+        that evaluate would have emitted via its callback, i.e., dictionaries having the keys "score" (float)
+        and "document" (Document).
+
+        Queries in a batch typically have lots of terms in common. Each posting list is therefore traversed
+        only once per batch, and each score contribution is computed only once per batch. The queries are
+        ordered so that queries that have the most common terms in common are evaluated close together, and
+        a posting list's decoded contributions are released as soon as no remaining query needs them.
+        """
+
+        # Produce the query terms, as for a single query.
+        queries = [[(term, count) for (term, count) in Counter(self._inverted_index.get_terms(query)).items()]
+                   for query in queries]
+        match_threshold = max(0.0, min(1.0, options.get("match_threshold", 0.5)))
+        hit_count = max(1, min(100, options.get("hit_count", 10)))
+        restriction = self._get_restriction(options)
+
+        # Group the queries by the terms they share. Keep track of how many of the remaining queries need
+        # each term, so that we know when we're done with it.
+        references = Counter(query_term for query_terms in queries for query_term in query_terms)
+        popularity = Counter(term for query_terms in queries for (term, _) in query_terms)
+        order = sorted(range(len(queries)),
+                       key=lambda i: sorted((-popularity[term], term) for (term, _) in queries[i]))
+
+        # Evaluate the queries, sharing the decoded posting lists and their score contributions.
+        decoded = {}
+        results = [[] for _ in queries]
+        for i in order:
+            unique_query_terms = queries[i]
+            for query_term in unique_query_terms:
+                if query_term not in decoded:
+                    (term, multiplicity) = query_term
+                    (document_ids, contributions) = (array("l"), array("d"))
+                    for posting in self._inverted_index.get_postings_iterator(term):
+                        document_ids.append(posting.document_id)
+                        contributions.append(ranker.contribution(term, multiplicity, posting))
+                    decoded[query_term] = (document_ids, contributions)
+            required_minimum = max(1, min(len(unique_query_terms), int(match_threshold * len(unique_query_terms))))
+            sieve = Sieve(hit_count)
+            for (document_id, score) in self._accumulate_decoded([decoded[t] for t in unique_query_terms],
+                                                                 required_minimum):
+                if restriction is None or restriction(document_id):
+                    ranker.reset(document_id)
+                    sieve.sift(score + ranker.evaluate(), document_id)
+            results[i] = [{"score": score, "document": self._corpus[document_id]}
+                          for (score, document_id) in sieve.winners()]
+            for query_term in unique_query_terms:
+                references[query_term] -= 1
+                if references[query_term] == 0:
+                    del decoded[query_term]
+        return results
+
+    def _accumulate_decoded(self, decoded: List[Tuple[array, array]], required_minimum: int) -> List[Tuple[int, float]]:
+        """
+        Accumulates precomputed score contributions, given as parallel arrays of document identifiers and
+        score contributions. Returns the (document identifier, score) pairs for the documents that contain
+        enough of the query terms, sorted by document identifiers.
+        """
+        postings = sum(len(document_ids) for (document_ids, _) in decoded)
+        if np is not None and postings * 8 >= self._corpus.size():
+            scores = np.zeros(self._corpus.size())
+            counts = np.zeros(self._corpus.size(), dtype=np.int32)
+            for (document_ids, contributions) in decoded:
+                if document_ids:
+                    document_ids = np.frombuffer(document_ids, dtype="l")
+                    scores[document_ids] += np.frombuffer(contributions, dtype="d")
+                    counts[document_ids] += 1
+            candidates = np.flatnonzero(counts >= required_minimum)
+            return [(int(d), float(s)) for (d, s) in zip(candidates, scores[candidates])]
+        accumulators = {}
+        for (document_ids, contributions) in decoded:
+            for (document_id, contribution) in zip(document_ids, contributions):
+                accumulator = accumulators.setdefault(document_id, [0.0, 0])
+                accumulator[0] += contribution
+                accumulator[1] += 1
+        return sorted((d, a[0]) for (d, a) in accumulators.items() if a[1] >= required_minimum)
+
+    def _get_restriction(self, options: dict) -> Optional[Callable[[int], bool]]:
+        """
+        Returns a predicate over document identifiers that captures the "filter" and "exclude" options. Returns
+        None if there are no restrictions.
+        """
+        predicates = []
+        if "filter" in options:
+            documents = options["filter"]
+            predicates.append(documents if callable(documents) else documents.__contains__)
+        if options.get("exclude", None):
+            excluded = self._get_excluded_documents(options["exclude"])
+            predicates.append(lambda document_id: document_id not in excluded)
+        if len(predicates) < 2:
+            return predicates[0] if predicates else None
+        return lambda document_id: all(predicate(document_id) for predicate in predicates)
+
+    def _get_excluded_documents(self, exclude: str) -> set:
+        """
+        Returns the identifiers of the documents that contain any of the terms in the given "exclude" option.
+        """
+        return {p.document_id for t in set(self._inverted_index.get_terms(exclude)) for p in self._inverted_index[t]}
+
+    def evaluate_boolean(self, query: str, options: dict, callback: Callable[[dict], Any]) -> None:
+        """
+        Evaluates the given boolean query, e.g., 'water AND (pollution OR "toxic waste") AND NOT river'.
+        The query is parsed into an operator tree, and rewritten by a query planner before it is evaluated.
+        The matching documents are not ranked, and are returned to the client via the supplied callback
+        function in ascending order by document identifiers.
+
+        Since the inverted index isn't positional, phrases are verified against the contents of the
+        documents. The fields to consider are given by the "fields" (list) option, and default to just
+        the "body" field. If the "debug" (bool) option is set, the query plan is printed.
+
+        The callback function supplied by the client will receive a dictionary having the key "document"
+        (Document).
+        """
+        fields = options.get("fields", ["body"])
+
+        def match_phrase(document_id: int, terms: List[str]) -> bool:
+            document = self._corpus[document_id]
+            for field in fields:
+                haystack = list(self._inverted_index.get_terms(document.get_field(field, "")))
+                if any(haystack[i:i + len(terms)] == terms for i in range(len(haystack) - len(terms) + 1)):
+                    return True
+            return False
+
+        planner = QueryPlanner(self._inverted_index, self._corpus.size(), match_phrase)
+        plan = planner.plan(BooleanQueryParser(self._inverted_index).parse(query))
+        if options.get("debug", False):
+            print("*** PLAN")
+            print(plan.explain(self._inverted_index))
+        for document_id in plan.evaluate(self._inverted_index):
+            callback({"document": self._corpus[document_id]})
+
+    def _evaluate_document_at_a_time(self, unique_query_terms: List[Tuple[str, int]],
+                                     posting_lists: List[Iterator[Posting]], required_minimum: int,
+                                     ranker: Ranker, sieve: Sieve, debug: bool, statistics: Counter,
+                                     budget: Optional[Budget] = None) -> None:
+        """
+        Does document-at-a-time traversal of the posting lists, sifting the matching documents through the sieve.
+        Stops early if the budget is exhausted.
+        """
+
         # When traversing the posting lists using document-at-a-time traversal, we need to keep track
         # of where we are in each of the posting lists. Initially, all the cursors "point to" the first entry
-        # in each posting list. Keep track of which posting lists that remain to be fully traversed.
-        all_cursors = [next(p, None) for p in posting_lists]
-        remaining_cursor_ids = [i for i in range(len(all_cursors)) if all_cursors[i]]
-
-        # We're doing ranked retrieval. Assess relevance scores per document as we go along, as we're doing
-        # document-at-a-time traversal. Keep track of the K highest-scoring documents.
-        sieve = Sieve(max(1, min(100, options.get("hit_count", 10))))
+        # in each posting list. The non-exhausted cursors are kept in a priority queue, ordered by the document
+        # identifiers they point to. Ties are broken by the cursors' positions in the query, so the entries are
+        # unique and the postings themselves are never compared.
+        frontier = [(posting.document_id, i, posting)
+                    for (i, posting) in enumerate(next(p, None) for p in posting_lists) if posting]
+        heapq.heapify(frontier)
 
         # We're doing at least N-of-M matching. As we reach the end of the posting lists, we can abort when
         # the number of non-exhausted lists drops below the required minimum N.
-        while len(remaining_cursor_ids) >= required_minimum:
+        while len(frontier) >= required_minimum:
 
             # The posting lists are sorted by the document identifiers in ascending order. Define the
             # "frontier" as the subset of non-exhausted posting lists that mention the lowest document
             # identifier. In a sense, if we imagine scanning the posting lists from left to right, the
-            # frontier is the subset that has the "leftmost" cursors.
-            # TODO: This can easily be done in a single pass over the remaining lists.
-            document_id = min([all_cursors[i].document_id for i in remaining_cursor_ids])
-            frontier_cursor_ids = [i for i in remaining_cursor_ids if all_cursors[i].document_id == document_id]
+            # frontier is the subset that has the "leftmost" cursors. These are at the top of the priority
+            # queue, and come off it in query order.
+            document_id = frontier[0][0]
+            matches = []
+            while frontier and frontier[0][0] == document_id:
+                (_, i, posting) = heapq.heappop(frontier)
+                matches.append((i, posting))
 
             # The number of elements on the "frontier" needs to be at least N. Otherwise, these documents
             # don't contain enough of the query terms, and aren't part of the result set.
-            if len(frontier_cursor_ids) >= required_minimum:
+            if len(matches) >= required_minimum:
                 ranker.reset(document_id)
-                for i in frontier_cursor_ids:
-                    ranker.update(unique_query_terms[i][0], unique_query_terms[i][1], all_cursors[i])
+                for (i, posting) in matches:
+                    ranker.update(unique_query_terms[i][0], unique_query_terms[i][1], posting)
                 score = ranker.evaluate()
                 sieve.sift(score, document_id)
+                statistics.update(documents=1, postings=len(matches))
                 if debug:
                     print("*** MATCH")
                     print("document =", self._corpus[document_id])
-                    print("matches  =", {unique_query_terms[i][0]: all_cursors[i] for i in frontier_cursor_ids})
+                    print("matches  =", {unique_query_terms[i][0]: posting for (i, posting) in matches})
                     print("score    =", score)
 
-            # Move along the cursors on the frontier. The cursors not on the frontier remain where they
-            # are. We may or may not reach the end of some posting lists when we advance, so the set of
-            # remaining non-exhausted lists might shrink.
-            for i in frontier_cursor_ids:
-                all_cursors[i] = next(posting_lists[i], None)
-            remaining_cursor_ids = [i for i in range(len(all_cursors)) if all_cursors[i]]
+            # Move along the cursors on the frontier, as a batch. The other cursors remain where they are. We
+            # may or may not reach the end of some posting lists when we advance, and the exhausted lists are
+            # not put back into the priority queue.
+            for (i, _) in matches:
+                posting = next(posting_lists[i], None)
+                if posting:
+                    heapq.heappush(frontier, (posting.document_id, i, posting))
+            if budget is not None and not budget.spend(len(matches)):
+                break
+
+    def _evaluate_wand(self, unique_query_terms: List[Tuple[str, int]], required_minimum: int,
+                       restriction: Optional[Callable[[int], bool]], ranker: Ranker, sieve: Sieve, debug: bool,
+                       statistics: Counter, budget: Optional[Budget] = None) -> bool:
+        """
+        Does document-at-a-time traversal of the posting lists using the WAND ("weak AND") algorithm, sifting
+        the matching documents through the sieve. Returns False if the ranker or the inverted index doesn't
+        support this, in which case nothing has been done. Stops early if the budget is exhausted.
+
+        Each query term has an upper bound on how much it can contribute to a document's score. Once the sieve
+        is full, a document can only make it into the sieve if its score exceeds the sieve's threshold. Sort
+        the cursors by their current document identifiers, and accumulate the upper bounds in that order. The
+        first cursor where the accumulated upper bound exceeds the threshold, and where enough cursors have
+        been passed to satisfy the N-of-M requirement, is the "pivot". No document before the pivot's current
+        document can make it into the sieve, so the cursors before the pivot can skip ahead to the pivot's
+        document. When the first cursor arrives at the pivot's document, that document gets fully scored.
+
+        Documents are scored in ascending order by their identifiers, and the skipped documents are exactly
+        those that wouldn't have made it into the sieve anyway. So the results are the same as for exhaustive
+        document-at-a-time traversal, ties included.
+        """
+
+        # Open cursors, and find the upper bounds.
+        opened = self._open_bounded_cursors(unique_query_terms, ranker)
+        if opened is None:
+            return False
+        (remaining, terms, upper_bounds, static_upper_bound) = opened
+
+        while len(remaining) >= required_minimum:
+
+            # Find the pivot. If there is none, no remaining document can make it into the sieve.
+            remaining.sort(key=lambda c: c.current.document_id)
+            threshold = sieve.threshold()
+            accumulated = static_upper_bound
+            pivot = None
+            for (i, cursor) in enumerate(remaining):
+                accumulated += upper_bounds[id(cursor)]
+                if i + 1 >= required_minimum and (threshold is None or accumulated > threshold):
+                    pivot = i
+                    break
+            if pivot is None:
+                break
+            document_id = remaining[pivot].current.document_id
+
+            # Either score the pivot's document, or move the lagging cursors up to it.
+            if remaining[0].current.document_id == document_id:
+                frontier = [cursor for cursor in remaining if cursor.current.document_id == document_id]
+                if len(frontier) >= required_minimum and (restriction is None or restriction(document_id)):
+                    self._score_document(document_id, frontier, terms, ranker, sieve, debug, statistics)
+                for cursor in frontier:
+                    next(cursor, None)
+                moved = len(frontier)
+            else:
+                for cursor in remaining[:pivot]:
+                    cursor.skip_to(document_id)
+                moved = pivot
+            remaining = [cursor for cursor in remaining if cursor.current is not None]
+            if budget is not None and not budget.spend(moved):
+                break
+        return True
+
+    def _evaluate_maxscore(self, unique_query_terms: List[Tuple[str, int]], required_minimum: int,
+                           restriction: Optional[Callable[[int], bool]], ranker: Ranker, sieve: Sieve, debug: bool,
+                           statistics: Counter, budget: Optional[Budget] = None) -> bool:
+        """
+        Does document-at-a-time traversal of the posting lists using the MaxScore algorithm, sifting the
+        matching documents through the sieve. Returns False if the ranker or the inverted index doesn't
+        support this, in which case nothing has been done. Stops early if the budget is exhausted.
+
+        Each query term has an upper bound on how much it can contribute to a document's score. Order the
+        terms by their upper bounds, and accumulate these starting with the smallest. The terms for which the
+        accumulated upper bound doesn't exceed the sieve's threshold are "non-essential": A document that only
+        contains non-essential terms can't make it into the sieve. So only the posting lists of the essential
+        terms drive the traversal, and the posting lists of the non-essential terms are merely probed for the
+        candidate documents. Probing stops as soon as the candidate document can't make it into the sieve. As
+        the threshold grows, more terms become non-essential.
+
+        Documents are scored in ascending order by their identifiers, and the skipped documents are exactly
+        those that wouldn't have made it into the sieve anyway. So the results are the same as for exhaustive
+        document-at-a-time traversal, ties included. This pays off for long queries with many common terms.
+        """
+
+        # Open cursors, and find the upper bounds. Keep the cursors ordered by ascending upper bounds.
+        opened = self._open_bounded_cursors(unique_query_terms, ranker)
+        if opened is None:
+            return False
+        (cursors, terms, upper_bounds, static_upper_bound) = opened
+        cursors.sort(key=lambda c: upper_bounds[id(c)])
+
+        while cursors:
+
+            # Partition the cursors into non-essential and essential ones. The accumulated upper bounds tell
+            # us, for each cursor, how much the cursors before it can contribute at most.
+            threshold = sieve.threshold()
+            accumulated = [static_upper_bound]
+            for cursor in cursors:
+                accumulated.append(accumulated[-1] + upper_bounds[id(cursor)])
+            essential = 0
+            if threshold is not None:
+                while essential < len(cursors) and accumulated[essential + 1] <= threshold:
+                    essential += 1
+            if essential == len(cursors):
+                break
+
+            # The next candidate is the smallest document among the essential cursors.
+            document_id = min(cursor.current.document_id for cursor in cursors[essential:])
+            frontier = [cursor for cursor in cursors[essential:] if cursor.current.document_id == document_id]
+            bound = accumulated[essential] + sum(upper_bounds[id(cursor)] for cursor in frontier)
+
+            # Probe the non-essential cursors, the ones with the largest upper bounds first. Give up as soon
+            # as the document can't get a high enough score or can't contain enough of the query terms.
+            for i in range(essential - 1, -1, -1):
+                if (threshold is not None and bound <= threshold) or len(frontier) + i + 1 < required_minimum:
+                    break
+                posting = cursors[i].skip_to(document_id)
+                if posting is not None and posting.document_id == document_id:
+                    frontier.append(cursors[i])
+                else:
+                    bound -= upper_bounds[id(cursors[i])]
+            else:
+                if len(frontier) >= required_minimum and (restriction is None or restriction(document_id)):
+                    if threshold is None or bound > threshold:
+                        self._score_document(document_id, frontier, terms, ranker, sieve, debug, statistics)
+
+            # Move past the candidate, and forget about the exhausted cursors.
+            for cursor in cursors[essential:]:
+                if cursor.current.document_id == document_id:
+                    next(cursor, None)
+            cursors = [cursor for cursor in cursors if cursor.current is not None]
+            if budget is not None and not budget.spend(len(frontier)):
+                break
+        return True
+
+    def _open_bounded_cursors(self, unique_query_terms: List[Tuple[str, int]], ranker: Ranker) -> \
+            Optional[Tuple[List[PostingCursor], Dict[int, Tuple[int, str, int]], Dict[int, float], float]]:
+        """
+        Opens posting cursors for the query terms, positioned at their first postings, and finds the upper
+        bounds on the score contributions. Returns the non-empty cursors, the (position, term, multiplicity)
+        triples and the upper bounds keyed by the cursors' identities, and the upper bound on the static part
+        of the scores. Returns None if the ranker can't bound the static part of its scores.
+
+        We'd rather use the ranker's cheap upper bounds, but can fall back to the exact largest score
+        contributions as precomputed per block. The bounds are padded slightly, so that rounding errors
+        never cause us to skip a document that should have been scored.
+        """
+        if not ranker.supports("static_upper_bound"):
+            return None
+        static_upper_bound = ranker.static_upper_bound()
+        cursors = [self._inverted_index.get_postings_cursor(term, multiplicity, ranker)
+                   for (term, multiplicity) in unique_query_terms]
+        terms = {id(cursor): (i, term, multiplicity)
+                 for (i, (cursor, (term, multiplicity))) in enumerate(zip(cursors, unique_query_terms))}
+        remaining = [cursor for cursor in cursors if next(cursor, None) is not None]
+        upper_bounds = {}
+        for cursor in remaining:
+            (_, term, multiplicity) = terms[id(cursor)]
+            if ranker.supports("upper_bound"):
+                upper_bound = ranker.upper_bound(term, multiplicity, cursor.max_term_frequency())
+            else:
+                upper_bound = cursor.max_score()
+            upper_bounds[id(cursor)] = upper_bound + self._upper_bound_slack * (1.0 + abs(upper_bound))
+        static_upper_bound += self._upper_bound_slack * (1.0 + abs(static_upper_bound))
+        return remaining, terms, upper_bounds, static_upper_bound
+
+    def _score_document(self, document_id: int, frontier: List[PostingCursor], terms: Dict[int, Tuple[int, str, int]],
+                        ranker: Ranker, sieve: Sieve, debug: bool, statistics: Counter) -> None:
+        """
+        Scores the given document using the postings that the given cursors are positioned at, and sifts
+        it through the sieve. The ranker is fed the postings in query term order, just like for exhaustive
+        document-at-a-time traversal, so that the scores come out exactly the same.
+        """
+        ranker.reset(document_id)
+        for cursor in sorted(frontier, key=lambda c: terms[id(c)][0]):
+            ranker.update(terms[id(cursor)][1], terms[id(cursor)][2], cursor.current)
+        score = ranker.evaluate()
+        sieve.sift(score, document_id)
+        statistics.update(documents=1, postings=len(frontier))
+        if debug:
+            print("*** MATCH")
+            print("document =", self._corpus[document_id])
+            print("score    =", score)
+
+    def _evaluate_term_at_a_time(self, unique_query_terms: List[Tuple[str, int]],
+                                 posting_lists: List[Iterator[Posting]], required_minimum: int,
+                                 ranker: Ranker, sieve: Sieve, debug: bool, statistics: Counter,
+                                 budget: Optional[Budget] = None) -> None:
+        """
+        Does term-at-a-time traversal of the posting lists, sifting the matching documents through the sieve.
+        If the budget is exhausted, we stop accumulating and sift the documents we have partial scores for.
+
+        We process one posting list at a time, accumulating each document's score and how many of the query
+        terms it contains. This relies on the ranker's score contributions being additive. The query-independent
+        part of the score is added in the end, for the documents that contain enough of the query terms.
+
+        If we expect many documents to be touched, we keep the accumulators in dense NumPy arrays indexed by
+        document identifiers. Otherwise, we keep them in a sparse dictionary.
+        """
+        postings = sum(self._inverted_index.get_document_frequency(term) for (term, _) in unique_query_terms)
+        accumulate = self._accumulate_dense if np is not None and postings * 8 >= self._corpus.size() else \
+            self._accumulate_sparse
+        candidates = accumulate(unique_query_terms, posting_lists, required_minimum, ranker, statistics, budget)
+
+        # Add the query-independent part of the scores, and sift the candidates through the sieve. The candidates
+        # are sifted in ascending order by document identifiers, same as for document-at-a-time traversal.
+        for (document_id, score) in candidates:
+            ranker.reset(document_id)
+            score += ranker.evaluate()
+            sieve.sift(score, document_id)
+            statistics.update(documents=1)
+            if debug:
+                print("*** MATCH")
+                print("document =", self._corpus[document_id])
+                print("score    =", score)
+
+    @staticmethod
+    def _accumulate_sparse(unique_query_terms: List[Tuple[str, int]], posting_lists: List[Iterator[Posting]],
+                           required_minimum: int, ranker: Ranker, statistics: Counter,
+                           budget: Optional[Budget] = None) -> List[Tuple[int, float]]:
+        """
+        Accumulates scores and match counts in a dictionary. Returns the (document identifier, score) pairs
+        for the documents that contain enough of the query terms.
+        """
+        accumulators = {}
+        for ((term, multiplicity), postings) in zip(unique_query_terms, posting_lists):
+            for posting in postings:
+                accumulator = accumulators.setdefault(posting.document_id, [0.0, 0])
+                accumulator[0] += ranker.contribution(term, multiplicity, posting)
+                accumulator[1] += 1
+                statistics.update(postings=1)
+                if budget is not None and not budget.spend():
+                    break
+            if budget is not None and budget.exhausted:
+                break
+        return sorted((d, a[0]) for (d, a) in accumulators.items() if a[1] >= required_minimum)
+
+    def _accumulate_dense(self, unique_query_terms: List[Tuple[str, int]], posting_lists: List[Iterator[Posting]],
+                          required_minimum: int, ranker: Ranker, statistics: Counter,
+                          budget: Optional[Budget] = None) -> List[Tuple[int, float]]:
+        """
+        Accumulates scores and match counts in dense NumPy arrays. Returns the (document identifier, score)
+        pairs for the documents that contain enough of the query terms.
+        """
+        scores = np.zeros(self._corpus.size())
+        counts = np.zeros(self._corpus.size(), dtype=np.int32)
+        for ((term, multiplicity), postings) in zip(unique_query_terms, posting_lists):
+            document_ids = array("l")
+            contributions = array("d")
+            for posting in postings:
+                document_ids.append(posting.document_id)
+                contributions.append(ranker.contribution(term, multiplicity, posting))
+                if budget is not None and not budget.spend():
+                    break
+            statistics.update(postings=len(document_ids))
+            document_ids = np.frombuffer(document_ids, dtype="l")
+            scores[document_ids] += np.frombuffer(contributions, dtype="d")
+            counts[document_ids] += 1
+            if budget is not None and budget.exhausted:
+                break
+        candidates = np.flatnonzero(counts >= required_minimum)
+        return [(int(d), float(s)) for (d, s) in zip(candidates, scores[candidates])]
+
+
+class ImpactOrderedSearchEngine:
+    """
+    A search engine that does score-at-a-time traversal over an impact-ordered inverted index,
+    suitable for short queries where only the top few documents are wanted.
+
+    The impact bands of all query terms are processed in order of descending impact, adding the
+    impacts to per-document accumulators. Since the impacts only get smaller as we go along, we can
+    stop as soon as the remaining impacts can no longer change which documents make up the top K.
+    """
+
+    def __init__(self, corpus: Corpus, impact_index: ImpactOrderedInvertedIndex):
+        self._corpus = corpus
+        self._impact_index = impact_index
+
+    def evaluate(self, query: str, options: dict, callback: Callable[[dict], Any]) -> dict:
+        """
+        Evaluates the given query, doing ranked retrieval where a document is considered to be a match
+        if it contains any of the query terms. The relevancy score of a document is the sum of the
+        impacts of the query terms it contains, mapped back to the scale of the ranker that the impacts
+        were computed from.
+
+        The client can supply a dictionary of options that controls this query evaluation process: The
+        maximum number of documents to return to the client is controlled via the "hit_count" (int) option.
+
+        The callback function supplied by the client will receive a dictionary having the keys "score" (float)
+        and "document" (Document).
+
+        Returns a dictionary of statistics about the evaluation: How many impact bands there were and how many
+        of these were processed before stopping, how many postings were accumulated, and how many seconds the
+        evaluation took.
+        """
+
+        # Print verbose debug information?
+        debug = options.get("debug", False)
+        start = timer()
+
+        # Produce the query terms and their impact bands. A query term that occurs multiple times in the
+        # query has impact bands of its own.
+        query_terms = Counter(self._impact_index.get_terms(query))
+        all_bands = [self._impact_index.get_impact_bands(term, count) for (term, count) in query_terms.items()]
+
+        # Merge the impact bands across all query terms, so that we can process these in order of
+        # descending impact. Keep track of where we are in each term's list of impact bands, so that we
+        # know the largest impact that each term can still contribute.
+        segments = sorted(((bands[j][0], i, j) for (i, bands) in enumerate(all_bands) for j in range(len(bands))),
+                          key=lambda segment: segment[0], reverse=True)
+        remaining = [bands[0][0] if bands else 0 for bands in all_bands]
+        processed = [0 for _ in all_bands]
+
+        # Process the bands, accumulating scores as we go along. A document occurs in at most one band per
+        # term, so we also keep track of which terms we've seen each document for, as a bit mask.
+        hit_count = max(1, min(100, options.get("hit_count", 10)))
+        accumulators = {}
+        seen = {}
+        largest = 0
+        postings = 0
+        for (position, (impact, i, j)) in enumerate(segments, 1):
+            postings += len(all_bands[i][j][1])
+            for document_id in all_bands[i][j][1]:
+                if self._impact_index.is_deleted(document_id):
+                    continue
+                score = accumulators.get(document_id, 0) + impact
+                accumulators[document_id] = score
+                seen[document_id] = seen.get(document_id, 0) | (1 << i)
+                largest = max(largest, score)
+            processed[i] = j + 1
+            remaining[i] = all_bands[i][j + 1][0] if j + 1 < len(all_bands[i]) else 0
+
+            # Can we stop early? Not if there's nothing left to process. Otherwise, a document we haven't seen
+            # yet can at most score the sum of the remaining impacts. Checking is linear in the number of
+            # accumulators, so don't bother checking until there's a chance that we can stop.
+            bound = sum(remaining)
+            if position == len(segments) or bound > largest or len(accumulators) < hit_count:
+                continue
+            if self._is_top_settled(accumulators, seen, remaining, hit_count):
+                if debug:
+                    print("*** STOPPING EARLY", {"processed": sum(processed), "total": len(segments)})
+                break
+
+        # We now know which documents make up the top K, but not necessarily their final scores. Complete
+        # their scores by probing the unprocessed bands. The document identifiers within each band are sorted.
+        winners = heapq.nlargest(hit_count, accumulators.items(), key=lambda item: item[1])
+        sieve = Sieve(hit_count)
+        for (document_id, score) in winners:
+            for (i, bands) in enumerate(all_bands):
+                for (impact, document_ids) in bands[processed[i]:]:
+                    where = bisect.bisect_left(document_ids, document_id)
+                    if where < len(document_ids) and document_ids[where] == document_id:
+                        score += impact
+                        break
+            sieve.sift(score, document_id)
 
         # Alert the client about the best-matching documents, using the supplied callback function.
-        # Emit documents sorted accoring to their relevancy scores.
         for (score, document_id) in sieve.winners():
-            callback({"score": score, "document": self._corpus[document_id]})
+            callback({"score": self._impact_index.dequantize(score), "document": self._corpus[document_id]})
+        return {"bands": len(segments), "bands_processed": sum(processed), "postings_scored": postings,
+                "elapsed": timer() - start}
+
+    @staticmethod
+    def _is_top_settled(accumulators: dict, seen: dict, remaining: List[int], hit_count: int) -> bool:
+        """
+        Checks if the remaining impacts can no longer change which documents make up the top K. The documents
+        having the K largest scores so far can only gain, while any other document can at most gain the remaining
+        impacts of the terms we haven't seen it for. A document that can at most tie with the top K doesn't make
+        it, since ties are broken arbitrarily anyway.
+        """
+        best = heapq.nlargest(hit_count, accumulators.items(), key=lambda item: item[1])
+        kth = best[-1][1]
+        if sum(remaining) > kth:
+            return False
+        members = {document_id for (document_id, _) in best}
+        bounds = {}
+        for (document_id, score) in accumulators.items():
+            mask = seen[document_id]
+            bound = bounds.get(mask, None)
+            if bound is None:
+                bound = bounds[mask] = sum(r for (i, r) in enumerate(remaining) if not mask & (1 << i))
+            if score + bound > kth and document_id not in members:
+                return False
+        return True
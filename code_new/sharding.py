@@ -0,0 +1,247 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+from collections import Counter
+from timeit import default_timer as timer
+from corpus import Document, Corpus
+from invertedindex import Posting, PostingCursor, InvertedIndex, InMemoryInvertedIndex
+from normalization import Normalizer
+from tokenization import Tokenizer
+from ranking import Ranker, BetterRanker
+from searchengine import SimpleSearchEngine
+from utilities import Sieve, PageSieve
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+
+class ShardCorpus(Corpus):
+    """
+    The part of a bigger corpus that an index shard covers. Documents keep their identifiers from the
+    bigger corpus, and the reported size is the size of the bigger corpus. Rankers that use the corpus
+    size for, e.g., IDF weighting thus behave as if they were ranking against the bigger corpus.
+    """
+
+    def __init__(self, documents: Iterable[Document], size: int):
+        self._documents = {document.document_id: document for document in documents}
+        self._size = size
+
+    def __iter__(self):
+        return (self._documents[document_id] for document_id in sorted(self._documents))
+
+    def size(self) -> int:
+        return self._size
+
+    def get_document(self, document_id: int) -> Document:
+        return self._documents[document_id]
+
+
+class GlobalStatisticsInvertedIndex(InvertedIndex):
+    """
+    An index shard that reports collection statistics for the whole collection rather than for the
+    shard, i.e., the document frequencies and the average document lengths. Rankers thus score the
+    shard's documents exactly as they would have been scored using an unsharded index.
+
+    Lookups that don't concern the collection statistics are delegated to the shard's inverted index.
+    Precomputed vector space norms are those of the shard.
+    """
+
+    def __init__(self, inverted_index: InvertedIndex, document_frequencies: Dict[str, int],
+                 average_document_lengths: Dict[Optional[str], float]):
+        self._inverted_index = inverted_index
+        self._document_frequencies = document_frequencies
+        self._average_document_lengths = average_document_lengths
+
+    def supports(self, capability: str) -> bool:
+        # The shard is meant for searching, and deletions would skew the global statistics.
+        if capability == "delete_document":
+            return False
+        return capability == "get_average_document_length" or self._inverted_index.supports(capability)
+
+    def get_terms(self, buffer: str) -> Iterator[str]:
+        return self._inverted_index.get_terms(buffer)
+
+    def get_postings_iterator(self, term: str) -> Iterator[Posting]:
+        return self._inverted_index.get_postings_iterator(term)
+
+    def get_postings_cursor(self, term: str, multiplicity: int = 1, ranker: Optional[Ranker] = None) -> PostingCursor:
+        return self._inverted_index.get_postings_cursor(term, multiplicity, ranker)
+
+    def get_document_ids(self, term: str):
+        return self._inverted_index.get_document_ids(term)
+
+    def get_document_frequency(self, term: str) -> int:
+        return self._document_frequencies.get(term, 0)
+
+    def get_vocabulary(self) -> Iterator[str]:
+        return self._inverted_index.get_vocabulary()
+
+    def get_document_length(self, document_id: int, field: Optional[str] = None) -> int:
+        return self._inverted_index.get_document_length(document_id, field)
+
+    def get_average_document_length(self, field: Optional[str] = None) -> float:
+        return self._average_document_lengths[field]
+
+    def get_document_norm(self, document_id: int) -> float:
+        return self._inverted_index.get_document_norm(document_id)
+
+    def is_deleted(self, document_id: int) -> bool:
+        return self._inverted_index.is_deleted(document_id)
+
+    def get_version(self) -> int:
+        return self._inverted_index.get_version()
+
+
+def _serve(connection: Any, documents: List[Document], size: int, fields: List[str], normalizer: Normalizer,
+           tokenizer: Tokenizer, ranker: Callable[[Corpus, InvertedIndex], Ranker]) -> None:
+    """
+    The main loop of a worker process that holds an index shard. Receives commands over the given
+    connection, and sends back the results. Exceptions are sent back, too.
+    """
+    corpus = ShardCorpus(documents, size)
+    index = InMemoryInvertedIndex(corpus, fields, normalizer, tokenizer)
+    engine = None
+    shard_ranker = None
+    while True:
+        (command, arguments) = connection.recv()
+        try:
+            if command == "statistics":
+                result = ({term: index.get_document_frequency(term) for term in index.get_vocabulary()},
+                          len(documents),
+                          {field: sum(index.get_document_length(d.document_id, field) for d in documents)
+                           for field in fields})
+            elif command == "install":
+                global_index = GlobalStatisticsInvertedIndex(index, *arguments)
+                engine = SimpleSearchEngine(corpus, global_index)
+                shard_ranker = ranker(corpus, global_index)
+                result = None
+            elif command == "evaluate":
+                (query, options) = arguments
+                matches = []
+                statistics = engine.evaluate(query, options, shard_ranker,
+                                             lambda m: matches.append((m["score"], m["document"].document_id)))
+                result = (matches, statistics)
+            elif command == "close":
+                connection.send((True, None))
+                break
+            else:
+                raise ValueError(f"Unknown command: {command!r}")
+            connection.send((True, result))
+        except Exception as e:
+            connection.send((False, e))
+    connection.close()
+
+
+class ShardedSearchEngine:
+    """
+    A search engine that partitions the documents of a corpus across a number of index shards, each held
+    by its own worker process. This lets us index corpora that don't fit in the memory of one process, and
+    evaluate queries using several cores.
+
+    A query is broadcast to all shards. Each shard evaluates the query as a SimpleSearchEngine would, using
+    its own sieve, and sends back its local top results. The local top results are merged into the global
+    top results. Every global top result is among the local top results of its shard, so this gives the
+    same results as an unsharded index would, as long as documents are scored in the same way. As always,
+    ties are resolved arbitrarily.
+
+    So collection statistics are aggregated across the shards when the shards are built: Each shard reports
+    its document frequencies and document lengths, and is then told the global document frequencies, the
+    global average document lengths, and the size of the whole corpus. Rankers such as the BetterRanker then
+    produce identical scores as they would for an unsharded index.
+
+    A shard's ranker is created in the worker process, by invoking the supplied ranker factory with the
+    shard's corpus and inverted index. Documents are assigned to shards in a round-robin fashion.
+    """
+
+    def __init__(self, corpus: Corpus, fields: Iterable[str], normalizer: Normalizer, tokenizer: Tokenizer,
+                 shards: int = 4, ranker: Callable[[Corpus, InvertedIndex], Ranker] = BetterRanker):
+        assert shards > 0
+        self._corpus = corpus
+        self._connections = []
+        self._processes = []
+        fields = list(fields)
+        partitions = [[] for _ in range(shards)]
+        for document in corpus:
+            partitions[document.document_id % shards].append(document)
+        for documents in partitions:
+            (local, remote) = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve, daemon=True,
+                                              args=(remote, documents, corpus.size(), fields, normalizer,
+                                                    tokenizer, ranker))
+            process.start()
+            remote.close()
+            self._connections.append(local)
+            self._processes.append(process)
+        self._install_global_statistics(fields)
+
+    def __enter__(self) -> "ShardedSearchEngine":
+        return self
+
+    def __exit__(self, *exception: Any) -> None:
+        self.close()
+
+    def _broadcast(self, command: str, arguments: Any) -> List[Any]:
+        # Send the command to all shards before waiting for any of them, so that they work in parallel.
+        for connection in self._connections:
+            connection.send((command, arguments))
+        replies = [connection.recv() for connection in self._connections]
+        for (succeeded, result) in replies:
+            if not succeeded:
+                raise result
+        return [result for (_, result) in replies]
+
+    def _install_global_statistics(self, fields: List[str]) -> None:
+        document_frequencies = Counter()
+        document_count = 0
+        total_lengths = Counter()
+        for (frequencies, count, lengths) in self._broadcast("statistics", None):
+            document_frequencies.update(frequencies)
+            document_count += count
+            total_lengths.update(lengths)
+        average_document_lengths = {field: total_lengths[field] / max(1, document_count) for field in fields}
+        average_document_lengths[None] = sum(total_lengths[field] for field in fields) / max(1, document_count)
+        self._broadcast("install", (dict(document_frequencies), average_document_lengths))
+
+    def close(self) -> None:
+        """
+        Shuts down the worker processes.
+        """
+        if self._connections:
+            self._broadcast("close", None)
+            for process in self._processes:
+                process.join()
+            self._connections = []
+            self._processes = []
+
+    def evaluate(self, query: str, options: dict, callback: Callable[[dict], Any]) -> dict:
+        """
+        Evaluates the given query across all shards, using the shards' rankers. The options are as for the
+        SimpleSearchEngine, and are passed on to each shard. When paging, each shard returns its part of the
+        requested page, and these are merged into the page.
+
+        The callback function supplied by the client will receive a dictionary having the keys "score" (float)
+        and "document" (Document).
+
+        Returns a dictionary of statistics about the evaluation: How many shards were involved, how many documents
+        and postings were scored in total, how many seconds the evaluation took, and whether any shard ran out of
+        budget and returned partial results. When paging, the cursor for the next page is returned, too.
+        """
+        start = timer()
+        replies = self._broadcast("evaluate", (query, options))
+
+        # Merge the local top results. Sift in ascending order by document identifiers, same as for traversal
+        # of an unsharded index.
+        hit_count = max(1, min(100, options.get("hit_count", 10)))
+        paging = "search_after" in options
+        sieve = PageSieve(hit_count, options["search_after"]) if paging else Sieve(hit_count)
+        for (score, document_id) in sorted(((s, d) for (matches, _) in replies for (s, d) in matches),
+                                           key=lambda match: match[1]):
+            sieve.sift(score, document_id)
+        winners = list(sieve.winners())
+        for (score, document_id) in winners:
+            callback({"score": score, "document": self._corpus[document_id]})
+        return {"shards": len(replies),
+                "documents_scored": sum(statistics["documents_scored"] for (_, statistics) in replies),
+                "postings_scored": sum(statistics["postings_scored"] for (_, statistics) in replies),
+                "elapsed": timer() - start,
+                "partial": any(statistics["partial"] for (_, statistics) in replies),
+                "cursor": PageSieve.encode(*winners[-1]) if paging and len(winners) == hit_count else None}
@@ -3,8 +3,8 @@
 
 import itertools
 from collections import Counter
-from utilities import Sieve, apply
-from corpus import Corpus
+from utilities import Sieve, BitSet, apply, deep_sizeof
+from corpus import Corpus, Document
 from normalization import Normalizer
 from tokenization import Tokenizer
 from typing import Callable, Any, Iterable, Tuple
@@ -17,17 +17,22 @@ class SuffixArray:
 
     In a serious application we'd make use of least common prefixes (LCPs), pay more attention
     to memory usage, and add more lookup/evaluation features.
+
+    Deleted documents are marked in a bitset of "tombstones" and are never admitted as matches.
+    Their suffixes are physically purged when the suffix array is compacted.
     """
 
     def __init__(self, corpus: Corpus, fields: Iterable[str], normalizer: Normalizer, tokenizer: Tokenizer):
         self._corpus = corpus
+        self._fields = list(fields)
         self._haystack = []
         self._suffixes = []
         self._normalizer = normalizer
         self._tokenizer = tokenizer
-        self._build_suffix_array(fields)
+        self._deleted = BitSet()
+        self._build_suffix_array()
 
-    def _build_suffix_array(self, fields: Iterable[str]) -> None:
+    def _build_suffix_array(self) -> None:
         """
         Builds a simple suffix array from the set of named fields in the document collection.
         The suffix array allows us to search across all named fields in one go.
@@ -35,8 +40,7 @@ class SuffixArray:
 
         # We allow searching across multiple document fields simultaneously, so join the named fields
         # to produce the haystack that we'll search for needles in. Avoid cross-field matches.
-        self._haystack = [(d.document_id, " \0 ".join([self._normalize(d.get_field(f, "")) for f in fields]))
-                          for d in self._corpus]
+        self._haystack = [(d.document_id, self._join_fields(d)) for d in self._corpus]
 
         # We don't actually store all suffixes, instead we store (index, offset) pairs which allows us
         # to generate the suffixes if/when we need them: The index identifies the document, and the
@@ -46,6 +50,12 @@ class SuffixArray:
                           for r in self._tokenizer.ranges(self._haystack[i][1])]
         self._suffixes.sort(key=lambda t: self._get_suffix2(t))
 
+    def _join_fields(self, document: Document) -> str:
+        """
+        Produces the normalized haystack entry for the given document, avoiding cross-field matches.
+        """
+        return " \0 ".join([self._normalize(document.get_field(f, "")) for f in self._fields])
+
     def _normalize(self, buffer: str) -> str:
         """
         Produces a normalized version of the given string. Both queries and documents need to be
@@ -89,12 +99,76 @@ class SuffixArray:
                 right = middle
         return left
 
-    def _emit_match(self, index: int, score: float, callback: Callable[[dict], Any]) -> None:
+    def _emit_match(self, document_id: int, score: float, callback: Callable[[dict], Any]) -> None:
+        """
+        Given the identifier of a matching document, emits the complete and original document (and its
+        associated relevancy score) back to the client via the supplied callback.
+        """
+        callback({"score": score, "document": self._corpus[document_id]})
+
+    def add_document(self, document: Document) -> None:
+        """
+        Adds a new document to the suffix array. The document's suffixes are sorted, located in the
+        suffix array using binary search, and then merged into the suffix array in a single pass.
+        """
+        index = len(self._haystack)
+        self._haystack.append((document.document_id, self._join_fields(document)))
+        additions = sorted(((index, r[0]) for r in self._tokenizer.ranges(self._haystack[index][1])),
+                           key=self._get_suffix2)
+
+        # The additions are sorted, so their insertion points in the current suffix array are, too. Copy
+        # the runs of existing suffixes between the insertion points, rather than inserting one by one.
+        suffixes = []
+        start = 0
+        for pair in additions:
+            position = self._binary_search(self._get_suffix2(pair))
+            suffixes.extend(self._suffixes[start:position])
+            suffixes.append(pair)
+            start = position
+        suffixes.extend(self._suffixes[start:])
+        self._suffixes = suffixes
+
+    def update_document(self, document_id: int, document: Document) -> None:
+        """
+        Replaces an existing document with a new version of it, i.e., deletes the old version and adds
+        the new one.
+        """
+        self.delete_document(document_id)
+        self.add_document(document)
+
+    def delete_document(self, document_id: int) -> None:
+        """
+        Marks the given document as deleted. Its suffixes are left untouched until compaction.
+        """
+        self._deleted.add(document_id)
+
+    def compact(self) -> None:
+        """
+        Physically purges the suffixes of all deleted documents. The relative order of the
+        remaining suffixes is unchanged, so no re-sorting is needed.
+        """
+        if not self._deleted:
+            return
+        remapped = {}
+        haystack = []
+        for (index, (document_id, buffer)) in enumerate(self._haystack):
+            if document_id not in self._deleted:
+                remapped[index] = len(haystack)
+                haystack.append((document_id, buffer))
+        self._haystack = haystack
+        self._suffixes = [(remapped[index], offset) for (index, offset) in self._suffixes if index in remapped]
+
+    def stats(self) -> dict:
         """
-        Given an index that identifies a matching document in the haystack, emits the complete and original
-        document (and its associated relevancy score) back to the client via the supplied callback.
+        Reports the number of documents and suffixes in the suffix array, and roughly how many
+        bytes its structures occupy in memory.
         """
-        callback({"score": score, "document": self._corpus[self._haystack[index][0]]})
+        return {"documents": len(self._haystack),
+                "suffixes": len(self._suffixes),
+                "deleted": len(self._deleted),
+                "bytes": {"haystack": deep_sizeof(self._haystack),
+                          "suffixes": deep_sizeof(self._suffixes),
+                          "tombstones": deep_sizeof(self._deleted)}}
 
     def evaluate(self, query: str, options: dict, callback: Callable[[dict], Any]) -> None:
         """
@@ -135,13 +209,14 @@ class SuffixArray:
         matches = itertools.takewhile(_is_match, range(where_start, len(self._suffixes)))
 
         # Deduplicate. A document in the haystack might contain multiple occurrences of the needle.
-        # Rank according to occurrence count, and emit in ranked order.
+        # Rank according to occurrence count, and emit in ranked order. Deleted documents are not
+        # admitted through the sieve.
         if matches:
             debug = options.get("debug", False)
             pairs = [self._suffixes[i] for i in matches]
             if debug:
                 apply(lambda p: print("*** MATCH", p, self._get_suffix2(p)), pairs)
-            counter = Counter([i for (i, _) in pairs])
-            sieve = Sieve(max(1, min(100, options.get("hit_count", 10))))
+            counter = Counter([self._haystack[i][0] for (i, _) in pairs])
+            sieve = Sieve(max(1, min(100, options.get("hit_count", 10))), self._deleted)
             apply(lambda t: sieve.sift(t[1], t[0]), counter.items())
             apply(lambda w: self._emit_match(w[1], w[0], callback), sieve.winners())
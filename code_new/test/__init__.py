@@ -18,6 +18,12 @@ def run_all_tests():
     runner.run(suite)
 
 
+def print_stats(stats):
+    import pprint
+    print("Statistics:")
+    pprint.PrettyPrinter().pprint(stats)
+
+
 def simple_repl(prompt, evaluator):
     from timeit import default_timer as timer
     import pprint
@@ -0,0 +1,49 @@
+from test import data_path
+
+def main():
+    import os.path
+    import sys
+    import functools
+    import timeit
+    from normalization import BrainDeadNormalizer
+    from tokenization import BrainDeadTokenizer
+    from corpus import InMemoryCorpus
+    from invertedindex import InMemoryInvertedIndex
+    from traversal import PostingsMerger
+
+    print("Building inverted index from English corpus...")
+    corpus = InMemoryCorpus(os.path.join(data_path, 'en.txt'))
+    index = InMemoryInvertedIndex(corpus, ["body"], BrainDeadNormalizer(), BrainDeadTokenizer())
+    merger = PostingsMerger()
+    queries = ["the of", "the of and", "the of and a in", "king of the world", "the united states of america",
+               "war and peace", "the history of the city of london", "he was born in the year"]
+
+    def pairwise(terms):
+        return [p.document_id for p in functools.reduce(merger.intersection, (index[t] for t in terms))]
+
+    def adaptive(terms):
+        return list(merger.intersection_of_many([index.get_document_ids(t) for t in terms]))
+
+    def vectorized(terms):
+        return adaptive(terms)
+
+    def timed(f, terms):
+        # Only the vectorized variant is allowed to use NumPy.
+        threshold = PostingsMerger._vectorization_threshold
+        PostingsMerger._vectorization_threshold = threshold if f is vectorized else sys.maxsize
+        try:
+            return 1000.0 * min(timeit.repeat(lambda: f(terms), number=1, repeat=10))
+        finally:
+            PostingsMerger._vectorization_threshold = threshold
+
+    print("Comparing chained pairwise intersections against adaptive n-ary intersection, in milliseconds.")
+    for query in queries:
+        terms = list(set(index.get_terms(query)))
+        assert pairwise(terms) == adaptive(terms)
+        timings = {f.__name__: timed(f, terms) for f in (pairwise, adaptive, vectorized)}
+        print(f"{query!r:40} {len(pairwise(terms)):6} matches",
+              " ".join(f"{name}={timing:.3f}" for (name, timing) in timings.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-from test import simple_repl, data_path
+from test import simple_repl, print_stats, data_path
 
 def main():
     import os.path
@@ -12,6 +12,7 @@ def main():
     tokenizer = BrainDeadTokenizer()
     corpus = InMemoryCorpus(os.path.join(data_path, 'cran.xml'))
     index = InMemoryInvertedIndex(corpus, ["body"], normalizer, tokenizer)
+    print_stats(index.stats())
     print("Enter one or more index terms and inspect their posting lists.")
 
     def evaluator(terms):
@@ -0,0 +1,78 @@
+import unittest
+from test import data_path
+
+class TestBooleanQueryParser(unittest.TestCase):
+    def setUp(self):
+        import os.path
+        from normalization import BrainDeadNormalizer
+        from tokenization import BrainDeadTokenizer
+        from corpus import InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from traversal import BooleanQueryParser, QueryPlanner
+        self._corpus = InMemoryCorpus(os.path.join(data_path, 'mesh.txt'))
+        self._index = InMemoryInvertedIndex(self._corpus, ["body"], BrainDeadNormalizer(), BrainDeadTokenizer())
+        self._parser = BooleanQueryParser(self._index)
+        self._planner = QueryPlanner(self._index, self._corpus.size())
+
+    def _documents(self, term):
+        return {p.document_id for p in self._index[term]}
+
+    def test_parse(self):
+        self.assertEqual(repr(self._parser.parse("water")), "water")
+        self.assertEqual(repr(self._parser.parse("Water polluTION")), "AND(water, pollution)")
+        self.assertEqual(repr(self._parser.parse("water OR toxic AND acid")), "OR(water, AND(toxic, acid))")
+        self.assertEqual(repr(self._parser.parse("(water OR toxic) AND NOT acid")), "AND(OR(water, toxic), NOT(acid))")
+        self.assertEqual(repr(self._parser.parse('"water pollution" or')), 'AND("water pollution", or)')
+        self.assertEqual(repr(self._parser.parse('water - NOT & pollution OR ("")')), "AND(water, pollution)")
+        for query in ("(water", "water)", "AND water", "water OR", '"water', "NOT", "()"):
+            with self.assertRaises(ValueError):
+                self._parser.parse(query)
+
+    def test_plan(self):
+        def plan(query):
+            return repr(self._planner.plan(self._parser.parse(query)))
+        self.assertEqual(plan("water pollution"), "AND(pollution, water)")
+        self.assertEqual(plan("water AND NOT pollution AND NOT toxic"), "AND NOT(water, OR(pollution, toxic))")
+        self.assertEqual(plan("NOT water"), "AND NOT(ALL, water)")
+        self.assertEqual(plan("NOT NOT water"), "water")
+        self.assertEqual(plan("NOT (water OR NOT toxic)"), "AND NOT(toxic, water)")
+        self.assertEqual(plan("acid AND (water AND NOT toxic)"), "AND NOT(AND(water, acid), toxic)")
+        self.assertEqual(plan("water OR (toxic OR acid)"), "OR(water, toxic, acid)")
+        explanation = self._planner.plan(self._parser.parse("water AND NOT pollution")).explain(self._index)
+        self.assertListEqual(explanation.split("\n"), ["AND NOT (estimate: 21)",
+                                                       "  TERM water (estimate: 21)",
+                                                       "  TERM pollution (estimate: 8)"])
+
+    def test_evaluate(self):
+        water = self._documents("water")
+        pollution = self._documents("pollution")
+        toxic = self._documents("toxic")
+        acid = self._documents("acid")
+        everything = set(range(self._corpus.size()))
+        mixed = (water | toxic) & acid - pollution
+        for (query, expected) in (("water pollution", water & pollution),
+                                  ("water OR toxic OR wtf", water | toxic),
+                                  ("water AND NOT pollution", water - pollution),
+                                  ("NOT water", everything - water),
+                                  ("(water OR toxic) AND NOT (pollution OR NOT acid)", mixed),
+                                  ("water OR NOT acid", water | (everything - acid)),
+                                  ("wtf", set()),
+                                  ("NOT wtf", everything),
+                                  ("water - pollution", water & pollution),
+                                  ("water & pollution OR -", water & pollution),
+                                  ('water AND NOT "-"', water),
+                                  ("-", set())):
+            plan = self._planner.plan(self._parser.parse(query))
+            self.assertListEqual(list(plan.evaluate(self._index)), sorted(expected))
+
+    def test_deleted_documents(self):
+        water = self._documents("water")
+        self._index.delete_document(min(water))
+        plan = self._planner.plan(self._parser.parse("NOT pollution"))
+        self.assertNotIn(min(water), set(plan.evaluate(self._index)))
+        plan = self._planner.plan(self._parser.parse("water"))
+        self.assertListEqual(list(plan.evaluate(self._index)), sorted(water)[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
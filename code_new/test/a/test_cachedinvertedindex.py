@@ -0,0 +1,59 @@
+import unittest
+from test import data_path
+
+class TestCachedInvertedIndex(unittest.TestCase):
+    def setUp(self):
+        from normalization import BrainDeadNormalizer
+        from tokenization import BrainDeadTokenizer
+        self._normalizer = BrainDeadNormalizer()
+        self._tokenizer = BrainDeadTokenizer()
+
+    def test_access_postings(self):
+        import os.path
+        from corpus import InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from cachedindex import CachedInvertedIndex
+        corpus = InMemoryCorpus(os.path.join(data_path, 'mesh.txt'))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+        cached = CachedInvertedIndex(index, 1 << 16)
+        for term in ["of", "the", "water", "wtf", "of", "the", "water", "wtf"]:
+            self.assertListEqual([(p.document_id, p.term_frequency) for p in cached[term]],
+                                 [(p.document_id, p.term_frequency) for p in index[term]])
+            self.assertListEqual(list(cached.get_document_ids(term)), [p.document_id for p in index[term]])
+            self.assertEqual(cached.get_document_frequency(term), index.get_document_frequency(term))
+        stats = cached.stats()
+        self.assertGreater(stats["hits"], 0)
+        self.assertGreater(stats["size"], 0)
+        self.assertLessEqual(stats["size"], 1 << 16)
+
+        # Deletions in the underlying index invalidate the cache.
+        document_id = next(iter(index["water"])).document_id
+        index.delete_document(document_id)
+        self.assertTrue(cached.is_deleted(document_id))
+        self.assertNotIn(document_id, [p.document_id for p in cached["water"]])
+        self.assertNotIn(document_id, cached.get_document_ids("water"))
+
+    def test_search_engine(self):
+        import os.path
+        from corpus import InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from cachedindex import CachedInvertedIndex
+        from ranking import BetterRanker
+        from searchengine import SimpleSearchEngine
+        corpus = InMemoryCorpus(os.path.join(data_path, 'mesh.txt'))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+        cached = CachedInvertedIndex(index)
+        for query in ["water pollution", "syndrome of the", "acid acid"]:
+            for traversal in ("daat", "taat", "wand"):
+                results = []
+                for i in (index, cached):
+                    matches = []
+                    options = {"traversal": traversal, "match_threshold": 0.5, "hit_count": 10}
+                    SimpleSearchEngine(corpus, i).evaluate(query, options, BetterRanker(corpus, i),
+                                                           lambda m: matches.append((m["score"], m["document"])))
+                    results.append(matches)
+                self.assertListEqual(results[0], results[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
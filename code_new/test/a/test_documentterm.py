@@ -0,0 +1,111 @@
+import unittest
+import importlib.util
+
+@unittest.skipIf(importlib.util.find_spec('numpy') is None, 'NumPy not available')
+class TestDocumentTermMatrix(unittest.TestCase):
+    def setUp(self):
+        from normalization import BrainDeadNormalizer
+        from tokenization import BrainDeadTokenizer
+        from corpus import InMemoryDocument, InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        self._normalizer = BrainDeadNormalizer()
+        self._tokenizer = BrainDeadTokenizer()
+        self._corpus = InMemoryCorpus()
+        self._corpus.add_document(InMemoryDocument(0, {"body": "foo bar foo"}))
+        self._corpus.add_document(InMemoryDocument(1, {"body": "bar baz"}))
+        self._corpus.add_document(InMemoryDocument(2, {"body": "qux"}))
+        self._corpus.add_document(InMemoryDocument(3, {"body": "baz baz foo"}))
+        self._index = InMemoryInvertedIndex(self._corpus, ["body"], self._normalizer, self._tokenizer)
+
+    def test_export_and_import(self):
+        from invertedindex import InMemoryInvertedIndex
+        from documentterm import DocumentTermMatrix
+        matrix = self._index.to_document_term_matrix()
+        self.assertEqual(matrix.shape, (4, 4))
+        self.assertListEqual(matrix.terms, ["foo", "bar", "baz", "qux"])
+        self.assertListEqual(matrix.indptr.tolist(), [0, 2, 4, 6, 7])
+        self.assertListEqual(matrix.indices.tolist(), [0, 3, 0, 1, 1, 3, 2])
+        self.assertListEqual(matrix.data.tolist(), [2, 1, 1, 1, 1, 2, 1])
+        (indptr, indices, data) = matrix.to_csr()
+        self.assertListEqual(indptr.tolist(), [0, 2, 4, 5, 7])
+        self.assertListEqual(indices.tolist(), [0, 1, 1, 2, 3, 0, 2])
+        self.assertListEqual(data.tolist(), [2, 1, 1, 1, 1, 1, 2])
+        restored = DocumentTermMatrix.from_csr(matrix.terms, indptr, indices, data, matrix.document_lengths)
+        self.assertListEqual(restored.indices.tolist(), matrix.indices.tolist())
+        index = InMemoryInvertedIndex.from_document_term_matrix(restored, self._corpus, ["body"],
+                                                                self._normalizer, self._tokenizer)
+        for term in matrix.terms:
+            self.assertListEqual([(p.document_id, p.term_frequency) for p in index[term]],
+                                 [(p.document_id, p.term_frequency) for p in self._index[term]])
+        self.assertEqual(index.get_document_length(3), 3)
+        self.assertAlmostEqual(index.get_average_document_length(), 9 / 4)
+        self._index.delete_document(0)
+        self.assertListEqual(self._index.to_document_term_matrix().indptr.tolist(), [0, 1, 2, 4, 5])
+
+    def test_round_trip_keeps_statistics(self):
+        from invertedindex import InMemoryInvertedIndex
+        from corpus import InMemoryDocument
+
+        def round_trip():
+            matrix = self._index.to_document_term_matrix()
+            (indptr, indices, data) = matrix.to_csr()
+            matrix = type(matrix).from_csr(matrix.terms, indptr, indices, data, matrix.document_lengths,
+                                           matrix.document_count, matrix.get_document_frequencies(), matrix.deleted)
+            return InMemoryInvertedIndex.from_document_term_matrix(matrix, self._corpus, ["body"],
+                                                                   self._normalizer, self._tokenizer)
+
+        def statistics(index):
+            stats = index.stats()
+            del stats["bytes"]
+            return stats
+
+        def ranking_statistics(index):
+            return ([index.get_document_frequency(term) for term in ("foo", "bar", "baz", "qux", "wtf")],
+                    [index.is_deleted(document_id) for document_id in range(4)],
+                    index.get_average_document_length(), index.stats()["documents"], index.stats()["deleted"])
+
+        self.assertDictEqual(statistics(round_trip()), statistics(self._index))
+        self._index.delete_document(0)
+        restored = round_trip()
+        self.assertEqual(ranking_statistics(restored), ranking_statistics(self._index))
+        self.assertEqual(restored.stats()["postings"], self._index.stats()["postings"] - 2)
+        document = InMemoryDocument(4, {"body": "foo"})
+        self._corpus.add_document(document)
+        for index in (restored, self._index):
+            index.add_document(document)
+            self.assertEqual(index.get_document_frequency("foo"), 3)
+        self._index.compact()
+        self.assertDictEqual(statistics(round_trip()), statistics(self._index))
+
+    def test_scoring(self):
+        from ranking import BetterRanker
+        matrix = self._index.to_document_term_matrix()
+        ranker = BetterRanker(self._corpus, self._index)
+        scores = matrix.score([("foo", 1), ("baz", 2), ("wtf", 1)])
+        for (document_id, expected) in ((0, [("foo", 1)]), (1, [("baz", 2)]), (3, [("foo", 1), ("baz", 2)])):
+            ranker.reset(document_id)
+            for (term, multiplicity) in expected:
+                posting = next(p for p in self._index[term] if p.document_id == document_id)
+                ranker.update(term, multiplicity, posting)
+            self.assertAlmostEqual(scores[document_id], ranker.evaluate())
+        self.assertEqual(scores[2], 0.0)
+        self.assertListEqual([d for (_, d) in matrix.top(scores, 2)], [3, 1])
+        self.assertEqual(len(matrix.top(scores, 10)), 3)
+
+    def test_scoring_with_deletions(self):
+        from ranking import BetterRanker
+        self._index.delete_document(0)
+        matrix = self._index.to_document_term_matrix()
+        self.assertEqual(matrix.document_count, 4)
+        self.assertListEqual(matrix.get_document_frequencies().tolist(), [2, 2, 2, 1])
+        ranker = BetterRanker(self._corpus, self._index)
+        scores = matrix.score([("foo", 1), ("bar", 1)])
+        for (document_id, term) in ((1, "bar"), (3, "foo")):
+            ranker.reset(document_id)
+            ranker.update(term, 1, next(p for p in self._index[term] if p.document_id == document_id))
+            self.assertAlmostEqual(scores[document_id], ranker.evaluate())
+        self.assertEqual(scores[0], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
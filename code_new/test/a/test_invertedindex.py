@@ -48,6 +48,145 @@ class TestInMemoryInvertedIndex(unittest.TestCase):
         self.assertEqual(posting.document_id, 0)
         self.assertEqual(posting.term_frequency, 5)
 
+    def test_delete_and_update_documents(self):
+        from corpus import InMemoryDocument, InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        corpus = InMemoryCorpus()
+        corpus.add_document(InMemoryDocument(0, {"body": "foo bar"}))
+        corpus.add_document(InMemoryDocument(1, {"body": "foo foo"}))
+        corpus.add_document(InMemoryDocument(2, {"body": "bar"}))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+        average_document_length = index.get_average_document_length()
+        for document_id in (3, 100, -1):
+            with self.assertRaises(ValueError):
+                index.delete_document(document_id)
+        self.assertEqual(index.get_average_document_length(), average_document_length)
+        self.assertEqual(index.stats()["deleted"], 0)
+        index.delete_document(1)
+        index.delete_document(1)
+        self.assertAlmostEqual(index.get_average_document_length(), 3 / 2)
+        self.assertTrue(index.is_deleted(1))
+        self.assertFalse(index.is_deleted(0))
+        self.assertListEqual([p.document_id for p in index["foo"]], [0])
+        self.assertEqual(index.get_document_frequency("foo"), 2)
+        corpus.add_document(InMemoryDocument(3, {"body": "foo baz"}))
+        index.update_document(0, corpus[3])
+        self.assertListEqual([p.document_id for p in index["foo"]], [3])
+        self.assertListEqual([p.document_id for p in index["baz"]], [3])
+        index.compact()
+        self.assertEqual(index.get_document_frequency("foo"), 1)
+        self.assertEqual(index.get_document_frequency("bar"), 1)
+        self.assertListEqual([(p.document_id, p.term_frequency) for p in index["bar"]], [(2, 1)])
+
+    def test_block_max_cursors(self):
+        from corpus import InMemoryDocument, InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from ranking import BrainDeadRanker
+        corpus = InMemoryCorpus()
+        for i in range(10):
+            corpus.add_document(InMemoryDocument(i, {"body": " ".join(["foo"] * (i + 1)) + (" bar" if i % 3 else "")}))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer, block_size=4)
+        cursor = index.get_postings_cursor("foo", 2, BrainDeadRanker())
+        self.assertIsNone(cursor.current)
+        self.assertEqual(cursor.block_last_document_id(), 3)
+        self.assertEqual(cursor.block_max_term_frequency(), 4)
+        self.assertEqual(cursor.block_max_score(), 8)
+        self.assertEqual(cursor.max_term_frequency(), 10)
+        self.assertEqual(cursor.max_score(), 20)
+        self.assertEqual(next(cursor).document_id, 0)
+        self.assertEqual(cursor.skip_to(6).document_id, 6)
+        self.assertEqual(cursor.block_last_document_id(), 7)
+        self.assertEqual(cursor.skip_to(2).document_id, 6)
+        self.assertEqual(cursor.skip_block().document_id, 8)
+        self.assertEqual(cursor.block_max_score(), 20)
+        self.assertIsNone(cursor.skip_to(10))
+        self.assertTrue(cursor.is_exhausted())
+        self.assertIsNone(next(cursor, None))
+        index.delete_document(5)
+        cursor = index.get_postings_cursor("bar")
+        self.assertListEqual([p.document_id for p in cursor], [1, 2, 4, 7, 8])
+        cursor = index.get_postings_cursor("bar")
+        self.assertEqual(cursor.skip_to(5).document_id, 7)
+        self.assertIsNone(next(index.get_postings_cursor("wtf"), None))
+
+    def test_exhausted_cursors(self):
+        import sys
+        from corpus import InMemoryDocument, InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from ranking import BrainDeadRanker
+        corpus = InMemoryCorpus()
+        for i in range(8):
+            corpus.add_document(InMemoryDocument(i, {"body": "foo"}))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer, block_size=4)
+        for (term, advance) in (("foo", list), ("foo", lambda c: c.skip_to(8)), ("foo", lambda c: c.skip_block()),
+                                ("wtf", lambda c: None)):
+            cursor = index.get_postings_cursor(term, 1, BrainDeadRanker())
+            advance(cursor)
+            advance(cursor)
+            self.assertTrue(term == "wtf" or cursor.is_exhausted())
+            self.assertEqual(cursor.block_last_document_id(), sys.maxsize)
+            self.assertEqual(cursor.block_max_term_frequency(), 0)
+            self.assertEqual(cursor.block_max_score(), 0.0)
+            self.assertIsNone(cursor.skip_block())
+            self.assertIsNone(cursor.skip_to(100))
+
+    def test_block_max_scores_follow_index_changes(self):
+        from corpus import InMemoryDocument, InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from ranking import BetterRanker
+        corpus = InMemoryCorpus()
+        for i in range(4):
+            corpus.add_document(InMemoryDocument(i, {"body": "foo" if i % 2 else "bar"}))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+        ranker = BetterRanker(corpus, index)
+        before = index.get_postings_cursor("foo", 1, ranker).max_score()
+        for i in range(4, 8):
+            corpus.add_document(InMemoryDocument(i, {"body": "bar"}))
+            index.add_document(corpus[i])
+        after = index.get_postings_cursor("foo", 1, ranker).max_score()
+        self.assertGreater(after, before)
+        self.assertAlmostEqual(after, max(ranker.contribution("foo", 1, p) for p in index["foo"]))
+        for multiplicity in range(1, 20):
+            index.get_postings_cursor("foo", multiplicity, ranker).max_score()
+        self.assertLessEqual(len(index._posting_lists[index._dictionary["foo"]]._block_max_scores), 8)
+
+    def test_capabilities(self):
+        from corpus import InMemoryDocument, InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from ranking import BrainDeadRanker, BetterRanker, BM25Ranker
+        corpus = InMemoryCorpus()
+        corpus.add_document(InMemoryDocument(0, {"body": "foo bar foo"}))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+        self.assertTrue(index.supports("get_document_length"))
+        self.assertTrue(index.supports("delete_document"))
+        self.assertFalse(index.supports("get_document_norm"))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer, compute_norms=True)
+        self.assertTrue(index.supports("get_document_norm"))
+        with self.assertRaises(AssertionError):
+            index.supports("get_terms")
+        for ranker in (BrainDeadRanker(), BetterRanker(corpus, index), BM25Ranker(corpus, index)):
+            self.assertTrue(ranker.supports("upper_bound"))
+            self.assertTrue(ranker.supports("static_upper_bound"))
+
+    def test_stats(self):
+        from corpus import InMemoryDocument, InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        corpus = InMemoryCorpus()
+        corpus.add_document(InMemoryDocument(0, {"body": "foo bar foo"}))
+        corpus.add_document(InMemoryDocument(1, {"body": "foo baz"}))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+        stats = index.stats(longest=2)
+        self.assertEqual(stats["terms"], 3)
+        self.assertEqual(stats["postings"], 4)
+        self.assertAlmostEqual(stats["average_posting_list_length"], 4 / 3)
+        self.assertListEqual(stats["longest_posting_lists"][:1], [("foo", 2)])
+        self.assertEqual(len(stats["longest_posting_lists"]), 2)
+        self.assertGreater(stats["bytes"]["posting_lists"], 0)
+        self.assertGreater(stats["bytes"]["dictionary"], 0)
+        self.assertEqual(stats["bytes"]["bitmaps"], index.stats()["bytes"]["bitmaps"])
+        index.get_document_ids("foo")
+        self.assertGreater(index.stats()["bytes"]["bitmaps"], stats["bytes"]["bitmaps"])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+import importlib.util
 from test import data_path
 
 class TestPostingsMerger(unittest.TestCase):
@@ -55,6 +56,119 @@ class TestPostingsMerger(unittest.TestCase):
                                            [3078, 8138, 8635, 9379, 14472, 18572, 23234, 23985] +
                                            [i for i in range(25265, 25282)])
 
+    def test_difference_and_filter(self):
+        from invertedindex import Posting
+        from utilities import BitSet
+        postings1 = [Posting(1, 0), Posting(2, 0), Posting(3, 0), Posting(7, 0)]
+        postings2 = [Posting(2, 0), Posting(3, 0), Posting(6, 0)]
+        self.assertListEqual(list(self._merger.difference(iter([]), iter(postings2))), [])
+        self.assertListEqual([p.document_id for p in self._merger.difference(iter(postings1), iter([]))], [1, 2, 3, 7])
+        self.assertListEqual([p.document_id for p in self._merger.difference(iter(postings1), iter(postings2))], [1, 7])
+        self.assertListEqual([p.document_id for p in self._merger.difference(iter(postings2), iter(postings1))], [6])
+        self.assertListEqual([p.document_id for p in self._merger.filter(iter(postings1), BitSet([2, 7, 9]))], [2, 7])
+        self.assertListEqual([p.document_id for p in self._merger.filter(iter(postings1), lambda d: d % 2)], [1, 3, 7])
+        self.assertListEqual(list(self._merger.filter(iter([]), {1, 2})), [])
+
+    def test_document_id_set_operations(self):
+        import os.path
+        from normalization import BrainDeadNormalizer
+        from tokenization import BrainDeadTokenizer
+        from corpus import InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from bitmap import RoaringBitmap
+        corpus = InMemoryCorpus(os.path.join(data_path, 'en.txt'))
+        index = InMemoryInvertedIndex(corpus, ["body"], BrainDeadNormalizer(), BrainDeadTokenizer())
+        self.assertIsInstance(index.get_document_ids("the"), RoaringBitmap)
+        self.assertNotIsInstance(index.get_document_ids("king"), RoaringBitmap)
+        index.delete_document(index.get_document_ids("king")[0])
+        for term1 in ("the", "of", "king", "wtf"):
+            for term2 in ("and", "a", "world"):
+                (ids1, ids2) = (index.get_document_ids(term1), index.get_document_ids(term2))
+                (set1, set2) = ({p.document_id for p in index[term1]}, {p.document_id for p in index[term2]})
+                self.assertListEqual(list(ids1), sorted(set1))
+                self.assertListEqual(list(self._merger.intersection_of_document_ids(ids1, ids2)), sorted(set1 & set2))
+                self.assertListEqual(list(self._merger.intersection_of_document_ids(ids2, ids1)), sorted(set1 & set2))
+                self.assertListEqual(list(self._merger.union_of_document_ids(ids1, ids2)), sorted(set1 | set2))
+                self.assertEqual(self._merger.intersection_count(ids1, ids2), len(set1 & set2))
+        first = next(iter(index.get_document_ids("the")))
+        index.delete_document(first)
+        self.assertNotIn(first, index.get_document_ids("the"))
+        self.assertListEqual(list(index.get_document_ids("the")), [p.document_id for p in index["the"]])
+
+    def test_union_of_many(self):
+        import os.path
+        from normalization import BrainDeadNormalizer
+        from tokenization import BrainDeadTokenizer
+        from corpus import InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        corpus = InMemoryCorpus(os.path.join(data_path, 'mesh.txt'))
+        index = InMemoryInvertedIndex(corpus, ["body"], BrainDeadNormalizer(), BrainDeadTokenizer())
+        self.assertListEqual(list(self._merger.union_of_many([])), [])
+        for query in ("water", "water toxic", "HIV protein water", "wtf water wtf", "acid of the syndrome"):
+            terms = list(index.get_terms(query))
+            expected = {}
+            for (i, term) in enumerate(terms):
+                for posting in index[term]:
+                    expected.setdefault(posting.document_id, []).append((i, posting.term_frequency))
+            merged = list(self._merger.union_of_many([index[term] for term in terms]))
+            self.assertListEqual([d for (d, _) in merged], sorted(expected))
+            for (document_id, matches) in merged:
+                self.assertListEqual([(i, p.term_frequency) for (i, p) in matches], expected[document_id])
+                self.assertTrue(all(p.document_id == document_id for (_, p) in matches))
+        merged = self._merger.union_of_many([iter([]), iter([]), index["water"]])
+        self.assertListEqual([d for (d, _) in merged], [p.document_id for p in index["water"]])
+
+    @unittest.skipIf(importlib.util.find_spec('numpy') is None, 'NumPy not available')
+    def test_vectorized_set_operations(self):
+        import random
+        import sys
+        from array import array
+        from bitmap import RoaringBitmap
+        from traversal import PostingsMerger
+        rng = random.Random(1234)
+        threshold = PostingsMerger._vectorization_threshold
+        try:
+            for _ in range(100):
+                sizes = [rng.choice([0, 1, 10, 300, 3000]) for _ in range(rng.randint(1, 4))]
+                sets = [set(rng.sample(range(20000), size)) for size in sizes]
+                ids = [RoaringBitmap(s) if rng.random() < 0.3 else array("l", sorted(s)) for s in sets]
+                minimum = rng.randint(1, len(sets))
+                results = []
+                for vectorization_threshold in (sys.maxsize, 0):
+                    PostingsMerger._vectorization_threshold = vectorization_threshold
+                    results.append([list(self._merger.intersection_of_many(ids)),
+                                    list(self._merger.union_of_document_ids(ids[0], ids[-1])),
+                                    list(self._merger.intersection_of_document_ids(ids[0], ids[-1])),
+                                    list(self._merger.difference_of_document_ids(ids[0], ids[-1])),
+                                    self._merger.intersection_count(ids[0], ids[-1]),
+                                    list(self._merger.at_least(ids, minimum))])
+                self.assertListEqual(results[0], results[1])
+                self.assertListEqual(results[0], [sorted(set.intersection(*sets)),
+                                                  sorted(sets[0] | sets[-1]),
+                                                  sorted(sets[0] & sets[-1]),
+                                                  sorted(sets[0] - sets[-1]),
+                                                  len(sets[0] & sets[-1]),
+                                                  sorted(d for d in set.union(*sets)
+                                                         if sum(d in s for s in sets) >= minimum)])
+        finally:
+            PostingsMerger._vectorization_threshold = threshold
+
+    def test_intersection_of_many(self):
+        import os.path
+        import functools
+        from normalization import BrainDeadNormalizer
+        from tokenization import BrainDeadTokenizer
+        from corpus import InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        corpus = InMemoryCorpus(os.path.join(data_path, 'en.txt'))
+        index = InMemoryInvertedIndex(corpus, ["body"], BrainDeadNormalizer(), BrainDeadTokenizer())
+        self.assertListEqual(list(self._merger.intersection_of_many([])), [])
+        for query in ("the", "the of and a", "king of the world", "war and peace", "wtf the", "he was born in"):
+            terms = list(index.get_terms(query))
+            expected = [p.document_id for p in functools.reduce(self._merger.intersection, (index[t] for t in terms))]
+            result = self._merger.intersection_of_many([index.get_document_ids(t) for t in terms])
+            self.assertListEqual(list(result), expected)
+
 
 if __name__ == '__main__':
     unittest.main()
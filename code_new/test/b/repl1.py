@@ -1,4 +1,4 @@
-from test import simple_repl, data_path
+from test import simple_repl, print_stats, data_path
 
 def main():
     import os.path
@@ -11,6 +11,7 @@ def main():
     tokenizer = BrainDeadTokenizer()
     corpus = InMemoryCorpus(os.path.join(data_path, 'cran.xml'))
     engine = SuffixArray(corpus, ["body"], normalizer, tokenizer)
+    print_stats(engine.stats())
     options = {"debug": False, "hit_count": 5}
     print("Enter a prefix phrase query and find matching documents.")
     print(f"Lookup options are {options}.")
@@ -1,4 +1,4 @@
-from test import simple_repl, data_path
+from test import simple_repl, print_stats, data_path
 
 
 def main():
@@ -14,6 +14,7 @@ def main():
     dictionary = Trie()
     for document in corpus:
         dictionary.add(normalizer.normalize(normalizer.canonicalize(document["body"])), tokenizer)
+    print_stats(dictionary.stats())
     engine = StringFinder(dictionary, tokenizer)
     print("Enter some text and locate words and phrases that are MeSH terms.")
 
@@ -69,6 +69,51 @@ class TestSuffixArray(unittest.TestCase):
         self._process_query_and_verify_winner(engine1, "z", [], None)
         self._process_query_and_verify_winner(engine2, "z", [2], 1)
 
+    def test_delete_and_update_documents(self):
+        from corpus import InMemoryDocument, InMemoryCorpus
+        from suffixarray import SuffixArray
+        corpus = InMemoryCorpus()
+        corpus.add_document(InMemoryDocument(0, {"body": "a b c b c"}))
+        corpus.add_document(InMemoryDocument(1, {"body": "b c d"}))
+        engine = SuffixArray(corpus, ["body"], self._normalizer, self._tokenizer)
+        self._process_query_and_verify_winner(engine, "b c", [0], 2)
+        engine.delete_document(0)
+        self._process_query_and_verify_winner(engine, "b c", [1], 1)
+        self._process_query_and_verify_winner(engine, "a", [], None)
+        corpus.add_document(InMemoryDocument(2, {"body": "d e b c b c b c"}))
+        engine.update_document(1, corpus[2])
+        self._process_query_and_verify_winner(engine, "b c", [2], 3)
+        self._process_query_and_verify_winner(engine, "d", [2], 1)
+        engine.compact()
+        self._process_query_and_verify_winner(engine, "b c", [2], 3)
+        self._process_query_and_verify_winner(engine, "e b", [2], 1)
+        self._process_query_and_verify_winner(engine, "a", [], None)
+
+    def test_add_documents_keeps_suffixes_sorted(self):
+        from corpus import InMemoryDocument, InMemoryCorpus
+        from suffixarray import SuffixArray
+        corpus = InMemoryCorpus()
+        corpus.add_document(InMemoryDocument(0, {"body": "b a n a n a"}))
+        engine = SuffixArray(corpus, ["body"], self._normalizer, self._tokenizer)
+        for (document_id, body) in enumerate(["a b a c a b a", "n a b", "c c a n a", "b a n a n a"], start=1):
+            corpus.add_document(InMemoryDocument(document_id, {"body": body}))
+            engine.add_document(corpus[document_id])
+        rebuilt = SuffixArray(corpus, ["body"], self._normalizer, self._tokenizer)
+        self.assertListEqual([engine._get_suffix1(i) for i in range(len(engine._suffixes))],
+                             [rebuilt._get_suffix1(i) for i in range(len(rebuilt._suffixes))])
+        self._process_query_and_verify_winner(engine, "a n a", [0, 4], 2)
+
+    def test_stats(self):
+        from corpus import InMemoryDocument, InMemoryCorpus
+        from suffixarray import SuffixArray
+        corpus = InMemoryCorpus()
+        corpus.add_document(InMemoryDocument(0, {"body": "a b c"}))
+        corpus.add_document(InMemoryDocument(1, {"body": "b c"}))
+        stats = SuffixArray(corpus, ["body"], self._normalizer, self._tokenizer).stats()
+        self.assertEqual(stats["documents"], 2)
+        self.assertEqual(stats["suffixes"], 5)
+        self.assertGreater(stats["bytes"]["suffixes"], 0)
+
 
 if __name__ == '__main__':
     unittest.main()
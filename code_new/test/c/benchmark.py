@@ -0,0 +1,97 @@
+from test import data_path
+
+def main():
+    import os.path
+    import random
+    import timeit
+    from normalization import BrainDeadNormalizer
+    from tokenization import BrainDeadTokenizer
+    from corpus import InMemoryCorpus
+    from invertedindex import InMemoryInvertedIndex
+    from ranking import BetterRanker, BM25Ranker
+    from impactindex import ImpactOrderedInvertedIndex
+    from searchengine import SimpleSearchEngine, ImpactOrderedSearchEngine
+
+    print("Building inverted index from English corpus...")
+    corpus = InMemoryCorpus(os.path.join(data_path, 'en.txt'))
+    index = InMemoryInvertedIndex(corpus, ["body"], BrainDeadNormalizer(), BrainDeadTokenizer())
+    engine = SimpleSearchEngine(corpus, index)
+    queries = ["the of", "the of and a in", "king of the world", "the united states of america",
+               "war and peace", "the history of the city of london", "he was born in the year",
+               "the war of the worlds was written by a man from england in the year",
+               "a list of the largest cities in the world by population and area in the united states"]
+    traversals = ["daat", "taat", "wand", "maxscore"]
+
+    def run(query, options, ranker):
+        matches = []
+        statistics = min((engine.evaluate(query, options, ranker,
+                                          lambda m: matches.append((round(m["score"], 9), m["document"].document_id)))
+                          for _ in range(5)), key=lambda s: s["elapsed"])
+        return matches[-options["hit_count"]:], statistics
+
+    print("Comparing traversal strategies for top-10 retrieval, in postings scored and milliseconds.")
+    for ranker in (BetterRanker(corpus, index), BM25Ranker(corpus, index)):
+        print(type(ranker).__name__)
+        for query in queries:
+            results = {}
+            for traversal in traversals:
+                options = {"traversal": traversal, "match_threshold": 0.1, "hit_count": 10}
+                results[traversal] = run(query, options, ranker)
+            assert all(results[t][0] == results["daat"][0] for t in traversals)
+            print(f"{query!r:40}",
+                  " ".join(f"{t}={results[t][1]['postings_scored']}/{1000.0 * results[t][1]['elapsed']:.2f}"
+                           for t in traversals))
+
+    # Long queries, as when users paste text into the search box, stress how traversal juggles the cursors.
+    generator = random.Random(0)
+    vocabulary = sorted(index.get_vocabulary(), key=index.get_document_frequency, reverse=True)[:2000]
+    print("Comparing traversal strategies for long queries, in milliseconds per query.")
+    for ranker in (BetterRanker(corpus, index), BM25Ranker(corpus, index)):
+        for length in (20, 30, 40, 50):
+            long_queries = [" ".join(generator.sample(vocabulary, length)) for _ in range(5)]
+            timings = {}
+            for traversal in traversals:
+                options = {"traversal": traversal, "match_threshold": 0.1, "hit_count": 10}
+                elapsed = min(timeit.repeat(lambda: [engine.evaluate(q, options, ranker, lambda m: None)
+                                                     for q in long_queries], number=1, repeat=3))
+                timings[traversal] = 1000.0 * elapsed / len(long_queries)
+            print(f"{type(ranker).__name__:20} {length} terms",
+                  " ".join(f"{t}={timing:.2f}" for (t, timing) in timings.items()))
+
+    # Simulate a skewed query log, where queries are drawn from a smallish set of popular terms.
+    generator = random.Random(0)
+    vocabulary = sorted(index.get_vocabulary(), key=index.get_document_frequency, reverse=True)[:500]
+    log = [" ".join(generator.choices(vocabulary, weights=[1.0 / (r + 1) for r in range(len(vocabulary))],
+                                      k=generator.randint(2, 5)))
+           for _ in range(500)]
+    print(f"Comparing serial evaluation against batch evaluation of {len(log)} queries, in queries per second.")
+    for ranker in (BetterRanker(corpus, index), BM25Ranker(corpus, index)):
+        options = {"match_threshold": 0.5, "hit_count": 10}
+        serial = min(timeit.repeat(lambda: [engine.evaluate(q, options, ranker, lambda m: None) for q in log],
+                                   number=1, repeat=3))
+        batch = min(timeit.repeat(lambda: engine.evaluate_many(log, options, ranker), number=1, repeat=3))
+        print(f"{type(ranker).__name__:20} serial={len(log) / serial:.1f} batch={len(log) / batch:.1f}")
+
+    # Short queries of frequent terms, where only the top 10 are wanted, are what impact ordering is for.
+    generator = random.Random(0)
+    vocabulary = sorted(index.get_vocabulary(), key=index.get_document_frequency, reverse=True)
+    print("Comparing DAAT traversal against score-at-a-time traversal of impact bands for top-10 retrieval.")
+    for ranker in (BetterRanker(corpus, index), BM25Ranker(corpus, index)):
+        impact_engine = ImpactOrderedSearchEngine(corpus, ImpactOrderedInvertedIndex(index, ranker))
+        for (name, terms) in (("frequent", vocabulary[:100]), ("mid-frequency", vocabulary[1000:2000])):
+            short_queries = [" ".join(generator.sample(terms, generator.randint(1, 3))) for _ in range(200)]
+            options = {"match_threshold": 0.0, "hit_count": 10}
+            daat = min(timeit.repeat(lambda: [engine.evaluate(q, options, ranker, lambda m: None)
+                                              for q in short_queries], number=1, repeat=3))
+            impact = min(timeit.repeat(lambda: [impact_engine.evaluate(q, options, lambda m: None)
+                                                for q in short_queries], number=1, repeat=3))
+            statistics = [impact_engine.evaluate(q, options, lambda m: None) for q in short_queries]
+            stopped = sum(s["bands_processed"] < s["bands"] for s in statistics)
+            print(f"{type(ranker).__name__:20} {name:14}",
+                  f"daat={1000.0 * daat / len(short_queries):.2f}",
+                  f"impact={1000.0 * impact / len(short_queries):.2f}",
+                  f"stopped_early={stopped}/{len(short_queries)}")
+
+
+if __name__ == '__main__':
+    main()
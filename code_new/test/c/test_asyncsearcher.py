@@ -0,0 +1,197 @@
+import unittest
+from test import data_path
+
+class TestAsyncSearcher(unittest.TestCase):
+    def setUp(self):
+        from normalization import BrainDeadNormalizer
+        from tokenization import BrainDeadTokenizer
+        self._normalizer = BrainDeadNormalizer()
+        self._tokenizer = BrainDeadTokenizer()
+
+    def test_search_engine(self):
+        import asyncio
+        import os.path
+        from corpus import InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from ranking import BetterRanker
+        from searchengine import SimpleSearchEngine
+        from asyncsearch import AsyncSearcher
+        corpus = InMemoryCorpus(os.path.join(data_path, 'mesh.txt'))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+        engine = SimpleSearchEngine(corpus, index)
+        ranker = BetterRanker(corpus, index)
+        queries = ["water pollution", "syndrome of the", "acid acid", "wtf", "water of the"] * 4
+        options = {"match_threshold": 0.5, "hit_count": 5}
+        expected = []
+        for query in queries:
+            matches = []
+            engine.evaluate(query, options, ranker, lambda m: matches.append((m["score"], m["document"].document_id)))
+            expected.append(matches)
+
+        async def search(searcher, query):
+            return [(m["score"], m["document"].document_id) async for m in searcher.evaluate(query, options)]
+
+        async def main():
+            async with AsyncSearcher(engine, ranker, executor="thread", workers=4, max_concurrency=2) as searcher:
+                results = await asyncio.gather(*(search(searcher, query) for query in queries))
+                return results, searcher.stats()
+
+        (results, stats) = asyncio.run(main())
+        self.assertListEqual(results, expected)
+        self.assertEqual(stats["submitted"], len(queries))
+        self.assertEqual(stats["completed"], len(queries))
+        self.assertEqual(stats["max_running"], 2)
+        self.assertGreater(stats["max_waiting"], 0)
+        self.assertGreater(stats["average_queueing_time"], 0.0)
+        self.assertGreater(stats["average_service_time"], 0.0)
+        self.assertEqual((stats["waiting"], stats["running"]), (0, 0))
+
+    def test_shared_caches(self):
+        import asyncio
+        import copy
+        import os.path
+        from corpus import InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from cachedindex import CachedInvertedIndex
+        from ranking import BM25Ranker
+        from searchengine import SimpleSearchEngine
+        from asyncsearch import AsyncSearcher
+        corpus = InMemoryCorpus(os.path.join(data_path, 'mesh.txt'))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+        ranker = BM25Ranker(corpus, index)
+        queries = ["water pollution", "syndrome of the", "acid acid", "wtf", "water of the", "blood"] * 10
+        options = {"match_threshold": 0.5, "hit_count": 5, "traversal": "wand"}
+        expected = {}
+        for query in queries:
+            matches = []
+            engine = SimpleSearchEngine(corpus, index)
+            engine.evaluate(query, options, ranker, lambda m: matches.append((m["score"], m["document"].document_id)))
+            expected[query] = matches
+
+        # All threads share the engine, the result cache and the posting list cache, but have their own rankers.
+        engine = SimpleSearchEngine(corpus, CachedInvertedIndex(index, budget=1 << 16), result_cache_size=8)
+
+        async def main():
+            async with AsyncSearcher(engine, ranker, executor="thread", workers=8) as searcher:
+                return await asyncio.gather(*(searcher.search(query, options) for query in queries))
+
+        results = asyncio.run(main())
+        for (query, matches) in zip(queries, results):
+            self.assertListEqual([(m["score"], m["document"].document_id) for m in matches], expected[query])
+        self.assertGreater(engine.stats()["result_cache"]["hits"], 0)
+
+        # Copies of a ranker share cached results, even though they are different rankers.
+        engine = SimpleSearchEngine(corpus, index, result_cache_size=4)
+        for copy_of_ranker in (ranker, copy.copy(ranker), copy.copy(ranker)):
+            engine.evaluate("water pollution", options, copy_of_ranker, lambda m: None)
+        self.assertEqual(engine.stats()["result_cache"]["hits"], 2)
+
+    def test_process_pool(self):
+        import asyncio
+        from corpus import InMemoryDocument, InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from ranking import BrainDeadRanker
+        from searchengine import SimpleSearchEngine
+        from suffixarray import SuffixArray
+        from asyncsearch import AsyncSearcher
+        corpus = InMemoryCorpus()
+        corpus.add_document(InMemoryDocument(0, {"body": "a b c b c"}))
+        corpus.add_document(InMemoryDocument(1, {"body": "b c d"}))
+        corpus.add_document(InMemoryDocument(2, {"body": "d e b c b c b c"}))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+
+        async def main():
+            async with AsyncSearcher(SimpleSearchEngine(corpus, index), BrainDeadRanker(),
+                                     executor="process", workers=2) as searcher:
+                engine_results = await asyncio.gather(*(searcher.search(q, {"hit_count": 2}) for q in ("b", "d e")))
+            async with AsyncSearcher(SuffixArray(corpus, ["body"], self._normalizer, self._tokenizer),
+                                     executor="process", workers=2) as searcher:
+                suffix_results = [[m async for m in searcher.evaluate(q, {"hit_count": 5})] for q in ("b c", "e")]
+            return engine_results, suffix_results
+
+        (engine_results, suffix_results) = asyncio.run(main())
+        self.assertListEqual([[(m["score"], m["document"].document_id) for m in r] for r in engine_results],
+                             [[(3.0, 2), (2.0, 0)], [(2.0, 2), (1.0, 1)]])
+        self.assertListEqual([[(m["score"], m["document"].document_id) for m in r] for r in suffix_results],
+                             [[(3, 2), (2, 0), (1, 1)], [(1, 2)]])
+
+    def test_timeouts_and_cancellation(self):
+        import asyncio
+        import threading
+        from asyncsearch import AsyncSearcher
+
+        class SlowSearcher:
+            def __init__(self):
+                self.evaluated = []
+                self.release = threading.Event()
+
+            def evaluate(self, query, options, callback):
+                self.evaluated.append(query)
+                self.release.wait(5.0)
+                callback({"score": 1.0, "document": query})
+
+        async def main():
+            slow = SlowSearcher()
+            async with AsyncSearcher(slow, workers=1, timeout=5.0) as searcher:
+                first = asyncio.ensure_future(searcher.search("first", {}))
+                second = asyncio.ensure_future(searcher.search("second", {}))
+                await asyncio.sleep(0.05)
+                second.cancel()
+                with self.assertRaises(asyncio.TimeoutError):
+                    await searcher.search("third", {}, timeout=0.05)
+                slow.release.set()
+                self.assertListEqual(await first, [{"score": 1.0, "document": "first"}])
+                with self.assertRaises(asyncio.CancelledError):
+                    await second
+                self.assertListEqual(await searcher.search("fourth", {}), [{"score": 1.0, "document": "fourth"}])
+                return slow.evaluated, searcher.stats()
+
+        (evaluated, stats) = asyncio.run(main())
+        self.assertListEqual(evaluated, ["first", "fourth"])
+        self.assertEqual((stats["submitted"], stats["completed"], stats["cancelled"], stats["timed_out"]), (4, 2, 1, 1))
+        self.assertEqual(stats["max_running"], 1)
+
+    def test_abandoned_queries_keep_their_turn(self):
+        import asyncio
+        import threading
+        from asyncsearch import AsyncSearcher
+
+        class SlowSearcher:
+            def __init__(self):
+                self.evaluated = []
+                self.release = threading.Event()
+                self.lock = threading.Lock()
+                self.active = 0
+                self.max_active = 0
+
+            def evaluate(self, query, options, callback):
+                with self.lock:
+                    self.evaluated.append(query)
+                    self.active += 1
+                    self.max_active = max(self.max_active, self.active)
+                self.release.wait(5.0)
+                with self.lock:
+                    self.active -= 1
+                callback({"score": 1.0, "document": query})
+
+        async def main():
+            slow = SlowSearcher()
+            async with AsyncSearcher(slow, workers=2, max_concurrency=1) as searcher:
+                with self.assertRaises(asyncio.TimeoutError):
+                    await searcher.search("first", {}, timeout=0.05)
+                self.assertEqual(searcher.stats()["running"], 1)
+                second = asyncio.ensure_future(searcher.search("second", {}))
+                await asyncio.sleep(0.05)
+                self.assertListEqual(slow.evaluated, ["first"])
+                slow.release.set()
+                self.assertListEqual(await second, [{"score": 1.0, "document": "second"}])
+                return slow, searcher.stats()
+
+        (slow, stats) = asyncio.run(main())
+        self.assertListEqual(slow.evaluated, ["first", "second"])
+        self.assertEqual(slow.max_active, 1)
+        self.assertEqual((stats["running"], stats["max_running"], stats["completed"], stats["timed_out"]), (0, 1, 1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+from test import data_path
+
+class TestImpactOrderedSearchEngine(unittest.TestCase):
+    def setUp(self):
+        import os.path
+        from normalization import BrainDeadNormalizer
+        from tokenization import BrainDeadTokenizer
+        from corpus import InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from ranking import BetterRanker
+        from impactindex import ImpactOrderedInvertedIndex
+        self._corpus = InMemoryCorpus(os.path.join(data_path, 'mesh.txt'))
+        self._index = InMemoryInvertedIndex(self._corpus, ["body"], BrainDeadNormalizer(), BrainDeadTokenizer())
+        self._impact_index = ImpactOrderedInvertedIndex(self._index, BetterRanker(self._corpus, self._index))
+
+    def _exhaustive_scores(self, query, hit_count):
+        from collections import Counter
+        accumulators = Counter()
+        for (term, count) in Counter(self._impact_index.get_terms(query)).items():
+            for (impact, document_ids) in self._impact_index.get_impact_bands(term, count):
+                for document_id in document_ids:
+                    accumulators[document_id] += impact
+        return sorted(accumulators.values(), reverse=True)[:hit_count]
+
+    def test_impact_bands(self):
+        bands = self._impact_index.get_impact_bands("water")
+        self.assertGreater(len(bands), 0)
+        self.assertListEqual([impact for (impact, _) in bands], sorted([impact for (impact, _) in bands], reverse=True))
+        self.assertEqual(sum(len(document_ids) for (_, document_ids) in bands),
+                         self._impact_index.get_document_frequency("water"))
+        self.assertListEqual(self._impact_index.get_impact_bands("wtf"), [])
+
+    def test_capabilities(self):
+        self.assertTrue(self._impact_index.supports("get_vocabulary"))
+        self.assertTrue(self._impact_index.supports("get_document_length"))
+        self.assertFalse(self._impact_index.supports("get_document_norm"))
+        self.assertFalse(self._impact_index.supports("delete_document"))
+        self.assertListEqual(list(self._impact_index.get_document_ids("water")),
+                             list(self._index.get_document_ids("water")))
+
+    def test_simple_search_engine(self):
+        from ranking import BetterRanker, BM25Ranker
+        from searchengine import SimpleSearchEngine
+        engines = [SimpleSearchEngine(self._corpus, index) for index in (self._index, self._impact_index)]
+        for ranker in (BetterRanker(self._corpus, self._impact_index), BM25Ranker(self._corpus, self._impact_index)):
+            for query in ("water pollution", "syndrome of the", "wtf"):
+                expected = []
+                engines[0].evaluate(query, {"match_threshold": 0.5}, ranker,
+                                    lambda m: expected.append((m["score"], m["document"].document_id)))
+                for traversal in ("daat", "taat", "wand", "maxscore"):
+                    matches = []
+                    statistics = engines[1].evaluate(query, {"traversal": traversal, "match_threshold": 0.5}, ranker,
+                                                     lambda m: matches.append((m["score"], m["document"].document_id)))
+                    self.assertEqual(statistics["traversal"], traversal)
+                    self.assertListEqual([(round(s, 9), d) for (s, d) in matches],
+                                         [(round(s, 9), d) for (s, d) in expected])
+        for query in ("water AND pollution", "acid AND NOT (water OR blood)"):
+            (expected, matches) = ([], [])
+            engines[0].evaluate_boolean(query, {}, lambda m: expected.append(m["document"].document_id))
+            engines[1].evaluate_boolean(query, {}, lambda m: matches.append(m["document"].document_id))
+            self.assertGreater(len(matches), 0)
+            self.assertListEqual(matches, expected)
+
+    def test_matches_exhaustive_evaluation(self):
+        from searchengine import ImpactOrderedSearchEngine
+        engine = ImpactOrderedSearchEngine(self._corpus, self._impact_index)
+        for query in ("water pollution", "acid acid acid", "of the", "syndrome of the", "wtf", "human disease virus"):
+            for hit_count in (1, 10, 100):
+                matches = []
+                engine.evaluate(query, {"hit_count": hit_count}, lambda m: matches.append(m))
+                scores = [round(m["score"] / self._impact_index.dequantize(1)) for m in matches]
+                self.assertListEqual(scores, self._exhaustive_scores(query, hit_count))
+
+    def test_matches_simple_search_engine(self):
+        from collections import Counter
+        from ranking import BetterRanker
+        from impactindex import ImpactOrderedInvertedIndex
+        from searchengine import SimpleSearchEngine, ImpactOrderedSearchEngine
+        ranker = BetterRanker(self._corpus, self._index)
+        impact_index = ImpactOrderedInvertedIndex(self._index, ranker, bits=16)
+        engines = (SimpleSearchEngine(self._corpus, self._index), ImpactOrderedSearchEngine(self._corpus, impact_index))
+        for query in ("water pollution", "acid acid acid", "water water pollution", "syndrome of the", "wtf"):
+            (expected, matches) = ([], [])
+            engines[0].evaluate(query, {"match_threshold": 0.0, "hit_count": 10}, ranker,
+                                lambda m: expected.append((m["score"], m["document"].document_id)))
+            engines[1].evaluate(query, {"hit_count": 10},
+                                lambda m: matches.append((m["score"], m["document"].document_id)))
+
+            # Quantization rounds each term's contribution by at most half a level, so the scores can only
+            # differ by that much per term, both document by document and rank by rank.
+            terms = Counter(self._index.get_terms(query))
+            tolerance = len(terms) * impact_index.dequantize(1) / 2 + 1e-9
+            self.assertEqual(len(matches), len(expected))
+            for ((score, _), (expected_score, _)) in zip(matches, expected):
+                self.assertAlmostEqual(score, expected_score, delta=tolerance)
+            for (score, document_id) in matches:
+                exact = sum(ranker.contribution(term, count, posting) for (term, count) in terms.items()
+                            for posting in self._index[term] if posting.document_id == document_id)
+                self.assertAlmostEqual(score, exact, delta=tolerance)
+
+    def test_stops_early(self):
+        import contextlib
+        import io
+        from searchengine import ImpactOrderedSearchEngine
+        engine = ImpactOrderedSearchEngine(self._corpus, self._impact_index)
+        for (query, hit_count, stops) in (("of", 1, True), ("of", 10, False), ("the", 1, False), ("wtf", 1, False)):
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                statistics = engine.evaluate(query, {"hit_count": hit_count, "debug": True}, lambda m: None)
+            self.assertEqual("STOPPING EARLY" in output.getvalue(), stops, query)
+            self.assertEqual(statistics["bands_processed"] < statistics["bands"], stops, query)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+from test import data_path
+
+class TestShardedSearchEngine(unittest.TestCase):
+    def setUp(self):
+        from normalization import BrainDeadNormalizer
+        from tokenization import BrainDeadTokenizer
+        self._normalizer = BrainDeadNormalizer()
+        self._tokenizer = BrainDeadTokenizer()
+
+    def _assert_same_results(self, expected, actual):
+        # Scores must be identical. Documents must be, too, except for ties at the bottom of the list.
+        self.assertListEqual([score for (score, _) in actual], [score for (score, _) in expected])
+        if expected:
+            cutoff = expected[-1][0]
+            self.assertSetEqual({d for (s, d) in actual if s > cutoff}, {d for (s, d) in expected if s > cutoff})
+
+    def test_mesh_corpus(self):
+        import os.path
+        from corpus import InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from ranking import BetterRanker, BM25Ranker
+        from searchengine import SimpleSearchEngine
+        from sharding import ShardedSearchEngine
+        corpus = InMemoryCorpus(os.path.join(data_path, 'mesh.txt'))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+        engine = SimpleSearchEngine(corpus, index)
+        queries = ["water pollution", "syndrome of the", "acid acid", "wtf", "water of the acid"]
+        for factory in (BetterRanker, BM25Ranker):
+            ranker = factory(corpus, index)
+            with ShardedSearchEngine(corpus, ["body"], self._normalizer, self._tokenizer, 3, factory) as sharded:
+                for query in queries:
+                    for options in ({"match_threshold": 0.5, "hit_count": 10},
+                                    {"match_threshold": 0.1, "hit_count": 25, "traversal": "wand"},
+                                    {"match_threshold": 1.0, "hit_count": 5, "traversal": "taat"}):
+                        (expected, actual) = ([], [])
+                        engine.evaluate(query, options, ranker,
+                                        lambda m: expected.append((m["score"], m["document"].document_id)))
+                        statistics = sharded.evaluate(query, options,
+                                                      lambda m: actual.append((m["score"], m["document"].document_id)))
+                        self._assert_same_results(expected, actual)
+                        self.assertEqual(statistics["shards"], 3)
+
+    def test_search_after(self):
+        import os.path
+        from corpus import InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from ranking import BetterRanker
+        from searchengine import SimpleSearchEngine
+        from sharding import ShardedSearchEngine
+        corpus = InMemoryCorpus(os.path.join(data_path, 'mesh.txt'))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+        engine = SimpleSearchEngine(corpus, index)
+        ranker = BetterRanker(corpus, index)
+        with ShardedSearchEngine(corpus, ["body"], self._normalizer, self._tokenizer, 3) as sharded:
+            cursors = [None, None]
+            for _ in range(5):
+                pages = ([], [])
+                options = [{"match_threshold": 0.5, "hit_count": 6, "search_after": cursor} for cursor in cursors]
+                statistics = [engine.evaluate("water pollution", options[0], ranker,
+                                              lambda m: pages[0].append((m["score"], m["document"].document_id))),
+                              sharded.evaluate("water pollution", options[1],
+                                               lambda m: pages[1].append((m["score"], m["document"].document_id)))]
+                self.assertListEqual(pages[1], pages[0])
+                cursors = [s["cursor"] for s in statistics]
+                self.assertEqual(cursors[1], cursors[0])
+
+    def test_errors(self):
+        from corpus import InMemoryDocument, InMemoryCorpus
+        from sharding import ShardedSearchEngine
+        corpus = InMemoryCorpus()
+        corpus.add_document(InMemoryDocument(0, {"body": "a b c"}))
+        corpus.add_document(InMemoryDocument(1, {"body": "b c d"}))
+        with ShardedSearchEngine(corpus, ["body"], self._normalizer, self._tokenizer, 2) as sharded:
+            with self.assertRaises(TypeError):
+                sharded.evaluate("b", {"hit_count": "many"}, lambda m: None)
+            matches = []
+            sharded.evaluate("b c", {"hit_count": 5}, lambda m: matches.append(m["document"].document_id))
+            self.assertSetEqual(set(matches), {0, 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -184,6 +184,326 @@ class TestSimpleSearchEngine(unittest.TestCase):
                                            {"match_threshold": 0.1, "hit_count": 10},
                                            (10, 7.0, [1275]))
 
+    def test_boolean_queries(self):
+        import os.path
+        from corpus import InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from searchengine import SimpleSearchEngine
+        corpus = InMemoryCorpus(os.path.join(data_path, 'mesh.txt'))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+        engine = SimpleSearchEngine(corpus, index)
+        for (query, expected) in (('"water pollution"', [25274, 25275, 25276]),
+                                  ('"pollution water"', []),
+                                  ('"water pollution" AND NOT "water pollution, chemical"', [25274, 25276]),
+                                  ('polluTION AND NOT (water OR air)', [8079, 23837])):
+            matches = []
+            engine.evaluate_boolean(query, {}, lambda m: matches.append(m["document"].document_id))
+            self.assertListEqual(matches, expected)
+
+    def test_filters_and_exclusions(self):
+        import os.path
+        from corpus import InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from ranking import BetterRanker
+        from searchengine import SimpleSearchEngine
+        from utilities import BitSet
+        corpus = InMemoryCorpus(os.path.join(data_path, 'mesh.txt'))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+        engine = SimpleSearchEngine(corpus, index)
+        ranker = BetterRanker(corpus, index)
+        excluded = {p.document_id for term in ("air", "chemical") for p in index[term]}
+        for traversal in ("daat", "taat"):
+            for query in ("water pollution", "toxic water air"):
+                options = {"match_threshold": 0.1, "hit_count": 100, "traversal": traversal}
+                results = []
+                engine.evaluate(query, options, ranker,
+                                lambda m: results.append((m["score"], m["document"].document_id)))
+                restrictions = [({"filter": BitSet(range(0, 25000, 2))}, lambda d: d < 25000 and d % 2 == 0),
+                                ({"filter": lambda d: d % 3 == 0}, lambda d: d % 3 == 0),
+                                ({"exclude": "air Chemical"}, lambda d: d not in excluded)]
+                for (restriction, keep) in restrictions:
+                    matches = []
+                    engine.evaluate(query, {**options, **restriction}, ranker,
+                                    lambda m: matches.append((m["score"], m["document"].document_id)))
+                    self.assertListEqual(matches, [(s, d) for (s, d) in results if keep(d)])
+        lookups = []
+        get_postings_iterator = index.get_postings_iterator
+        index.get_postings_iterator = lambda term: lookups.append(term) or get_postings_iterator(term)
+        for traversal in ("daat", "taat", "wand", "maxscore"):
+            lookups.clear()
+            engine.evaluate("toxic water pollution", {"exclude": "air", "traversal": traversal}, ranker, lambda m: None)
+            self.assertEqual(lookups.count("air"), 1)
+            self.assertEqual(lookups.count("water"), 1 if traversal in ("daat", "taat") else 0)
+
+    def test_term_at_a_time_traversal(self):
+        import os.path
+        from corpus import InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from ranking import BrainDeadRanker, BetterRanker
+        from searchengine import SimpleSearchEngine
+        for (filename, queries) in (('mesh.txt', ["water pollution", "of the", "syndrome of the", "acid acid", "wtf"]),
+                                    ('en.txt', ["the of and", "king of the world", "a a b", "the"])):
+            corpus = InMemoryCorpus(os.path.join(data_path, filename))
+            index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+            engine = SimpleSearchEngine(corpus, index)
+            for ranker in (BrainDeadRanker(), BetterRanker(corpus, index)):
+                for query in queries:
+                    for match_threshold in (0.1, 0.5, 1.0):
+                        results = {}
+                        for traversal in ("daat", "taat", "auto"):
+                            matches = []
+                            options = {"traversal": traversal, "match_threshold": match_threshold, "hit_count": 20}
+                            engine.evaluate(query, options, ranker,
+                                            lambda m: matches.append((round(m["score"], 9), m["document"].document_id)))
+                            results[traversal] = matches
+                        self.assertListEqual(results["taat"], results["daat"])
+                        self.assertListEqual(results["auto"], results["daat"])
+
+    def test_automatic_traversal(self):
+        import os.path
+        from corpus import InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from ranking import Ranker, BrainDeadRanker
+        from searchengine import SimpleSearchEngine
+
+        class LongestRunRanker(BrainDeadRanker):
+            def reset(self, document_id):
+                super().reset(document_id)
+                self._longest = 0
+
+            def update(self, term, multiplicity, posting):
+                self._longest = max(self._longest, posting.term_frequency)
+
+            def evaluate(self):
+                return self._longest
+
+            contribution = Ranker.contribution
+
+        corpus = InMemoryCorpus(os.path.join(data_path, 'en.txt'))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+        engine = SimpleSearchEngine(corpus, index)
+        self.assertGreaterEqual(index.get_document_frequency("of"), 1000)
+        for (ranker, options, expected) in ((BrainDeadRanker(), {}, "daat"),
+                                            (BrainDeadRanker(), {"traversal": "auto"}, "taat"),
+                                            (LongestRunRanker(), {"traversal": "auto"}, "daat")):
+            statistics = engine.evaluate("of the", options, ranker, lambda m: None)
+            self.assertEqual(statistics["traversal"], expected)
+        for traversal in ("tat", "DAAT", None):
+            with self.assertRaises(ValueError):
+                engine.evaluate("of the", {"traversal": traversal}, BrainDeadRanker(), lambda m: None)
+
+    def test_result_cache(self):
+        import os.path
+        from corpus import InMemoryCorpus, InMemoryDocument
+        from invertedindex import InMemoryInvertedIndex
+        from ranking import BrainDeadRanker, BetterRanker
+        from searchengine import SimpleSearchEngine
+        corpus = InMemoryCorpus(os.path.join(data_path, 'mesh.txt'))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+        engine = SimpleSearchEngine(corpus, index, result_cache_size=2)
+        uncached = SimpleSearchEngine(corpus, index)
+        ranker = BrainDeadRanker()
+
+        def evaluate(e, query, options, r=ranker):
+            matches = []
+            statistics = e.evaluate(query, options, r,
+                                    lambda m: matches.append((m["score"], m["document"].document_id)))
+            return matches, statistics["traversal"]
+
+        options = {"match_threshold": 0.5, "hit_count": 5}
+        (expected, _) = evaluate(uncached, "water pollution", options)
+        self.assertNotEqual(evaluate(engine, "water pollution", options)[1], "cache")
+        self.assertEqual(evaluate(engine, "WATER  pollution", options), (expected, "cache"))
+        self.assertNotEqual(evaluate(engine, "water pollution", {"match_threshold": 0.5, "hit_count": 3})[1], "cache")
+        self.assertNotEqual(evaluate(engine, "water pollution", options, BetterRanker(corpus, index))[1], "cache")
+        self.assertNotEqual(evaluate(engine, "water pollution", {**options, "filter": [1, 2]})[1], "cache")
+        self.assertEqual(engine.stats()["result_cache"]["entries"], 2)
+        self.assertEqual(engine.stats()["result_cache"]["hits"], 1)
+        self.assertEqual(engine.stats()["result_cache"]["evictions"], 1)
+        self.assertIsNone(uncached.stats()["result_cache"])
+
+        # Changes to the index invalidate the cache.
+        self.assertEqual(evaluate(engine, "water pollution", {"match_threshold": 0.5, "hit_count": 3})[1], "cache")
+        index.delete_document(expected[0][1])
+        (matches, traversal) = evaluate(engine, "water pollution", {"match_threshold": 0.5, "hit_count": 3})
+        self.assertNotEqual(traversal, "cache")
+        self.assertNotIn(expected[0][1], [document_id for (_, document_id) in matches])
+        document = InMemoryDocument(corpus.size(), {"body": "water pollution water pollution"})
+        corpus.add_document(document)
+        index.add_document(document)
+        self.assertNotEqual(evaluate(engine, "water pollution", {"match_threshold": 0.5, "hit_count": 3})[1], "cache")
+
+        # Different traversals might break ties or round differently, so they don't share cached results.
+        self.assertNotEqual(evaluate(engine, "water pollution", {**options, "traversal": "taat"})[1], "cache")
+        self.assertEqual(evaluate(engine, "water pollution", {**options, "traversal": "taat"})[1], "cache")
+        self.assertNotEqual(evaluate(engine, "water pollution", {**options, "traversal": "wand"})[1], "cache")
+
+    def test_evaluate_many(self):
+        import os.path
+        from corpus import InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from ranking import BrainDeadRanker, BetterRanker
+        from searchengine import SimpleSearchEngine
+        for (filename, queries) in (('mesh.txt', ["water pollution", "syndrome of the", "acid acid", "wtf", "",
+                                                  "water of the", "water pollution"]),
+                                    ('en.txt', ["the of and", "king of the world", "a a b", "the", "king of england"])):
+            corpus = InMemoryCorpus(os.path.join(data_path, filename))
+            index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+            engine = SimpleSearchEngine(corpus, index)
+            for ranker in (BrainDeadRanker(), BetterRanker(corpus, index)):
+                for options in ({"match_threshold": 0.5, "hit_count": 5},
+                                {"match_threshold": 1.0, "hit_count": 20},
+                                {"match_threshold": 0.1, "hit_count": 10, "filter": range(0, 50000, 2)}):
+                    results = engine.evaluate_many(queries, options, ranker)
+                    self.assertEqual(len(results), len(queries))
+                    for (query, matches) in zip(queries, results):
+                        expected = []
+                        engine.evaluate(query, {**options, "traversal": "taat"}, ranker, expected.append)
+                        self.assertListEqual(matches, expected)
+
+    def test_budgets(self):
+        import os.path
+        from corpus import InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from ranking import BetterRanker
+        from searchengine import SimpleSearchEngine
+        corpus = InMemoryCorpus(os.path.join(data_path, 'en.txt'))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+        engine = SimpleSearchEngine(corpus, index, result_cache_size=10)
+        ranker = BetterRanker(corpus, index)
+        query = "the of and king"
+        for traversal in ("daat", "taat", "wand", "maxscore"):
+            (complete, partial) = ([], [])
+            options = {"traversal": traversal, "match_threshold": 0.1, "hit_count": 10}
+            statistics = engine.evaluate(query, {**options, "max_postings": 10 ** 9, "timeout": 60.0}, ranker,
+                                         lambda m: complete.append((m["score"], m["document"].document_id)))
+            self.assertFalse(statistics["partial"])
+            self.assertEqual(len(complete), 10)
+            statistics = engine.evaluate(query, {**options, "max_postings": 100, "exclude": "wtf"}, ranker,
+                                         lambda m: partial.append((m["score"], m["document"].document_id)))
+            self.assertTrue(statistics["partial"])
+            self.assertLessEqual(statistics["postings_scored"], 100 + 4)
+            self.assertGreater(len(partial), 0)
+            statistics = engine.evaluate(query, {**options, "timeout": 0.0, "exclude": "wtf"}, ranker, lambda m: None)
+            self.assertTrue(statistics["partial"])
+            self.assertLessEqual(statistics["postings_scored"], 4)
+
+        # Partial results are not cached.
+        statistics = engine.evaluate("the of", {"match_threshold": 0.1, "max_postings": 10}, ranker, lambda m: None)
+        self.assertTrue(statistics["partial"])
+        statistics = engine.evaluate("the of", {"match_threshold": 0.1}, ranker, lambda m: None)
+        self.assertNotEqual(statistics["traversal"], "cache")
+        self.assertFalse(statistics["partial"])
+
+    def test_search_after(self):
+        import os.path
+        from corpus import InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from ranking import BrainDeadRanker, BetterRanker
+        from searchengine import SimpleSearchEngine
+        corpus = InMemoryCorpus(os.path.join(data_path, 'mesh.txt'))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+        engine = SimpleSearchEngine(corpus, index, result_cache_size=10)
+        for ranker in (BrainDeadRanker(), BetterRanker(corpus, index)):
+            for query in ("water pollution", "acid of"):
+                options = {"match_threshold": 1.0, "hit_count": 100}
+                everything = []
+                engine.evaluate(query, options, ranker,
+                                lambda m: everything.append((m["score"], m["document"].document_id)))
+                self.assertLess(len(everything), 100)
+                expected = sorted(everything, key=lambda match: (-match[0], match[1]))
+                for traversal in ("daat", "taat", "wand", "maxscore"):
+                    (pages, cursor) = ([], None)
+                    while True:
+                        page = []
+                        options = {"match_threshold": 1.0, "hit_count": 7, "traversal": traversal,
+                                   "search_after": cursor}
+                        statistics = engine.evaluate(query, options, ranker,
+                                                     lambda m: page.append((m["score"], m["document"].document_id)))
+                        self.assertLessEqual(len(page), 7)
+                        pages.extend(page)
+                        cursor = statistics["cursor"]
+                        if cursor is None:
+                            break
+                    self.assertListEqual(pages, expected)
+        with self.assertRaises(ValueError):
+            engine.evaluate("water", {"search_after": "garbage"}, BrainDeadRanker(), lambda m: None)
+        self.assertIsNone(engine.evaluate("water", {}, BrainDeadRanker(), lambda m: None)["cursor"])
+
+    def test_dynamic_pruning_traversals(self):
+        import os.path
+        from corpus import InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from ranking import BrainDeadRanker, BetterRanker, BM25Ranker
+        from searchengine import SimpleSearchEngine
+        for (filename, queries) in (('mesh.txt', ["water pollution", "syndrome of the", "acid acid", "wtf"]),
+                                    ('en.txt', ["the of and", "king of the world", "a a b", "the",
+                                                "the war of the worlds was written by a man from england " +
+                                                "in the year"])):
+            corpus = InMemoryCorpus(os.path.join(data_path, filename))
+            index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+            engine = SimpleSearchEngine(corpus, index)
+            for ranker in (BrainDeadRanker(), BetterRanker(corpus, index), BM25Ranker(corpus, index)):
+                for query in queries:
+                    for (match_threshold, hit_count) in ((0.1, 1), (0.1, 10), (0.5, 5), (1.0, 20)):
+                        results = {}
+                        statistics = {}
+                        for traversal in ("daat", "wand", "maxscore"):
+                            matches = []
+                            options = {"traversal": traversal, "match_threshold": match_threshold,
+                                       "hit_count": hit_count}
+                            statistics[traversal] = engine.evaluate(
+                                query, options, ranker,
+                                lambda m: matches.append((round(m["score"], 9), m["document"].document_id)))
+                            results[traversal] = matches
+                        for traversal in ("wand", "maxscore"):
+                            self.assertListEqual(results[traversal], results["daat"])
+                            self.assertEqual(statistics[traversal]["traversal"], traversal)
+                            self.assertLessEqual(statistics[traversal]["documents_scored"],
+                                                 statistics["daat"]["documents_scored"])
+            for traversal in ("wand", "maxscore"):
+                matches = []
+                options = {"traversal": traversal, "match_threshold": 0.1, "hit_count": 5, "filter": [1, 2, 3]}
+                engine.evaluate(queries[0], options, BetterRanker(corpus, index),
+                                lambda m: matches.append(m["document"].document_id))
+                self.assertTrue(set(matches) <= {1, 2, 3})
+        corpus = InMemoryCorpus(os.path.join(data_path, 'en.txt'))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+        engine = SimpleSearchEngine(corpus, index)
+        statistics = {}
+        for traversal in ("daat", "wand", "maxscore"):
+            options = {"traversal": traversal, "match_threshold": 0.1, "hit_count": 10}
+            statistics[traversal] = engine.evaluate("the of and king", options, BetterRanker(corpus, index),
+                                                    lambda m: None)
+        self.assertLess(statistics["wand"]["documents_scored"], statistics["daat"]["documents_scored"])
+        self.assertLess(statistics["maxscore"]["postings_scored"], statistics["daat"]["postings_scored"])
+
+    def test_dynamic_pruning_after_additions(self):
+        import os.path
+        from corpus import InMemoryCorpus, InMemoryDocument
+        from invertedindex import InMemoryInvertedIndex
+        from ranking import BetterRanker
+        from searchengine import SimpleSearchEngine
+        corpus = InMemoryCorpus(os.path.join(data_path, 'mesh.txt'))
+        index = InMemoryInvertedIndex(corpus, ["body"], self._normalizer, self._tokenizer)
+        engine = SimpleSearchEngine(corpus, index)
+        ranker = BetterRanker(corpus, index)
+        engine.evaluate("water pollution", {"traversal": "wand"}, ranker, lambda m: None)
+        for addition in range(3):
+            document_id = corpus.size()
+            corpus.add_document(InMemoryDocument(document_id, {"body": "water", "static_quality_score": 50 + addition}))
+            index.add_document(corpus[document_id])
+            results = {}
+            for traversal in ("daat", "wand", "maxscore"):
+                matches = []
+                options = {"traversal": traversal, "match_threshold": 0.5, "hit_count": 3}
+                engine.evaluate("water pollution", options, ranker,
+                                lambda m: matches.append((round(m["score"], 9), m["document"].document_id)))
+                results[traversal] = matches
+            self.assertEqual(results["daat"][0][1], document_id)
+            self.assertListEqual(results["wand"], results["daat"])
+            self.assertListEqual(results["maxscore"], results["daat"])
+
 if __name__ == '__main__':
     unittest.main()
 
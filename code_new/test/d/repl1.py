@@ -1,4 +1,4 @@
-from test import simple_repl, data_path
+from test import simple_repl, print_stats, data_path
 
 
 def main():
@@ -14,6 +14,7 @@ def main():
     tokenizer = ShingleGenerator(3)
     corpus = InMemoryCorpus(os.path.join(data_path,'mesh.txt'))
     index = InMemoryInvertedIndex(corpus, ["body"], normalizer, tokenizer)
+    print_stats(index.stats())
     ranker = BrainDeadRanker()
     engine = SimpleSearchEngine(corpus, index)
     options = {"debug": False, "hit_count": 5, "match_threshold": 0.5}
@@ -0,0 +1,44 @@
+import unittest
+
+class TestBM25Ranker(unittest.TestCase):
+    def setUp(self):
+        from normalization import BrainDeadNormalizer
+        from tokenization import BrainDeadTokenizer
+        from corpus import InMemoryDocument, InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from ranking import BM25Ranker
+        normalizer = BrainDeadNormalizer()
+        tokenizer = BrainDeadTokenizer()
+        corpus = InMemoryCorpus()
+        corpus.add_document(InMemoryDocument(0, {"title": "the foo", "body": "x"}))
+        corpus.add_document(InMemoryDocument(1, {"title": "the foo", "body": "x y z w v u"}))
+        corpus.add_document(InMemoryDocument(2, {"title": "the foo foo", "body": "x"}))
+        corpus.add_document(InMemoryDocument(3, {"title": "the bar"}))
+        corpus.add_document(InMemoryDocument(4, {"title": "the baz"}))
+        self._index = InMemoryInvertedIndex(corpus, ["title", "body"], normalizer, tokenizer, compute_norms=True)
+        self._ranker = BM25Ranker(corpus, self._index)
+
+    def _score(self, document_id, term):
+        posting = next(p for p in self._index[term] if p.document_id == document_id)
+        self._ranker.reset(document_id)
+        self._ranker.update(term, 1, posting)
+        return self._ranker.evaluate()
+
+    def test_document_lengths(self):
+        self.assertEqual(self._index.get_document_length(1), 8)
+        self.assertEqual(self._index.get_document_length(1, "title"), 2)
+        self.assertEqual(self._index.get_document_length(3, "body"), 0)
+        self.assertAlmostEqual(self._index.get_average_document_length("title"), 11 / 5)
+        self.assertAlmostEqual(self._index.get_document_norm(3), self._index.get_document_norm(4))
+        self.assertGreater(self._index.get_document_norm(3), 0.0)
+        self._index.delete_document(1)
+        self.assertAlmostEqual(self._index.get_average_document_length("body"), 2 / 4)
+
+    def test_length_normalization(self):
+        self.assertGreater(self._score(0, "foo"), self._score(1, "foo"))
+        self.assertGreater(self._score(2, "foo"), self._score(0, "foo"))
+        self.assertGreater(self._score(3, "bar"), self._score(0, "foo"))
+
+
+if __name__ == '__main__':
+    unittest.main()
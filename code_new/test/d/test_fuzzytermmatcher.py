@@ -0,0 +1,81 @@
+import unittest
+from test import data_path
+
+class TestFuzzyTermMatcher(unittest.TestCase):
+    def setUp(self):
+        from normalization import BrainDeadNormalizer
+        from tokenization import BrainDeadTokenizer
+        from corpus import InMemoryDocument, InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from fuzzy import FuzzyTermMatcher
+        self._corpus = InMemoryCorpus()
+        self._corpus.add_document(InMemoryDocument(0, {"body": "banana bandana cabana"}))
+        self._corpus.add_document(InMemoryDocument(1, {"body": "banana ban bananas"}))
+        self._corpus.add_document(InMemoryDocument(2, {"body": "apple ape banana"}))
+        self._index = InMemoryInvertedIndex(self._corpus, ["body"], BrainDeadNormalizer(), BrainDeadTokenizer())
+        self._matcher = FuzzyTermMatcher(self._index)
+
+    def test_edit_distance(self):
+        from fuzzy import edit_distance
+        self.assertEqual(edit_distance("kitten", "sitting", 5), 3)
+        self.assertEqual(edit_distance("kitten", "sitting", 2), 3)
+        self.assertEqual(edit_distance("", "abc", 3), 3)
+        self.assertEqual(edit_distance("abc", "abc", 0), 0)
+        self.assertEqual(edit_distance("abc", "acb", 1), 2)
+        self.assertEqual(edit_distance("flaw", "lawn", 2), 2)
+        self.assertEqual(edit_distance("a", "abcdef", 2), 3)
+
+    def test_candidates(self):
+        self.assertListEqual(self._matcher.candidates("banana", 0), [("banana", 0)])
+        self.assertListEqual(self._matcher.candidates("bananna", 1), [("banana", 1)])
+        self.assertListEqual(self._matcher.candidates("bananna", 2), [("banana", 1), ("bananas", 2), ("bandana", 2)])
+        self.assertListEqual(self._matcher.candidates("banana", 2),
+                             [("banana", 0), ("bananas", 1), ("bandana", 1), ("cabana", 2)])
+        self.assertListEqual(self._matcher.candidates("ap", 1), [("ape", 1)])
+        self.assertListEqual(self._matcher.candidates("xyzzy", 2), [])
+
+    def test_candidates_match_exhaustive_search(self):
+        from fuzzy import edit_distance
+        vocabulary = list(self._index.get_vocabulary())
+        for term in ["banan", "bnana", "aple", "cabbana", "b", "", "bandanas", "nabana"]:
+            for max_distance in range(4):
+                expected = {t for t in vocabulary if edit_distance(term, t, max_distance) <= max_distance}
+                self.assertSetEqual({t for (t, _) in self._matcher.candidates(term, max_distance)}, expected)
+
+    def test_expand(self):
+        self.assertEqual(self._matcher.expand("Bananna and APLE", expansions=2), "banana bananas and ape apple")
+        self.assertEqual(self._matcher.expand("bananna", expansions=1), "banana")
+        self.assertEqual(self._matcher.expand("cabana ape"), "cabana ape")
+
+    def test_short_terms_in_large_vocabulary(self):
+        import os.path
+        from corpus import InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        from normalization import BrainDeadNormalizer
+        from tokenization import BrainDeadTokenizer
+        from fuzzy import FuzzyTermMatcher, edit_distance
+        corpus = InMemoryCorpus(os.path.join(data_path, 'mesh.txt'))
+        index = InMemoryInvertedIndex(corpus, ["body"], BrainDeadNormalizer(), BrainDeadTokenizer())
+        matcher = FuzzyTermMatcher(index)
+        self.assertGreater(matcher.stats()["variants"], 0)
+        vocabulary = list(index.get_vocabulary())
+        for term in ["", "a", "hiv", "acid", "aids", "bloo", "zzzz", "aaaaaaaa", "waterr"]:
+            for max_distance in range(4):
+                expected = {t for t in vocabulary if edit_distance(term, t, max_distance) <= max_distance}
+                self.assertSetEqual({t for (t, _) in matcher.candidates(term, max_distance)}, expected)
+
+    def test_refresh(self):
+        from corpus import InMemoryDocument
+        self.assertListEqual(self._matcher.candidates("cherry", 1), [])
+        self._corpus.add_document(InMemoryDocument(3, {"body": "cherry pi"}))
+        self._index.add_document(self._corpus[3])
+        self.assertTrue(self._matcher.stats()["stale"])
+        self.assertListEqual(self._matcher.candidates("chery", 1), [])
+        self._matcher.refresh()
+        self.assertFalse(self._matcher.stats()["stale"])
+        self.assertListEqual(self._matcher.candidates("chery", 1), [("cherry", 1)])
+        self.assertListEqual(self._matcher.candidates("p", 1), [("pi", 1)])
+        self.assertEqual(self._matcher.stats()["terms"], 9)
+
+if __name__ == '__main__':
+    unittest.main()
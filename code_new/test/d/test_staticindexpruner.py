@@ -0,0 +1,43 @@
+import unittest
+
+class TestStaticIndexPruner(unittest.TestCase):
+    def setUp(self):
+        from normalization import BrainDeadNormalizer
+        from tokenization import BrainDeadTokenizer
+        from corpus import InMemoryDocument, InMemoryCorpus
+        from invertedindex import InMemoryInvertedIndex
+        self._corpus = InMemoryCorpus()
+        self._corpus.add_document(InMemoryDocument(0, {"body": "the foo foo foo"}))
+        self._corpus.add_document(InMemoryDocument(1, {"body": "the the foo bar"}))
+        self._corpus.add_document(InMemoryDocument(2, {"body": "the bar bar"}))
+        self._corpus.add_document(InMemoryDocument(3, {"body": "the baz"}))
+        self._index = InMemoryInvertedIndex(self._corpus, ["body"], BrainDeadNormalizer(), BrainDeadTokenizer())
+
+    def test_global_threshold(self):
+        from ranking import BrainDeadRanker
+        from pruning import StaticIndexPruner
+        pruned = StaticIndexPruner(BrainDeadRanker()).prune(self._index, global_threshold=2)
+        self.assertListEqual([(p.document_id, p.term_frequency) for p in pruned["foo"]], [(0, 3)])
+        self.assertListEqual([(p.document_id, p.term_frequency) for p in pruned["the"]], [(1, 2)])
+        self.assertListEqual(list(pruned["baz"]), [])
+        self.assertEqual(pruned.get_document_frequency("the"), 4)
+        self.assertEqual(len(list(self._index["the"])), 4)
+
+    def test_term_threshold_and_report(self):
+        from ranking import BetterRanker
+        from pruning import StaticIndexPruner
+        pruner = StaticIndexPruner(BetterRanker(self._corpus, self._index))
+        pruned = pruner.prune(self._index, term_fraction=0.9, top=1)
+        self.assertListEqual([p.document_id for p in pruned["foo"]], [0])
+        self.assertListEqual([p.document_id for p in pruned["bar"]], [2])
+        self.assertListEqual([p.document_id for p in pruned["baz"]], [3])
+        report = pruner.report(self._corpus, self._index, pruned, ["foo", "bar", "baz", "wtf"], {"hit_count": 1})
+        self.assertEqual(report["postings"]["unpruned"], 9)
+        self.assertEqual(report["postings"]["pruned"], 7)
+        self.assertAlmostEqual(report["reduction"], 2 / 9)
+        self.assertEqual(report["queries"], 3)
+        self.assertEqual(report["average_overlap"], 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
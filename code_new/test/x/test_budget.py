@@ -0,0 +1,27 @@
+import unittest
+
+
+class TestBudget(unittest.TestCase):
+    def test_work(self):
+        from utilities import Budget
+        budget = Budget(work=10, interval=4)
+        self.assertTrue(all(budget.spend() for _ in range(9)))
+        self.assertFalse(budget.exhausted)
+        self.assertFalse(budget.spend())
+        self.assertTrue(budget.exhausted)
+        self.assertEqual(budget.spent, 10)
+        self.assertTrue(Budget(work=0).exhausted)
+        self.assertTrue(Budget().spend(10 ** 9))
+
+    def test_deadline(self):
+        import time
+        from utilities import Budget
+        self.assertTrue(Budget(seconds=0.0).exhausted)
+        budget = Budget(seconds=0.05, interval=1)
+        self.assertTrue(budget.spend())
+        time.sleep(0.1)
+        self.assertFalse(budget.spend())
+        budget = Budget(seconds=0.05, interval=100)
+        time.sleep(0.1)
+        self.assertTrue(budget.spend(10))
+        self.assertFalse(budget.spend(100))
@@ -0,0 +1,50 @@
+import unittest
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_eviction(self):
+        from utilities import LRUCache
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertNotIn("b", cache)
+        self.assertIn("a", cache)
+        self.assertIn("c", cache)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("b", 42), 42)
+        self.assertEqual(len(cache), 2)
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["evictions"], 1)
+        self.assertAlmostEqual(stats["hit_rate"], 1.0 / 3.0)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_concurrency(self):
+        import pickle
+        import threading
+        from utilities import LRUCache
+        cache = LRUCache(8)
+
+        def work(offset):
+            for i in range(5000):
+                key = (offset + i) % 16
+                if cache.get(key) is None:
+                    cache.put(key, key)
+
+        threads = [threading.Thread(target=work, args=(offset,)) for offset in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = cache.stats()
+        self.assertEqual(stats["hits"] + stats["misses"], 8 * 5000)
+        self.assertEqual(len(cache), 8)
+        copy = pickle.loads(pickle.dumps(cache))
+        self.assertEqual(copy.stats(), stats)
+        copy.put("a", 1)
+        self.assertEqual(copy.get("a"), 1)
@@ -17,3 +17,5 @@ class TestInMemoryDictionary(unittest.TestCase):
         self.assertNotIn("wtf", vocabulary)
         self.assertIsNone(vocabulary.get_term_id("wtf"))
         self.assertListEqual(sorted([v for v in vocabulary]), [("bar", 1), ("foo", 0)])
+        self.assertEqual(vocabulary.stats()["terms"], 2)
+        self.assertGreater(vocabulary.stats()["bytes"], 0)
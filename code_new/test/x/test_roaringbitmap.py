@@ -0,0 +1,37 @@
+import unittest
+
+
+class TestRoaringBitmap(unittest.TestCase):
+    def test_membership(self):
+        from bitmap import RoaringBitmap
+        members = [3, 70000, 5, 200000, 3] + list(range(131072, 131072 + 5000))
+        bitmap = RoaringBitmap(members)
+        self.assertEqual(len(bitmap), len(set(members)))
+        self.assertListEqual(list(bitmap), sorted(set(members)))
+        for member in members:
+            self.assertIn(member, bitmap)
+        for member in (0, 4, 65539, 70001, 131071, 136072, 200001):
+            self.assertNotIn(member, bitmap)
+        stats = bitmap.stats()
+        self.assertEqual(stats["members"], len(bitmap))
+        self.assertEqual(stats["array_containers"], 3)
+        self.assertEqual(stats["bitset_containers"], 1)
+        self.assertListEqual(list(RoaringBitmap()), [])
+
+    def test_set_operations(self):
+        import random
+        from bitmap import RoaringBitmap
+        rng = random.Random(1234)
+        for _ in range(50):
+            members1 = set(rng.sample(range(150000), rng.choice([0, 10, 3000, 5000, 50000])))
+            members2 = set(rng.sample(range(150000), rng.choice([0, 10, 3000, 5000, 50000])))
+            (bitmap1, bitmap2) = (RoaringBitmap(members1), RoaringBitmap(members2))
+            self.assertListEqual(list(bitmap1 & bitmap2), sorted(members1 & members2))
+            self.assertListEqual(list(bitmap1 | bitmap2), sorted(members1 | members2))
+            self.assertListEqual(list(bitmap1 - bitmap2), sorted(members1 - members2))
+            self.assertEqual(len(bitmap1 & bitmap2), len(members1 & members2))
+            self.assertEqual(bitmap1.intersection_count(bitmap2), len(members1 & members2))
+
+
+if __name__ == '__main__':
+    unittest.main()
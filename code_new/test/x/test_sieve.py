@@ -16,3 +16,37 @@ class TestSieve(unittest.TestCase):
         sieve.sift(3.0, "three")
         sieve.sift(4.0, "four")
         self.assertListEqual(list(sieve.winners()), [(10.0, "ten"), (9.0, "nine"), (8.0, "eight")])
+
+    def test_pages(self):
+        from utilities import PageSieve
+        scored = [(float(document_id % 4), document_id) for document_id in range(30)]
+        expected = sorted(scored, key=lambda pair: (-pair[0], pair[1]))
+        (pages, cursor) = ([], None)
+        while True:
+            sieve = PageSieve(7, cursor)
+            for (score, document_id) in scored:
+                sieve.sift(score, document_id)
+            page = list(sieve.winners())
+            pages.extend(page)
+            if len(page) < 7:
+                break
+            cursor = PageSieve.encode(*page[-1])
+        self.assertListEqual(pages, expected)
+        self.assertEqual(PageSieve.decode(PageSieve.encode(2.5, 42)), (2.5, 42))
+        for malformed in ("", "zz", "abc\u00e9", None):
+            with self.assertRaises(ValueError):
+                PageSieve(7, malformed if malformed is not None else 42)
+
+    def test_tombstones(self):
+        from utilities import Sieve, BitSet
+        tombstones = BitSet([2, 3, 1000])
+        self.assertEqual(len(tombstones), 3)
+        self.assertIn(1000, tombstones)
+        self.assertNotIn(999, tombstones)
+        tombstones.discard(3)
+        self.assertListEqual(list(tombstones), [2, 1000])
+        sieve = Sieve(2, tombstones)
+        for document_id in range(5):
+            sieve.sift(float(document_id), document_id)
+        sieve.sift(9.0, 1000)
+        self.assertListEqual(list(sieve.winners()), [(4.0, 4), (3.0, 3)])
@@ -0,0 +1,63 @@
+import unittest
+
+
+class TestTinyLFUCache(unittest.TestCase):
+    def test_budget(self):
+        from utilities import TinyLFUCache
+        cache = TinyLFUCache(100)
+        self.assertTrue(cache.put("a", "A", 60))
+        self.assertEqual(cache.get("a"), "A")
+        self.assertFalse(cache.put("huge", "H", 101))
+        self.assertTrue(cache.put("b", "B", 40))
+        self.assertEqual(cache.stats()["size"], 100)
+        cache.discard("b")
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.stats()["size"], 60)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("b", 42), 42)
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["rejections"]), (1, 2, 1))
+
+    def test_scan_resistance(self):
+        from utilities import TinyLFUCache
+        cache = TinyLFUCache(10)
+        for _ in range(5):
+            for key in ("the", "of"):
+                if cache.get(key) is None:
+                    cache.put(key, key.upper(), 4)
+
+        # A burst of one-off keys doesn't displace the frequently used ones.
+        for i in range(100):
+            key = "rare" + str(i)
+            if cache.get(key) is None:
+                cache.put(key, key.upper(), 4)
+        self.assertIn("the", cache)
+        self.assertIn("of", cache)
+        self.assertLessEqual(cache.stats()["size"], 10)
+
+        # But a key that becomes popular eventually gets in.
+        for _ in range(20):
+            if cache.get("new") is None:
+                cache.put("new", "NEW", 4)
+        self.assertIn("new", cache)
+        self.assertLessEqual(cache.stats()["size"], 10)
+        self.assertGreater(cache.stats()["evictions"], 0)
+
+    def test_rejected_update(self):
+        from utilities import TinyLFUCache
+        cache = TinyLFUCache(10)
+        self.assertTrue(cache.put("a", "A", 4))
+        self.assertTrue(cache.put("b", "B", 6))
+        for _ in range(5):
+            self.assertEqual(cache.get("b"), "B")
+
+        # Growing "a" would evict the more popular "b", so the old value stays.
+        self.assertFalse(cache.put("a", "AAA", 8))
+        self.assertEqual(cache.get("a"), "A")
+        self.assertEqual(cache.get("b"), "B")
+        self.assertEqual(cache.stats()["size"], 10)
+
+        # An update that fits replaces the value in place.
+        self.assertTrue(cache.put("a", "AA", 3))
+        self.assertEqual(cache.get("a"), "AA")
+        self.assertEqual(cache.stats()["size"], 9)
@@ -18,3 +18,15 @@ class TestTrie(unittest.TestCase):
         node = node.consume("b")
         self.assertTrue(node.is_final())
         self.assertEqual(node, root.consume("abb"))
+
+    def test_stats(self):
+        from tokenization import BrainDeadTokenizer
+        from ahocorasick import Trie
+        root = Trie()
+        for s in ["abba", "abb", "x y"]:
+            root.add(s, BrainDeadTokenizer())
+        stats = root.stats()
+        self.assertEqual(stats["strings"], 3)
+        self.assertEqual(stats["nodes"], 11)
+        self.assertEqual(stats["depth"], 4)
+        self.assertGreater(stats["bytes"], 0)
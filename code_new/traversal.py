@@ -1,15 +1,35 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-from typing import Iterator
-from invertedindex import Posting
+import bisect
+import re
+import sys
+from abc import ABC, abstractmethod
+from array import array
+from collections import Counter
+from typing import Callable, Container, Iterator, List, Optional, Sequence, Tuple, Union
+from invertedindex import Posting, InvertedIndex
+from bitmap import RoaringBitmap
+
+try:
+    import vectorized
+except ImportError:
+    vectorized = None
+
+DocumentIds = Union[RoaringBitmap, Sequence[int]]
 
 
 class PostingsMerger:
     """
     Utility class for merging posting lists.
+
+    Sets of document identifiers are merged using NumPy, if available, when their combined size
+    is large enough that doing the merge element by element in Python would dominate.
     """
 
+    # Vectorize operations on sets of document identifiers having at least this many elements in total.
+    _vectorization_threshold = 256
+
     @staticmethod
     def intersection(p1: Iterator[Posting], p2: Iterator[Posting]) -> Iterator[Posting]:
         """
@@ -75,3 +95,799 @@ class PostingsMerger:
         while current2:
             yield current2
             current2 = next(p2, None)
+
+    @staticmethod
+    def difference(p1: Iterator[Posting], p2: Iterator[Posting]) -> Iterator[Posting]:
+        """
+        A generator that yields a simple AND NOT of two posting lists, given
+        iterators over these. I.e., the postings in the first list for documents
+        that aren't in the second list. The second list is consumed lazily, and
+        only as far as the first list requires.
+
+        The posting lists are assumed sorted in increasing order according
+        to the document identifiers.
+        """
+
+        # Start at the head.
+        current1 = next(p1, None)
+        current2 = next(p2, None)
+
+        # We're doing an AND NOT. Once the second list is exhausted, we just yield the
+        # remaining tail of the first one.
+        while current1:
+
+            # Catch up on the second list, and yield unless we have a match.
+            while current2 and current2.document_id < current1.document_id:
+                current2 = next(p2, None)
+            if not current2 or current2.document_id != current1.document_id:
+                yield current1
+            current1 = next(p1, None)
+
+    @staticmethod
+    def filter(p: Iterator[Posting], documents: Union[Container[int], Callable[[int], bool]]) -> Iterator[Posting]:
+        """
+        A generator that yields the postings in a posting list, given an iterator
+        over it, for the documents that pass the given filter. The filter is either
+        a set of document identifiers to keep, e.g., a BitSet or a RoaringBitmap,
+        or a predicate over document identifiers.
+        """
+        keep = documents if callable(documents) else documents.__contains__
+        return (posting for posting in p if keep(posting.document_id))
+
+    @staticmethod
+    def union_of_many(iterators: List[Iterator[Posting]]) -> Iterator[Tuple[int, List[Tuple[int, Posting]]]]:
+        """
+        A generator that yields an OR of any number of posting lists, given iterators over these.
+        For each document that occurs in at least one of the lists we yield a single entry, i.e.,
+        a (document identifier, matches) pair where the matches are (i, posting) pairs for the
+        i-th lists that contain the document, ordered by i. Counting the matches gives us N-of-M
+        matching, and the postings give us the term frequencies.
+
+        The posting lists are assumed sorted in increasing order according to the document
+        identifiers. To find the list with the smallest current document identifier we use a
+        "loser tree", i.e., a tournament tree where each internal node remembers the loser of the
+        match played there and the overall winner is kept at the root. When the winning list has
+        been advanced, only the matches along the path from its leaf to the root are replayed.
+        This takes about log2(M) comparisons, about half as many as a binary heap needs.
+        """
+
+        # Exhausted lists are represented by a document identifier that compares larger than all others.
+        # Ties are broken by list number, so that the lists having the same document identifier come out
+        # in order.
+        exhausted = sys.maxsize
+        size = len(iterators)
+        if not size:
+            return
+        current = [next(iterator, None) for iterator in iterators]
+        keys = [exhausted if posting is None else posting.document_id for posting in current]
+
+        # The tree has the lists as leaves size through 2 * size - 1. The internal nodes 1 through size - 1
+        # keep track of the losers, and node 0 keeps track of the overall winner.
+        tree = [0] * size
+
+        def play(node: int) -> int:
+            if node >= size:
+                return node - size
+            (left, right) = (play(2 * node), play(2 * node + 1))
+            (winner, loser) = (left, right) if (keys[left], left) < (keys[right], right) else (right, left)
+            tree[node] = loser
+            return winner
+
+        tree[0] = play(1) if size > 1 else 0
+
+        # Pop the winners, advance them, and replay their matches. Consecutive winners having the same
+        # document identifier are collected into a single entry.
+        while keys[tree[0]] != exhausted:
+            document_id = keys[tree[0]]
+            matches = []
+            while keys[tree[0]] == document_id:
+                winner = tree[0]
+                matches.append((winner, current[winner]))
+                current[winner] = next(iterators[winner], None)
+                keys[winner] = exhausted if current[winner] is None else current[winner].document_id
+                node = (winner + size) >> 1
+                while node > 0:
+                    if (keys[tree[node]], tree[node]) < (keys[winner], winner):
+                        (tree[node], winner) = (winner, tree[node])
+                    node >>= 1
+                tree[0] = winner
+            yield document_id, matches
+
+    @staticmethod
+    def intersection_of_document_ids(ids1: DocumentIds, ids2: DocumentIds) -> DocumentIds:
+        """
+        Returns a simple AND of two sets of document identifiers, as returned by an inverted index.
+        These are either compressed bitmaps or sorted sequences.
+
+        The AND of two bitmaps is a bitmap. Otherwise, the result can be no larger than the sequence
+        involved, so the result is a sorted sequence.
+        """
+        if isinstance(ids1, RoaringBitmap) and isinstance(ids2, RoaringBitmap):
+            return ids1 & ids2
+        elif isinstance(ids1, RoaringBitmap):
+            return array("l", (d for d in ids2 if d in ids1))
+        elif isinstance(ids2, RoaringBitmap):
+            return array("l", (d for d in ids1 if d in ids2))
+        elif PostingsMerger._is_vectorizable(len(ids1) + len(ids2)):
+            return vectorized.as_array(vectorized.intersection([vectorized.as_ndarray(ids1),
+                                                                vectorized.as_ndarray(ids2)]))
+        else:
+            return array("l", sorted(set(ids1).intersection(ids2)))
+
+    @staticmethod
+    def union_of_document_ids(ids1: DocumentIds, ids2: DocumentIds) -> DocumentIds:
+        """
+        Returns a simple OR of two sets of document identifiers, as returned by an inverted index.
+        These are either compressed bitmaps or sorted sequences.
+
+        The OR of two sequences is a sorted sequence. Otherwise, the result is at least as dense
+        as the bitmap involved, so the result is a bitmap.
+        """
+        if isinstance(ids1, RoaringBitmap) and isinstance(ids2, RoaringBitmap):
+            return ids1 | ids2
+        elif isinstance(ids1, RoaringBitmap):
+            return ids1 | RoaringBitmap(ids2)
+        elif isinstance(ids2, RoaringBitmap):
+            return RoaringBitmap(ids1) | ids2
+        elif PostingsMerger._is_vectorizable(len(ids1) + len(ids2)):
+            return vectorized.as_array(vectorized.union([vectorized.as_ndarray(ids1), vectorized.as_ndarray(ids2)]))
+        else:
+            return array("l", sorted(set(ids1).union(ids2)))
+
+    @staticmethod
+    def difference_of_document_ids(ids1: DocumentIds, ids2: DocumentIds) -> DocumentIds:
+        """
+        Returns a simple AND NOT of two sets of document identifiers, as returned by an inverted index,
+        i.e., the documents in the first set that aren't in the second. These are either compressed bitmaps
+        or sorted sequences.
+
+        The result can be no larger than the first set, and is of the same kind.
+        """
+        if isinstance(ids1, RoaringBitmap):
+            return ids1 - (ids2 if isinstance(ids2, RoaringBitmap) else RoaringBitmap(ids2))
+        elif isinstance(ids2, RoaringBitmap):
+            return array("l", (d for d in ids1 if d not in ids2))
+        elif PostingsMerger._is_vectorizable(len(ids1) + len(ids2)):
+            return vectorized.as_array(vectorized.difference(vectorized.as_ndarray(ids1), vectorized.as_ndarray(ids2)))
+        else:
+            excluded = set(ids2)
+            return array("l", (d for d in ids1 if d not in excluded))
+
+    @staticmethod
+    def at_least(ids: List[DocumentIds], minimum: int) -> array:
+        """
+        Returns the documents that occur in at least the given number of the given sets of document
+        identifiers, as returned by an inverted index, i.e., does N-of-M matching without ranking. The
+        sets are either compressed bitmaps or sorted sequences. The result is a sorted sequence.
+        """
+        if PostingsMerger._is_vectorizable(sum(map(len, ids))):
+            return vectorized.as_array(vectorized.at_least([vectorized.as_ndarray(s) for s in ids], minimum))
+        sequences = [array("l", s) if isinstance(s, RoaringBitmap) else s for s in ids]
+        counts = Counter(d for s in sequences for d in s)
+        return array("l", sorted(d for (d, count) in counts.items() if count >= max(1, minimum)))
+
+    @staticmethod
+    def intersection_count(ids1: DocumentIds, ids2: DocumentIds) -> int:
+        """
+        Returns the number of documents in a simple AND of two sets of document identifiers, as
+        returned by an inverted index. For two bitmaps, the AND is never materialized.
+        """
+        if isinstance(ids1, RoaringBitmap) and isinstance(ids2, RoaringBitmap):
+            return ids1.intersection_count(ids2)
+        elif isinstance(ids1, RoaringBitmap):
+            return sum(1 for d in ids2 if d in ids1)
+        elif isinstance(ids2, RoaringBitmap):
+            return sum(1 for d in ids1 if d in ids2)
+        elif PostingsMerger._is_vectorizable(len(ids1) + len(ids2)):
+            return len(vectorized.intersection([vectorized.as_ndarray(ids1), vectorized.as_ndarray(ids2)]))
+        else:
+            return len(set(ids1).intersection(ids2))
+
+    @staticmethod
+    def intersection_of_many(ids: List[DocumentIds]) -> array:
+        """
+        Returns a simple AND of any number of sets of document identifiers, as returned by an
+        inverted index. These are either compressed bitmaps or sorted sequences, e.g., the arrays
+        that back the posting lists.
+
+        We do "small versus small" (SvS) intersection: The sequences are ordered by ascending
+        length, and the shortest one provides the initial candidates. The candidates are whittled
+        down by one sequence at a time, from the shortest to the longest. Since the candidates are
+        sorted, we look each of them up using galloping (exponential) search, starting from where
+        the previous lookup ended. That way, the cost adapts to how the sequences interleave and is
+        roughly logarithmic in the length of the longer sequence per candidate. Bitmaps are probed
+        last, since they support constant-time lookups.
+
+        If even the shortest set is large, the same strategy is carried out with vectorized operations
+        instead. Bitmaps are then unpacked, which is cheap compared to probing them one candidate at a time.
+        """
+        if not ids:
+            return array("l")
+        if PostingsMerger._is_vectorizable(min(map(len, ids)) * len(ids)):
+            return vectorized.as_array(vectorized.intersection([vectorized.as_ndarray(s) for s in ids]))
+        sequences = sorted((s for s in ids if not isinstance(s, RoaringBitmap)), key=len)
+        bitmaps = sorted((s for s in ids if isinstance(s, RoaringBitmap)), key=len)
+        candidates = array("l", sequences[0] if sequences else bitmaps.pop(0))
+        for sequence in sequences[1:]:
+            if not candidates:
+                break
+            survivors = array("l")
+            position = 0
+            for candidate in candidates:
+                position = PostingsMerger._gallop(sequence, candidate, position)
+                if position == len(sequence):
+                    break
+                if sequence[position] == candidate:
+                    survivors.append(candidate)
+            candidates = survivors
+        for bitmap in bitmaps:
+            candidates = array("l", (d for d in candidates if d in bitmap))
+        return candidates
+
+    @staticmethod
+    def _is_vectorizable(size: int) -> bool:
+        """
+        Returns True iff an operation that involves about the given number of document identifiers
+        should be vectorized.
+        """
+        return vectorized is not None and size >= PostingsMerger._vectorization_threshold
+
+    @staticmethod
+    def _gallop(sequence: Sequence[int], target: int, start: int) -> int:
+        """
+        Returns the position of the first element in the sorted sequence that is not smaller than the
+        target, looking no further back than the given start position. We probe positions that are
+        exponentially further ahead until we overshoot, and then do a binary search of the last leap.
+        """
+        (low, high, step) = (start, start, 1)
+        while high < len(sequence) and sequence[high] < target:
+            low = high + 1
+            high += step
+            step <<= 1
+        return bisect.bisect_left(sequence, target, low, min(high, len(sequence)))
+
+
+class DocumentCursor(ABC):
+    """
+    A cursor over an ascending sequence of document identifiers, as produced by a node in a
+    query plan. Besides advancing one document at a time, the cursor can skip ahead to a given
+    document identifier. The cursor initially points to the first document, if any.
+    """
+
+    def __init__(self):
+        self.current = None
+
+    @abstractmethod
+    def advance(self) -> Optional[int]:
+        """
+        Moves the cursor to the next document, and returns its identifier. Returns None if we
+        move past the end.
+        """
+        pass
+
+    @abstractmethod
+    def skip_to(self, document_id: int) -> Optional[int]:
+        """
+        Moves the cursor to the first document having an identifier that is at least as large
+        as the given one, and returns its identifier. The cursor never moves backwards. Returns
+        None if we move past the end.
+        """
+        pass
+
+
+class _TermCursor(DocumentCursor):
+    """
+    Traverses a term's posting list, skipping ahead using the inverted index's posting cursors.
+    """
+
+    def __init__(self, inverted_index: InvertedIndex, term: str):
+        super().__init__()
+        self._cursor = inverted_index.get_postings_cursor(term)
+        self.advance()
+
+    def advance(self) -> Optional[int]:
+        posting = next(self._cursor, None)
+        self.current = None if posting is None else posting.document_id
+        return self.current
+
+    def skip_to(self, document_id: int) -> Optional[int]:
+        if self.current is not None and self.current < document_id:
+            posting = self._cursor.skip_to(document_id)
+            self.current = None if posting is None else posting.document_id
+        return self.current
+
+
+class _AllCursor(DocumentCursor):
+    """
+    Traverses all documents that haven't been deleted.
+    """
+
+    def __init__(self, inverted_index: InvertedIndex, document_count: int):
+        super().__init__()
+        self._inverted_index = inverted_index
+        self._document_count = document_count
+        self._settle(0)
+
+    def _settle(self, document_id: int) -> Optional[int]:
+        while document_id < self._document_count and self._inverted_index.is_deleted(document_id):
+            document_id += 1
+        self.current = document_id if document_id < self._document_count else None
+        return self.current
+
+    def advance(self) -> Optional[int]:
+        return None if self.current is None else self._settle(self.current + 1)
+
+    def skip_to(self, document_id: int) -> Optional[int]:
+        if self.current is not None and self.current < document_id:
+            self._settle(document_id)
+        return self.current
+
+
+class _AndCursor(DocumentCursor):
+    """
+    Traverses the documents that all the given cursors agree on. The cursors should be ordered
+    by ascending length, so that the shortest one drives the traversal and the others are asked
+    to skip ahead as far as possible.
+    """
+
+    def __init__(self, cursors: List[DocumentCursor]):
+        super().__init__()
+        self._cursors = cursors
+        self._align()
+
+    def _align(self) -> Optional[int]:
+        if not self._cursors:
+            return None
+        target = self._cursors[0].current
+        while target is not None:
+            for cursor in self._cursors:
+                if cursor.skip_to(target) != target:
+                    target = cursor.current
+                    break
+            else:
+                break
+        self.current = target
+        return self.current
+
+    def advance(self) -> Optional[int]:
+        if self.current is None:
+            return None
+        self._cursors[0].advance()
+        return self._align()
+
+    def skip_to(self, document_id: int) -> Optional[int]:
+        if self.current is not None and self.current < document_id:
+            self._cursors[0].skip_to(document_id)
+            self._align()
+        return self.current
+
+
+class _OrCursor(DocumentCursor):
+    """
+    Traverses the documents that at least one of the given cursors point to.
+    """
+
+    def __init__(self, cursors: List[DocumentCursor]):
+        super().__init__()
+        self._cursors = cursors
+        self._settle()
+
+    def _settle(self) -> Optional[int]:
+        self.current = min((c.current for c in self._cursors if c.current is not None), default=None)
+        return self.current
+
+    def advance(self) -> Optional[int]:
+        for cursor in self._cursors:
+            if cursor.current is not None and cursor.current == self.current:
+                cursor.advance()
+        return self._settle()
+
+    def skip_to(self, document_id: int) -> Optional[int]:
+        for cursor in self._cursors:
+            cursor.skip_to(document_id)
+        return self._settle()
+
+
+class _AndNotCursor(DocumentCursor):
+    """
+    Traverses the documents that the first cursor points to, except the ones that the second cursor
+    points to. The second cursor is only ever asked to skip ahead to the documents of the first one.
+    """
+
+    def __init__(self, include: DocumentCursor, exclude: DocumentCursor):
+        super().__init__()
+        self._include = include
+        self._exclude = exclude
+        self._settle()
+
+    def _settle(self) -> Optional[int]:
+        while self._include.current is not None:
+            if self._exclude.skip_to(self._include.current) != self._include.current:
+                break
+            self._include.advance()
+        self.current = self._include.current
+        return self.current
+
+    def advance(self) -> Optional[int]:
+        self._include.advance()
+        return self._settle()
+
+    def skip_to(self, document_id: int) -> Optional[int]:
+        self._include.skip_to(document_id)
+        return self._settle()
+
+
+class _PredicateCursor(DocumentCursor):
+    """
+    Traverses the documents that the given cursor points to, and that satisfy the given predicate.
+    """
+
+    def __init__(self, cursor: DocumentCursor, predicate: Callable[[int], bool]):
+        super().__init__()
+        self._cursor = cursor
+        self._predicate = predicate
+        self._settle()
+
+    def _settle(self) -> Optional[int]:
+        while self._cursor.current is not None and not self._predicate(self._cursor.current):
+            self._cursor.advance()
+        self.current = self._cursor.current
+        return self.current
+
+    def advance(self) -> Optional[int]:
+        self._cursor.advance()
+        return self._settle()
+
+    def skip_to(self, document_id: int) -> Optional[int]:
+        self._cursor.skip_to(document_id)
+        return self._settle()
+
+
+class QueryNode(ABC):
+    """
+    Abstract base class for a node in the operator tree of a boolean query. Once planned, the tree
+    can be evaluated against an inverted index by opening a cursor at the root. The tree can also
+    be explained, i.e., rendered with an estimate of how many documents each node matches, which
+    is useful for understanding why a query is slow.
+    """
+
+    def __init__(self, children: List["QueryNode"]):
+        self.children = children
+
+    def __repr__(self):
+        return f"{self.describe()}({', '.join(map(repr, self.children))})"
+
+    @abstractmethod
+    def describe(self) -> str:
+        """
+        Returns a short, human-readable description of the node itself, excluding its children.
+        """
+        pass
+
+    @abstractmethod
+    def estimate(self, inverted_index: InvertedIndex) -> int:
+        """
+        Returns an upper bound on the number of documents that the node matches, as inferred from
+        the document frequencies. Used for ordering the operands of conjunctions.
+        """
+        pass
+
+    @abstractmethod
+    def open(self, inverted_index: InvertedIndex) -> DocumentCursor:
+        """
+        Returns a cursor over the documents that the node matches, in ascending order.
+        """
+        pass
+
+    def evaluate(self, inverted_index: InvertedIndex) -> Iterator[int]:
+        """
+        A generator that yields the identifiers of the documents that the node matches, in ascending order.
+        """
+        cursor = self.open(inverted_index)
+        while cursor.current is not None:
+            yield cursor.current
+            cursor.advance()
+
+    def explain(self, inverted_index: InvertedIndex, depth: int = 0) -> str:
+        """
+        Renders the tree rooted at this node, one node per line, with estimates.
+        """
+        lines = [f"{'  ' * depth}{self.describe()} (estimate: {self.estimate(inverted_index)})"]
+        lines.extend(child.explain(inverted_index, depth + 1) for child in self.children)
+        return "\n".join(lines)
+
+
+class TermNode(QueryNode):
+    """
+    Matches the documents that contain the given term.
+    """
+
+    def __init__(self, term: str):
+        super().__init__([])
+        self.term = term
+
+    def __repr__(self):
+        return self.term
+
+    def describe(self) -> str:
+        return f"TERM {self.term}"
+
+    def estimate(self, inverted_index: InvertedIndex) -> int:
+        return inverted_index.get_document_frequency(self.term)
+
+    def open(self, inverted_index: InvertedIndex) -> DocumentCursor:
+        return _TermCursor(inverted_index, self.term)
+
+
+class PhraseNode(QueryNode):
+    """
+    Matches the documents that contain the given terms as a phrase. The inverted index isn't
+    positional, so we find the documents that contain all the terms and then verify the phrase
+    using the supplied matcher. Without a matcher, the phrase is treated as a conjunction.
+    """
+
+    def __init__(self, terms: List[str], matcher: Optional[Callable[[int, List[str]], bool]] = None):
+        super().__init__([TermNode(term) for term in terms])
+        self.terms = terms
+        self.matcher = matcher
+
+    def __repr__(self):
+        return f'"{" ".join(self.terms)}"'
+
+    def describe(self) -> str:
+        return f'PHRASE "{" ".join(self.terms)}"'
+
+    def estimate(self, inverted_index: InvertedIndex) -> int:
+        return min((child.estimate(inverted_index) for child in self.children), default=0)
+
+    def open(self, inverted_index: InvertedIndex) -> DocumentCursor:
+        children = sorted(self.children, key=lambda child: child.estimate(inverted_index))
+        cursor = _AndCursor([child.open(inverted_index) for child in children])
+        if self.matcher is None:
+            return cursor
+        return _PredicateCursor(cursor, lambda document_id: self.matcher(document_id, self.terms))
+
+
+class AndNode(QueryNode):
+    """
+    Matches the documents that all the children match. The children are evaluated in the given order.
+    """
+
+    def describe(self) -> str:
+        return "AND"
+
+    def estimate(self, inverted_index: InvertedIndex) -> int:
+        return min((child.estimate(inverted_index) for child in self.children), default=0)
+
+    def open(self, inverted_index: InvertedIndex) -> DocumentCursor:
+        return _AndCursor([child.open(inverted_index) for child in self.children])
+
+
+class OrNode(QueryNode):
+    """
+    Matches the documents that at least one of the children match.
+    """
+
+    def describe(self) -> str:
+        return "OR"
+
+    def estimate(self, inverted_index: InvertedIndex) -> int:
+        return sum(child.estimate(inverted_index) for child in self.children)
+
+    def open(self, inverted_index: InvertedIndex) -> DocumentCursor:
+        return _OrCursor([child.open(inverted_index) for child in self.children])
+
+
+class NotNode(QueryNode):
+    """
+    Matches the documents that the child doesn't match. Negations can't be evaluated on their own,
+    and are rewritten into differences by the query planner.
+    """
+
+    def __init__(self, child: QueryNode):
+        super().__init__([child])
+
+    def describe(self) -> str:
+        return "NOT"
+
+    def estimate(self, inverted_index: InvertedIndex) -> int:
+        raise ValueError("Negations must be planned before they can be estimated.")
+
+    def open(self, inverted_index: InvertedIndex) -> DocumentCursor:
+        raise ValueError("Negations must be planned before they can be evaluated.")
+
+
+class AndNotNode(QueryNode):
+    """
+    Matches the documents that the first child matches, except the ones that the second child matches.
+    """
+
+    def __init__(self, include: QueryNode, exclude: QueryNode):
+        super().__init__([include, exclude])
+
+    def describe(self) -> str:
+        return "AND NOT"
+
+    def estimate(self, inverted_index: InvertedIndex) -> int:
+        return self.children[0].estimate(inverted_index)
+
+    def open(self, inverted_index: InvertedIndex) -> DocumentCursor:
+        return _AndNotCursor(self.children[0].open(inverted_index), self.children[1].open(inverted_index))
+
+
+class AllNode(QueryNode):
+    """
+    Matches all documents that haven't been deleted. Needed for negations that have nothing to be
+    subtracted from, as in "NOT water".
+    """
+
+    def __init__(self, document_count: int):
+        super().__init__([])
+        self.document_count = document_count
+
+    def __repr__(self):
+        return "ALL"
+
+    def describe(self) -> str:
+        return "ALL"
+
+    def estimate(self, inverted_index: InvertedIndex) -> int:
+        return self.document_count
+
+    def open(self, inverted_index: InvertedIndex) -> DocumentCursor:
+        return _AllCursor(inverted_index, self.document_count)
+
+
+class BooleanQueryParser:
+    """
+    Parses boolean queries into operator trees, according to the grammar below. The operators must
+    be given in upper case, so that "and", "or" and "not" can still be searched for as terms. Terms
+    and phrases are processed by the inverted index the same way as the indexed documents were.
+
+        disjunction := conjunction ("OR" conjunction)*
+        conjunction := negation ("AND"? negation)*
+        negation    := "NOT" negation | "(" disjunction ")" | '"' words '"' | word
+
+    Adjacent operands are implicitly ANDed together. A word that the index processes into several
+    terms is treated as a phrase. Words and phrases that the index processes into no terms at all,
+    e.g., a lone "-", are left out, as are operators that are left without operands that way. A query
+    that is left without any operands matches nothing.
+    """
+
+    _tokens = re.compile(r'\(|\)|"[^"]*"?|[^\s()"]+')
+
+    def __init__(self, inverted_index: InvertedIndex):
+        self._inverted_index = inverted_index
+
+    def parse(self, query: str) -> QueryNode:
+        """
+        Parses the given query. Raises a ValueError if the query is malformed.
+        """
+        tokens = self._tokens.findall(query)
+        (node, position) = self._parse_disjunction(tokens, 0)
+        if position < len(tokens):
+            raise ValueError(f"Unexpected '{tokens[position]}' in query.")
+        return PhraseNode([]) if node is None else node
+
+    # The methods below return None for operands that have been left out, since they have no terms.
+
+    def _parse_disjunction(self, tokens: List[str], position: int) -> Tuple[Optional[QueryNode], int]:
+        (node, position) = self._parse_conjunction(tokens, position)
+        children = [node]
+        while position < len(tokens) and tokens[position] == "OR":
+            (node, position) = self._parse_conjunction(tokens, position + 1)
+            children.append(node)
+        return self._combine(OrNode, children), position
+
+    def _parse_conjunction(self, tokens: List[str], position: int) -> Tuple[Optional[QueryNode], int]:
+        (node, position) = self._parse_negation(tokens, position)
+        children = [node]
+        while position < len(tokens) and tokens[position] not in ("OR", ")"):
+            if tokens[position] == "AND":
+                position += 1
+            (node, position) = self._parse_negation(tokens, position)
+            children.append(node)
+        return self._combine(AndNode, children), position
+
+    @staticmethod
+    def _combine(operator: Callable[[List[QueryNode]], QueryNode],
+                 children: List[Optional[QueryNode]]) -> Optional[QueryNode]:
+        children = [child for child in children if child is not None]
+        return (children[0] if len(children) == 1 else operator(children)) if children else None
+
+    def _parse_negation(self, tokens: List[str], position: int) -> Tuple[Optional[QueryNode], int]:
+        if position == len(tokens):
+            raise ValueError("Unexpected end of query.")
+        token = tokens[position]
+        if token == "NOT":
+            (node, position) = self._parse_negation(tokens, position + 1)
+            return (None if node is None else NotNode(node)), position
+        elif token == "(":
+            (node, position) = self._parse_disjunction(tokens, position + 1)
+            if position == len(tokens) or tokens[position] != ")":
+                raise ValueError("Missing ')' in query.")
+            return node, position + 1
+        elif token in ("AND", "OR", ")"):
+            raise ValueError(f"Unexpected '{token}' in query.")
+        elif token.startswith('"'):
+            if len(token) < 2 or not token.endswith('"'):
+                raise ValueError("Missing '\"' in query.")
+            terms = list(self._inverted_index.get_terms(token[1:-1]))
+            return (PhraseNode(terms) if terms else None), position + 1
+        else:
+            terms = list(self._inverted_index.get_terms(token))
+            if not terms:
+                return None, position + 1
+            return (TermNode(terms[0]) if len(terms) == 1 else PhraseNode(terms)), position + 1
+
+
+class QueryPlanner:
+    """
+    Rewrites the operator tree of a boolean query into an equivalent tree that can be evaluated
+    efficiently:
+
+      * Nested conjunctions and disjunctions are flattened.
+      * Double negations cancel out.
+      * Negations are pushed down into differences, so that "a AND NOT b AND NOT c" is evaluated as
+        "a AND NOT (b OR c)". The negated operands are then only probed for the documents that the
+        other operands match. Negated negations inside such differences turn into operands of the
+        conjunction, by De Morgan's laws. A negation with nothing to be subtracted from is subtracted
+        from all documents.
+      * The operands of conjunctions are ordered by ascending estimates, i.e., document frequencies,
+        so that the rarest operand drives the traversal.
+
+    Phrases are bound to the supplied phrase matcher, if any.
+    """
+
+    def __init__(self, inverted_index: InvertedIndex, document_count: int,
+                 phrase_matcher: Optional[Callable[[int, List[str]], bool]] = None):
+        self._inverted_index = inverted_index
+        self._document_count = document_count
+        self._phrase_matcher = phrase_matcher
+
+    def plan(self, node: QueryNode) -> QueryNode:
+        """
+        Returns the rewritten tree for the given tree, as produced by the parser.
+        """
+        return self._rewrite(AndNode([node]))
+
+    @staticmethod
+    def _is_complement(node: QueryNode) -> bool:
+        return isinstance(node, AndNotNode) and isinstance(node.children[0], AllNode)
+
+    def _rewrite(self, node: QueryNode) -> QueryNode:
+        if isinstance(node, PhraseNode):
+            if len(node.terms) == 1:
+                return TermNode(node.terms[0])
+            return PhraseNode(node.terms, self._phrase_matcher) if node.terms else OrNode([])
+        elif isinstance(node, NotNode):
+            child = self._rewrite(node.children[0])
+            return child.children[0] if isinstance(child, NotNode) else NotNode(child)
+        elif isinstance(node, OrNode):
+            children = []
+            for child in (self._rewrite(AndNode([c])) for c in node.children):
+                children.extend(child.children if isinstance(child, OrNode) else [child])
+            return children[0] if len(children) == 1 else OrNode(children)
+        elif isinstance(node, AndNode):
+            (includes, excludes) = ([], [])
+            for child in map(self._rewrite, node.children):
+                if isinstance(child, AndNotNode):
+                    includes.append(child.children[0])
+                    excludes.append(child.children[1])
+                elif isinstance(child, NotNode):
+                    excludes.append(child.children[0])
+                else:
+                    includes.append(child)
+            excludes = [c for e in excludes for c in (e.children if isinstance(e, OrNode) else [e])]
+            includes.extend(e.children[1] for e in excludes if self._is_complement(e))
+            excludes = [e for e in excludes if not self._is_complement(e)]
+            includes = [c for i in includes for c in (i.children if isinstance(i, AndNode) else [i])
+                        if not isinstance(c, AllNode)]
+            includes.sort(key=lambda child: child.estimate(self._inverted_index))
+            include = AllNode(self._document_count) if not includes else \
+                includes[0] if len(includes) == 1 else AndNode(includes)
+            if not excludes:
+                return include
+            return AndNotNode(include, excludes[0] if len(excludes) == 1 else OrNode(excludes))
+        else:
+            return node
@@ -1,8 +1,16 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import base64
 import heapq
-from typing import Callable, Iterable, Iterator, Any, Union, Tuple
+import struct
+import sys
+import threading
+import types
+from array import array
+from collections import OrderedDict
+from timeit import default_timer as timer
+from typing import Callable, Iterable, Iterator, Any, Union, Tuple, Optional
 
 Number = Union[int, float]
 
@@ -21,6 +29,91 @@ def apply(f: Callable[[Any], Any], xs: Iterable) -> None:
         f(x)
 
 
+def deep_sizeof(obj: Any) -> int:
+    """
+    Estimates how many bytes the given object occupies in memory, including the objects that it
+    references, recursively. Objects that are referenced multiple times are only counted once.
+    Classes, modules and functions are not counted.
+
+    This is an estimate. The Python runtime shares some objects behind the scenes, e.g., small
+    integers and interned strings, and these are counted as if they weren't shared.
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, (type, types.ModuleType, types.FunctionType)):
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, (str, bytes, bytearray, array, int, float)):
+            continue
+        elif isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        else:
+            if hasattr(current, "__dict__"):
+                stack.append(vars(current))
+            stack.extend(getattr(current, s) for s in getattr(type(current), "__slots__", ()) if hasattr(current, s))
+    return total
+
+
+class BitSet:
+    """
+    A compact, growable set of non-negative integers, stored as one bit per possible member.
+
+    Typically used for keeping track of document identifiers, e.g., as "tombstones" that mark
+    documents as deleted. Adding, removing and checking membership are all O(1) operations.
+    """
+
+    def __init__(self, members: Iterable[int] = ()):
+        self._bits = bytearray()
+        self._count = 0
+        for member in members:
+            self.add(member)
+
+    def __contains__(self, member: int) -> bool:
+        byte = member >> 3
+        return byte < len(self._bits) and bool(self._bits[byte] & (1 << (member & 7)))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[int]:
+        for (byte, bits) in enumerate(self._bits):
+            if bits:
+                for bit in range(8):
+                    if bits & (1 << bit):
+                        yield (byte << 3) | bit
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def add(self, member: int) -> None:
+        """
+        Adds the given integer to the set. The set grows as needed.
+        """
+        assert member >= 0
+        byte = member >> 3
+        if byte >= len(self._bits):
+            self._bits.extend(bytes(max(byte + 1 - len(self._bits), len(self._bits))))
+        mask = 1 << (member & 7)
+        if not self._bits[byte] & mask:
+            self._bits[byte] |= mask
+            self._count += 1
+
+    def discard(self, member: int) -> None:
+        """
+        Removes the given integer from the set, if present.
+        """
+        if member in self:
+            self._bits[member >> 3] &= ~(1 << (member & 7))
+            self._count -= 1
+
+
 class Sieve:
     """
     Implements a "sieve", i.e., a heap-based data structure through which
@@ -32,18 +125,22 @@ class Sieve:
     so that we immediately know if a candidate item makes the cut.
 
     Candidate items can be of any type, as long as that type has an "<" operator
-    defined.
+    defined. If the candidate items are document identifiers, a set of "tombstones"
+    can optionally be supplied so that deleted documents are never admitted.
     """
 
-    def __init__(self, size: int):
+    def __init__(self, size: int, tombstones: Optional[BitSet] = None):
         assert size > 0
         self._size = size
         self._heap = []
+        self._tombstones = tombstones
 
     def sift(self, score: Number, item: Any) -> None:
         """
         Sifts a scored item through the sieve.
         """
+        if self._tombstones and item in self._tombstones:
+            return
         if len(self._heap) < self._size:
             heapq.heappush(self._heap, (score, item))
         else:
@@ -51,6 +148,14 @@ class Sieve:
             if root_score < score:
                 heapq.heapreplace(self._heap, (score, item))
 
+    def threshold(self) -> Optional[Number]:
+        """
+        Returns the score that a candidate item must exceed in order to make it through the sieve,
+        i.e., the score of "the worst of the best". Returns None if the sieve isn't yet full, in
+        which case any candidate item makes it through.
+        """
+        return self._heap[0][0] if len(self._heap) == self._size else None
+
     def winners(self) -> Iterator[Tuple[Number, Any]]:
         """
         Returns the highest-scoring items that have been sifted through the sieve, sorted
@@ -62,3 +167,360 @@ class Sieve:
         # Since the internal heap tracks "the worst of the best" and we want the
         # list sorted as "the best of the best", we reverse the internal heap ordering.
         return reversed([heapq.heappop(self._heap) for _ in range(len(self._heap))])
+
+
+class PageSieve(Sieve):
+    """
+    A sieve for one page of ranked documents, where the items are document identifiers. Documents are
+    ranked by descending score, and documents that have the same score are ranked by ascending document
+    identifiers. This is a total order, so the pages of a ranking never overlap and never leave gaps.
+
+    A page starts after some given position in the ranking, identified by an opaque cursor. Only documents
+    that rank strictly after that position are admitted. The documents must be sifted in ascending order by
+    their identifiers, which makes admission by score alone consistent with the total order.
+    """
+
+    def __init__(self, size: int, after: Optional[str] = None):
+        super().__init__(size)
+        self._after = None if after is None else self.decode(after)
+
+    def sift(self, score: Number, item: Any) -> None:
+        # Among the documents having the lowest score, the one having the largest identifier is the worst.
+        if self._after is not None:
+            (after_score, after_item) = self._after
+            if score > after_score or (score == after_score and item <= after_item):
+                return
+        super().sift(score, -item)
+
+    def winners(self) -> Iterator[Tuple[Number, Any]]:
+        return ((score, -item) for (score, item) in super().winners())
+
+    @staticmethod
+    def encode(score: Number, document_id: int) -> str:
+        """
+        Returns an opaque cursor that identifies the given position in a ranking.
+        """
+        return base64.urlsafe_b64encode(struct.pack("<dq", score, document_id)).decode("ascii")
+
+    @staticmethod
+    def decode(cursor: str) -> Tuple[float, int]:
+        """
+        Returns the position in a ranking that the given cursor identifies. Raises ValueError if the
+        cursor is malformed.
+        """
+        try:
+            return struct.unpack("<dq", base64.urlsafe_b64decode(cursor.encode("ascii")))
+        except (ValueError, struct.error, TypeError, AttributeError) as e:
+            raise ValueError(f"Malformed cursor: {cursor!r}") from e
+
+
+class Budget:
+    """
+    Keeps track of how much work has been spent on some task, e.g., how many postings a query evaluation
+    has visited, against an optional limit on the amount of work and an optional deadline. Once either
+    is exceeded, the budget is exhausted and the task should wrap up.
+
+    Consulting the clock is a lot more expensive than counting, so the deadline is only checked every
+    so often as work is spent. Checking the budget is then cheap enough to be done in inner loops.
+    """
+
+    def __init__(self, work: Optional[int] = None, seconds: Optional[float] = None, interval: int = 256):
+        assert work is None or work >= 0
+        assert interval > 0
+        self._limit = work
+        self._deadline = None if seconds is None else timer() + seconds
+        self._interval = interval
+        self._spent = 0
+        self._checkpoint = 0
+        self.exhausted = False
+        self.spend(0)
+
+    @property
+    def spent(self) -> int:
+        return self._spent
+
+    def spend(self, amount: int = 1) -> bool:
+        """
+        Records that the given amount of work has been spent. Returns True iff the budget is not yet
+        exhausted, i.e., if the task can go on.
+        """
+        self._spent += amount
+        if self._spent >= self._checkpoint and not self.exhausted:
+            if self._limit is not None and self._spent >= self._limit:
+                self.exhausted = True
+            elif self._deadline is not None and timer() >= self._deadline:
+                self.exhausted = True
+            self._checkpoint = self._spent + self._interval
+            if self._limit is not None:
+                self._checkpoint = min(self._checkpoint, self._limit)
+        return not self.exhausted
+
+
+class LRUCache:
+    """
+    A size-bounded mapping that evicts the least recently used entry when it runs full. Both lookups
+    and insertions count as uses. Keeps track of hits, misses and evictions, so that we can tell
+    whether the cache pays off.
+
+    The cache can be shared between threads, since all operations hold a lock.
+    """
+
+    def __init__(self, capacity: int):
+        assert capacity > 0
+        self._capacity = capacity
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # Locks can't be pickled, e.g., when shipping a search engine to another process.
+        state = dict(self.__dict__)
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._entries
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """
+        Looks up the value associated with the given key, marking the entry as recently used.
+        Returns the given default value on a cache miss.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self._misses += 1
+                return default
+            self._hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: Any, value: Any) -> None:
+        """
+        Associates the given value with the given key, evicting the least recently used entry
+        if the cache is full.
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self._capacity:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self) -> None:
+        """
+        Removes all entries. The statistics are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Reports how many entries the cache holds, how many lookups hit and missed, and how many
+        entries have been evicted.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {"entries": len(self._entries),
+                    "capacity": self._capacity,
+                    "hits": self._hits,
+                    "misses": self._misses,
+                    "hit_rate": self._hits / lookups if lookups else 0.0,
+                    "evictions": self._evictions}
+
+
+class TinyLFUCache:
+    """
+    A mapping that holds values of varying sizes within a budget, e.g., a number of bytes. Which
+    entries to keep is decided by how frequently their keys have been asked for recently, so that a
+    burst of one-off lookups doesn't flush out the entries that are asked for all the time.
+
+    The entries are kept in a segmented LRU: New entries go into a probationary segment, and are
+    promoted to a protected segment if they are asked for again. When room must be made, victims are
+    taken from the least recently used end of the probationary segment first. A new entry is only
+    admitted if it has been asked for more frequently than the victims it would displace ("TinyLFU").
+
+    The frequencies are estimated using a count-min sketch of small counters, so that we also keep
+    track of keys that are not in the cache. The counters are halved every now and then, so that
+    the estimates reflect recent history.
+
+    The cache can be shared between threads, since all operations hold a lock.
+    """
+
+    # The protected segment can occupy up to this fraction of the budget.
+    _protected_fraction = 0.8
+
+    # The counters in the sketch saturate at this value.
+    _counter_limit = 15
+
+    # Each row of the sketch hashes keys using multiply-shift hashing with its own odd multiplier, so that
+    # keys that collide in one row are unlikely to collide in another.
+    _multipliers = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93,
+                    0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53, 0x94D049BB133111EB, 0xBF58476D1CE4E5B9)
+
+    def __init__(self, budget: int, width: int = 1024, depth: int = 4):
+        assert budget > 0
+        assert width > 0 and width & (width - 1) == 0, "Width must be a power of two."
+        assert 0 < depth <= len(self._multipliers)
+        self._budget = budget
+        self._width = width
+        self._shift = 64 - width.bit_length() + 1
+        self._depth = depth
+        self._counters = array("B", bytes(width * depth))
+        self._increments = 0
+        self._probation = OrderedDict()
+        self._protected = OrderedDict()
+        self._sizes = {}
+        self._probation_size = 0
+        self._protected_size = 0
+        self._hits = 0
+        self._misses = 0
+        self._rejections = 0
+        self._evictions = 0
+        self._lock = threading.RLock()
+
+    def __getstate__(self) -> dict:
+        # Locks can't be pickled, e.g., when shipping an index to another process.
+        state = dict(self.__dict__)
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._sizes)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._sizes
+
+    def _slots(self, key: Any) -> Iterator[int]:
+        h = hash(key) & 0xFFFFFFFFFFFFFFFF
+        return (row * self._width + (((h * self._multipliers[row]) & 0xFFFFFFFFFFFFFFFF) >> self._shift)
+                for row in range(self._depth))
+
+    def _record(self, key: Any) -> None:
+        for slot in self._slots(key):
+            if self._counters[slot] < self._counter_limit:
+                self._counters[slot] += 1
+        self._increments += 1
+        if self._increments >= 10 * self._width:
+            self._counters = array("B", (counter >> 1 for counter in self._counters))
+            self._increments = 0
+
+    def frequency(self, key: Any) -> int:
+        """
+        Estimates how many times the given key has recently been asked for. Never underestimates,
+        except for the effect of aging.
+        """
+        with self._lock:
+            return min(self._counters[slot] for slot in self._slots(key))
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """
+        Looks up the value associated with the given key. Returns the given default value on a
+        cache miss. Either way, the lookup counts towards the key's frequency.
+        """
+        with self._lock:
+            self._record(key)
+            if key in self._protected:
+                self._hits += 1
+                self._protected.move_to_end(key)
+                return self._protected[key]
+            if key in self._probation:
+                self._hits += 1
+                value = self._probation.pop(key)
+                self._probation_size -= self._sizes[key]
+                self._protected[key] = value
+                self._protected_size += self._sizes[key]
+                while self._protected_size > self._protected_fraction * self._budget and len(self._protected) > 1:
+                    (demoted, demoted_value) = self._protected.popitem(last=False)
+                    self._protected_size -= self._sizes[demoted]
+                    self._probation[demoted] = demoted_value
+                    self._probation_size += self._sizes[demoted]
+                return value
+            self._misses += 1
+            return default
+
+    def put(self, key: Any, value: Any, size: int) -> bool:
+        """
+        Offers a value of the given size to the cache. Returns True if the value was admitted, and
+        False if the cache rather keeps the entries it already has. If the key is already cached, the
+        new value replaces the old one only if admitted, and the old value is kept otherwise.
+        """
+        with self._lock:
+            if size > self._budget:
+                self._rejections += 1
+                return False
+            victims = []
+            available = self._budget - self._probation_size - self._protected_size + self._sizes.get(key, 0)
+            for segment in (self._probation, self._protected):
+                for victim in segment:
+                    if available >= size:
+                        break
+                    if victim != key:
+                        victims.append(victim)
+                        available += self._sizes[victim]
+            frequency = self.frequency(key)
+            if any(self.frequency(victim) >= frequency for victim in victims):
+                self._rejections += 1
+                return False
+            self.discard(key)
+            for victim in victims:
+                self.discard(victim)
+                self._evictions += 1
+            self._probation[key] = value
+            self._sizes[key] = size
+            self._probation_size += size
+            return True
+
+    def discard(self, key: Any) -> None:
+        """
+        Removes the entry having the given key, if present.
+        """
+        with self._lock:
+            if key not in self._sizes:
+                return
+            size = self._sizes.pop(key)
+            if key in self._probation:
+                del self._probation[key]
+                self._probation_size -= size
+            else:
+                del self._protected[key]
+                self._protected_size -= size
+
+    def clear(self) -> None:
+        """
+        Removes all entries. The frequency estimates and the statistics are kept.
+        """
+        with self._lock:
+            self._probation.clear()
+            self._protected.clear()
+            self._sizes.clear()
+            self._probation_size = 0
+            self._protected_size = 0
+
+    def stats(self) -> dict:
+        """
+        Reports how many entries the cache holds and how much of the budget they occupy, how many
+        lookups hit and missed, and how many entries have been rejected and evicted.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {"entries": len(self._sizes),
+                    "size": self._probation_size + self._protected_size,
+                    "budget": self._budget,
+                    "hits": self._hits,
+                    "misses": self._misses,
+                    "hit_rate": self._hits / lookups if lookups else 0.0,
+                    "rejections": self._rejections,
+                    "evictions": self._evictions}
@@ -0,0 +1,89 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from array import array
+from bitmap import RoaringBitmap
+from typing import Iterable, List, Sequence, Union
+
+
+def as_ndarray(document_ids: Union[RoaringBitmap, Iterable[int]]) -> np.ndarray:
+    """
+    Views a sorted sequence of document identifiers as a NumPy array. Arrays of machine-sized
+    integers, such as the ones that back the posting lists, are viewed without being copied.
+    Compressed bitmaps are unpacked container by container.
+    """
+    if isinstance(document_ids, np.ndarray):
+        return document_ids
+    if isinstance(document_ids, RoaringBitmap):
+        chunks = [(key << 16) + (np.flatnonzero(np.unpackbits(np.frombuffer(container, dtype=np.uint8),
+                                                              bitorder="little"))
+                                 if isinstance(container, bytes) else np.frombuffer(container, dtype=np.uint16))
+                  for (key, container) in document_ids.get_containers()]
+        return np.concatenate([chunk.astype("l") for chunk in chunks] + [np.empty(0, dtype="l")])
+    if isinstance(document_ids, array) and document_ids.typecode == "l":
+        return np.frombuffer(document_ids, dtype="l") if document_ids else np.empty(0, dtype="l")
+    return np.fromiter(document_ids, dtype="l")
+
+
+def as_array(document_ids: np.ndarray) -> array:
+    """
+    Copies a NumPy array of document identifiers into an array of machine-sized integers.
+    """
+    result = array("l")
+    result.frombytes(document_ids.astype("l", copy=False).tobytes())
+    return result
+
+
+def intersection(arrays: List[np.ndarray]) -> np.ndarray:
+    """
+    Returns the AND of the given sorted arrays of unique document identifiers. The arrays are
+    intersected from the shortest to the longest. If an array is much longer than the candidates
+    that remain, we look the candidates up using binary search rather than merging.
+    """
+    if not arrays:
+        return np.empty(0, dtype="l")
+    arrays = sorted(arrays, key=len)
+    result = arrays[0]
+    for other in arrays[1:]:
+        if len(result) == 0:
+            break
+        if len(other) > 16 * len(result):
+            positions = np.minimum(np.searchsorted(other, result), len(other) - 1)
+            result = result[other[positions] == result]
+        else:
+            result = np.intersect1d(result, other, assume_unique=True)
+    return result
+
+
+def union(arrays: List[np.ndarray]) -> np.ndarray:
+    """
+    Returns the OR of the given sorted arrays of unique document identifiers. The concatenated arrays
+    consist of sorted runs, which a stable sort handles well, and the duplicates are then adjacent.
+    """
+    if not arrays:
+        return np.empty(0, dtype="l")
+    merged = np.sort(np.concatenate(arrays), kind="stable")
+    return merged[np.concatenate(([True], merged[1:] != merged[:-1]))] if len(merged) else merged
+
+
+def difference(array1: np.ndarray, array2: np.ndarray) -> np.ndarray:
+    """
+    Returns the AND NOT of the two given sorted arrays of unique document identifiers, i.e., the
+    identifiers in the first array that aren't in the second.
+    """
+    if len(array1) == 0 or len(array2) == 0:
+        return array1
+    positions = np.minimum(np.searchsorted(array2, array1), len(array2) - 1)
+    return array1[array2[positions] != array1]
+
+
+def at_least(arrays: Sequence[np.ndarray], minimum: int) -> np.ndarray:
+    """
+    Returns the sorted document identifiers that occur in at least the given number of the given
+    arrays, i.e., does N-of-M matching. Each array must have unique document identifiers.
+    """
+    if not arrays or minimum > len(arrays):
+        return np.empty(0, dtype="l")
+    counts = np.bincount(np.concatenate(arrays))
+    return np.flatnonzero(counts >= max(1, minimum))